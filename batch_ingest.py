@@ -0,0 +1,98 @@
+# batch_ingest.py
+import glob
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from fetch_conversations import fetch_conversations, log_header_counts, thread_title
+
+HTML_EXTENSIONS = ('.html', '.htm')
+
+def expand_thread_paths(sources):
+    """
+    Expands a list of files, directories and glob patterns into a sorted list of thread HTML files.
+
+    Args:
+        sources (list): Paths to HTML files, directories containing saved threads, or glob patterns.
+
+    Returns:
+        list: Unique HTML file paths, sorted for a stable processing order.
+    """
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            candidates = [os.path.join(source, name) for name in os.listdir(source)]
+        else:
+            candidates = glob.glob(source)
+            if not candidates:
+                logging.warning(f"No files matched thread source: {source}")
+        for candidate in candidates:
+            if os.path.isfile(candidate) and candidate.lower().endswith(HTML_EXTENSIONS):
+                paths.add(os.path.normpath(candidate))
+    return sorted(paths)
+
+def thread_name(path):
+    """Returns a short thread identifier (file name without extension) used to tag posts."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+def parse_threads(paths, max_workers=None):
+    """
+    Parses several saved thread files in parallel using a process pool.
+
+    Args:
+        paths (list): Thread HTML file paths.
+        max_workers (int): Size of the process pool. Defaults to the number of CPUs.
+
+    Returns:
+        dict: Maps each path (in input order) to its list of parsed posts. Files that fail
+              to parse map to an empty list.
+    """
+    if not paths:
+        return {}
+    header_counts = Counter()
+    if len(paths) == 1 or max_workers == 1:
+        # No point paying for worker start-up
+        results = {path: fetch_conversations(path, header_counts=header_counts) for path in paths}
+    else:
+        workers = min(max_workers or os.cpu_count() or 1, len(paths))
+        logging.info(f"Parsing {len(paths)} thread files with {workers} worker processes...")
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, (posts, counts) in zip(paths, executor.map(_parse_thread, paths)):
+                logging.info(f"Parsed {len(posts)} posts from {path}")
+                results[path] = posts
+                header_counts.update(counts)
+    if len(paths) > 1:
+        log_header_counts(header_counts, f"{len(paths)} threads")
+    return results
+
+def _parse_thread(path):
+    """Worker: parses one thread and returns (posts, header path counts), since counts do not leave the process otherwise."""
+    header_counts = Counter()
+    return fetch_conversations(path, header_counts=header_counts), header_counts
+
+def group_thread_posts(parsed_threads, merge_threads=False):
+    """
+    Tags every post with the thread it came from (file name and page title) and groups them for clustering.
+
+    Args:
+        parsed_threads (dict): Output of parse_threads.
+        merge_threads (bool): If True, all threads become a single post list clustered together.
+                              If False, each thread's posts stay a separate list.
+
+    Returns:
+        list: A list of post lists, one per clustering run.
+    """
+    groups = []
+    for path, posts in parsed_threads.items():
+        name = thread_name(path)
+        title = thread_title(path) if posts else None
+        for post in posts:
+            post['thread'] = name
+            post['thread_title'] = title
+        if posts:
+            groups.append(posts)
+
+    if merge_threads and groups:
+        return [[post for posts in groups for post in posts]]
+    return groups
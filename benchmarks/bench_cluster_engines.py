@@ -0,0 +1,78 @@
+# benchmarks/bench_cluster_engines.py
+# Compares the clustering engines of topic_cluster.fit_topic_model on one embedding matrix:
+# runtime, topic count, outlier rate, and agreement (adjusted Rand index) with the BERTopic
+# default. A second seeded BERTopic run shows how much BERTopic agrees with itself.
+#
+#   python benchmarks/bench_cluster_engines.py                      # synthetic 3,000-post thread, stub embedder
+#   python benchmarks/bench_cluster_engines.py data/thread.html --model pkshatech/GLuCoSE-base-ja-v2
+import argparse
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+import config
+import topic_cluster
+from fetch_conversations import fetch_conversations
+from run_benchmarks import STUB_MODEL_NAME, StubEmbedder, ensure_thread
+
+# (label, engine, fast reduction, fast clusterer, seed offset)
+CONFIGURATIONS = [
+    ('bertopic', 'bertopic', None, None, 0),
+    ('bertopic (other seed)', 'bertopic', None, None, 1),
+    ('fast pca+hdbscan', 'fast', 'pca', 'hdbscan', 0),
+    ('fast svd+hdbscan', 'fast', 'svd', 'hdbscan', 0),
+    ('fast pca+kmeans', 'fast', 'pca', 'kmeans', 0),
+    ('fast pca+kmeans (other seed)', 'fast', 'pca', 'kmeans', 1),
+]
+
+def run_engines(texts, embeddings, model_name, min_topic_size, seed):
+    rows = []
+    reference = None
+    for label, engine, reduction, clusterer, seed_offset in CONFIGURATIONS:
+        config.FAST_REDUCTION = reduction or config.FAST_REDUCTION
+        config.FAST_CLUSTERER = clusterer or config.FAST_CLUSTERER
+        started = time.perf_counter()
+        _, topics = topic_cluster.fit_topic_model(texts, embeddings, model_name, min_topic_size,
+                                                  seed=seed + seed_offset, engine=engine)
+        seconds = time.perf_counter() - started
+        topics = np.asarray(topics)
+        if reference is None:
+            reference = topics
+        rows.append({
+            'engine': label,
+            'seconds': seconds,
+            'topics': len(set(topics.tolist()) - {-1}),
+            'outlier_rate': float(np.mean(topics == -1)),
+            'ari_vs_bertopic': adjusted_rand_score(reference, topics),
+        })
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare runtime and agreement of the clustering engines.")
+    parser.add_argument('thread', nargs='?', help="Saved thread HTML (default: a synthetic thread)")
+    parser.add_argument('--posts', type=int, default=3000, help="Size of the synthetic thread")
+    parser.add_argument('--model', default=STUB_MODEL_NAME, help="Embedding model (default: the stub embedder)")
+    parser.add_argument('--min-topic-size', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=config.CLUSTER_SEED)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.model == STUB_MODEL_NAME:
+        topic_cluster._loaded_models[(STUB_MODEL_NAME, 'torch')] = StubEmbedder()
+    posts_data = fetch_conversations(args.thread or ensure_thread(args.posts, 't_h', 'utf-8'))
+    _, texts = topic_cluster.filter_posts_for_clustering(posts_data, 8)
+    embeddings = topic_cluster.embed_texts(texts, model_name=args.model, use_cache=args.model != STUB_MODEL_NAME,
+                                           backend='torch')
+    print(f"{len(texts)} posts, {embeddings.shape[1]}-dimensional embeddings ({args.model})\n")
+
+    rows = run_engines(texts, embeddings, args.model, args.min_topic_size, args.seed)
+    print(f"{'engine':<32} {'seconds':>8} {'topics':>7} {'outliers':>9} {'ARI vs bertopic':>16}")
+    for row in rows:
+        print(f"{row['engine']:<32} {row['seconds']:8.2f} {row['topics']:7d} {row['outlier_rate']:9.1%} "
+              f"{row['ari_vs_bertopic']:16.3f}")
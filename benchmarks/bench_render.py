@@ -0,0 +1,116 @@
+# benchmarks/bench_render.py
+# Compares format_output.generate_blog_html against the previous per-post BeautifulSoup
+# implementation and checks that both produce byte-identical HTML.
+#
+#   python benchmarks/bench_render.py                  # synthetic 1,000-post cluster
+#   python benchmarks/bench_render.py data/thread.html # every post of a saved thread as one cluster
+import argparse
+import html
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from format_output import generate_blog_html
+
+def legacy_generate_blog_html(selected_posts, topic_keyword):
+    """generate_blog_html before the single-pass rewriter: one BeautifulSoup parse per post."""
+    if not selected_posts:
+        return "<p>No posts selected for this topic.</p>"
+    html_parts = []
+    for i, post in enumerate(selected_posts):
+        post_number = post.get('number', 'N/A')
+        user_info_raw = post.get('user_info', '名無しさん')
+        timestamp = post.get('timestamp', '')
+        post_id = post.get('id', '')
+        original_content_html = post.get('content_html', '')
+        if user_info_raw == "名無しさんの野望":
+            user_info_display = "名無しサモナー"
+        else:
+            user_info_display = user_info_raw
+        if original_content_html:
+            soup = BeautifulSoup(original_content_html, 'html.parser')
+            for link in soup.find_all('a'):
+                link_text = link.get_text(strip=True)
+                if re.match(r'^>>\d+$', link_text):
+                    if link.has_attr('style'):
+                        existing_style = link['style'].rstrip(';')
+                        if 'color:' not in existing_style:
+                            link['style'] = f'{existing_style}; color: blue;'
+                    else:
+                        link['style'] = 'color: blue;'
+            processed_content_html = str(soup)
+        else:
+            processed_content_html = '<p><i>Content not available.</i></p>'
+        if i == 1:
+            html_parts.append("<!-- Body -->")
+            html_parts.append("<!--more-->")
+        html_parts.append('<div class="t_h">')
+        header_content = f'{post_number}: '
+        header_content += f'<span style="color: green;">{html.escape(user_info_display)}</span> '
+        header_content += f'<span style="color: gray;"> {html.escape(timestamp)}</span>'
+        if post_id:
+            header_content += f'<span style="color: gray;"> ID:{html.escape(post_id)}</span>'
+        html_parts.append(header_content)
+        html_parts.append('</div>')
+        body_style = "font-weight:bold;margin-bottom:90px;"
+        html_parts.append(f'<div class="t_b" style="{body_style}">')
+        html_parts.append(f'  {processed_content_html}')
+        html_parts.append('</div><br />')
+    return "\n".join(html_parts)
+
+def synthetic_posts(count, seed=0):
+    """Posts shaped like fetch_conversations output: BeautifulSoup-serialized content with >>N links."""
+    rng = random.Random(seed)
+    words = ['アンベッサ', '強すぎ', 'ナーフ', 'はよ', 'ジャングル', 'w', '草', 'ミッド', 'ADC', 'サポート']
+    posts = []
+    for number in range(1, count + 1):
+        lines = []
+        for _ in range(rng.randint(1, 4)):
+            line = ''.join(rng.choice(words) for _ in range(rng.randint(2, 12)))
+            if number > 1 and rng.random() < 0.4:
+                target = rng.randint(max(1, number - 50), number - 1)
+                line = f'<a class="reply_link" href="../test/read.cgi/lol/1/{target}">&gt;&gt;{target}</a><br/>{line}'
+            lines.append(line)
+        posts.append({
+            'number': number,
+            'user_info': rng.choice(['名無しさんの野望', '名無しさん', 'コテハン']),
+            'timestamp': f'2024/05/01(水) 12:{number % 60:02d}:{number % 57:02d}.{number % 99:02d}',
+            'id': f'id{number % 37:04d}',
+            'content_html': '<br/>'.join(lines),
+        })
+    return posts
+
+def best_of(function, posts, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = function(posts, 'benchmark')
+        timings.append(time.perf_counter() - started)
+    return min(timings), output
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark cluster HTML rendering against the BeautifulSoup implementation.")
+    parser.add_argument('html_file', nargs='?', help="Saved thread to render as one cluster (default: synthetic posts)")
+    parser.add_argument('--posts', type=int, default=1000, help="Synthetic cluster size")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.html_file:
+        from fetch_conversations import fetch_conversations
+        cluster = fetch_conversations(args.html_file)
+    else:
+        cluster = synthetic_posts(args.posts)
+
+    legacy_seconds, legacy_output = best_of(legacy_generate_blog_html, cluster, args.repeat)
+    new_seconds, new_output = best_of(generate_blog_html, cluster, args.repeat)
+    identical = legacy_output.encode('utf-8') == new_output.encode('utf-8')
+    print(f"posts: {len(cluster)}")
+    print(f"BeautifulSoup per post: {legacy_seconds * 1000:8.1f} ms")
+    print(f"single-pass rewriter:   {new_seconds * 1000:8.1f} ms  ({legacy_seconds / new_seconds:.1f}x faster)")
+    print(f"byte-identical output:  {identical}")
+    sys.exit(0 if identical else 1)
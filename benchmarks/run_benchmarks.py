@@ -0,0 +1,190 @@
+# benchmarks/run_benchmarks.py
+# Benchmark suite on synthetic threads: parsing, rendering, publishing (against the local mock
+# AtomPub server) and clustering (with a small stub embedding model, no download needed).
+# Results are saved per commit under benchmarks/results/ so runs can be compared.
+#
+#   python benchmarks/run_benchmarks.py                        # all suites at 1k and 10k posts
+#   python benchmarks/run_benchmarks.py --suites parse --sizes 1000 10000 100000
+#   python benchmarks/run_benchmarks.py --compare <commit>     # also print the change vs. that commit
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import config
+from synthetic_thread import ENCODINGS, LAYOUTS, SIZES, thread_path, write_thread
+
+SUITES = ('parse', 'render', 'publish', 'cluster')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+THREADS_DIR = os.path.join('data', 'bench_threads')
+STUB_MODEL_NAME = 'bench-stub-embedder'
+
+class StubEmbedder:
+    """
+    Small deterministic stand-in for the sentence-transformer: hashed character 1-3 gram counts,
+    L2-normalized. Exercises the whole clustering path without loading a transformer.
+    """
+
+    def __init__(self, dimensions=256):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.vectorizer = HashingVectorizer(analyzer='char', ngram_range=(1, 3), n_features=dimensions,
+                                            alternate_sign=False, norm='l2')
+
+    def encode(self, texts, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        return self.vectorizer.transform(list(texts)).toarray().astype('float32')
+
+def git_revision():
+    """Returns (short commit hash, dirty flag) of the working tree, or ('unknown', False)."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=BENCH_DIR).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                    text=True, cwd=BENCH_DIR).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+def ensure_thread(posts, layout, encoding):
+    path = thread_path(THREADS_DIR, posts, layout, encoding)
+    if not os.path.exists(path):
+        write_thread(path, posts, layout, encoding)
+    return path
+
+def best_of(function, repeat):
+    """Runs function repeat times; returns (best wall seconds, last result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_parse(sizes, repeat):
+    from fetch_conversations import fetch_conversations
+    results = []
+    for posts in sizes:
+        for layout in LAYOUTS:
+            for encoding in ENCODINGS:
+                path = ensure_thread(posts, layout, encoding)
+                seconds, parsed = best_of(lambda: fetch_conversations(path, use_cache=False), repeat)
+                results.append({'name': f"parse/{layout}/{encoding}/{posts}", 'seconds': seconds,
+                                'items': len(parsed), 'items_per_second': len(parsed) / seconds,
+                                'bytes': os.path.getsize(path)})
+    return results
+
+def _parsed_posts(posts):
+    from fetch_conversations import fetch_conversations
+    return fetch_conversations(ensure_thread(posts, 't_h', 'utf-8'))
+
+def _clusters_of(posts_data, size=50):
+    return [posts_data[i:i + size] for i in range(0, len(posts_data), size)]
+
+def bench_render(sizes, repeat):
+    from format_output import generate_blog_html
+    results = []
+    for posts in sizes:
+        clusters = _clusters_of(_parsed_posts(posts))
+        seconds, pages = best_of(lambda: [generate_blog_html(cluster, 'bench') for cluster in clusters], repeat)
+        results.append({'name': f"render/{posts}", 'seconds': seconds, 'items': len(clusters),
+                        'items_per_second': len(clusters) / seconds,
+                        'bytes': sum(len(page.encode('utf-8')) for page in pages)})
+    return results
+
+def bench_publish(drafts_count, latency, concurrency):
+    from mock_atompub import start_server
+    from publish_blog import publish_many
+    server = start_server(latency=latency)
+    try:
+        drafts = [{'title': f"bench {i}", 'html': f"<p>{'本文' * 500}</p>"} for i in range(drafts_count)]
+        results = []
+        for workers in sorted({1, concurrency}):
+            seconds, outcome = best_of(lambda: publish_many(f"{server.base_url}/atom/article", 'bench', 'bench', drafts,
+                                                            max_concurrency=workers, requests_per_second=0), 1)
+            published = sum(1 for result in outcome if result['status'] == 'published')
+            results.append({'name': f"publish/latency{int(latency * 1000)}ms/concurrency{workers}", 'seconds': seconds,
+                            'items': published, 'items_per_second': published / seconds})
+        return results
+    finally:
+        server.shutdown()
+
+def bench_cluster(sizes, repeat):
+    import topic_cluster
+    topic_cluster._loaded_models[(STUB_MODEL_NAME, 'torch')] = StubEmbedder()
+    results = []
+    for posts in sizes:
+        posts_data = _parsed_posts(posts)
+        seconds, clusters = best_of(lambda: topic_cluster.cluster_posts_by_topic(
+            posts_data, model_name=STUB_MODEL_NAME, use_embedding_cache=False, embedding_backend='torch'), repeat)
+        results.append({'name': f"cluster/stub/{posts}", 'seconds': seconds, 'items': len(posts_data),
+                        'items_per_second': len(posts_data) / seconds, 'clusters': len(clusters)})
+    return results
+
+def compare(current, baseline_path):
+    """Prints the change in seconds for every benchmark present in both result files."""
+    if not os.path.exists(baseline_path):
+        print(f"\nNo stored results at {baseline_path}; run the suite on that commit first.")
+        return
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {row['name']: row for row in json.load(f)['results']}
+    print(f"\nChange vs. {os.path.basename(baseline_path)} (negative = faster):")
+    for row in current:
+        before = baseline.get(row['name'])
+        if before:
+            change = (row['seconds'] - before['seconds']) / before['seconds']
+            print(f"  {row['name']:<45} {before['seconds']:9.4f}s -> {row['seconds']:9.4f}s  {change:+7.1%}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the synthetic-thread benchmark suite.")
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[size for size in SIZES if size <= 10000],
+                        help=f"Thread sizes in posts (standard sizes: {SIZES})")
+    parser.add_argument('--cluster-sizes', nargs='+', type=int, default=[1000],
+                        help="Thread sizes for the clustering suite")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--publish-drafts', type=int, default=40)
+    parser.add_argument('--publish-latency', type=float, default=0.1, help="Mock server latency in seconds")
+    parser.add_argument('--publish-concurrency', type=int, default=config.PUBLISH_MAX_CONCURRENCY)
+    parser.add_argument('--compare', metavar='COMMIT', help="Compare with the stored results of this commit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = []
+    if 'parse' in args.suites:
+        results += bench_parse(args.sizes, args.repeat)
+    if 'render' in args.suites:
+        results += bench_render(args.sizes, args.repeat)
+    if 'publish' in args.suites:
+        results += bench_publish(args.publish_drafts, args.publish_latency, args.publish_concurrency)
+    if 'cluster' in args.suites:
+        results += bench_cluster(args.cluster_sizes, 1)
+
+    for row in results:
+        print(f"{row['name']:<45} {row['seconds']:9.4f}s  {row['items_per_second']:12.1f} items/s")
+
+    if args.compare:
+        # Before saving, so comparing against the current commit's previous results works
+        compare(results, os.path.join(RESULTS_DIR, f"{args.compare}.json"))
+
+    commit, dirty = git_revision()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': commit,
+            'dirty': dirty,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to {result_path}")
@@ -0,0 +1,116 @@
+# benchmarks/synthetic_thread.py
+# Writes synthetic saved-thread HTML for benchmarks, in either layout fetch_conversations reads
+# (div.post or div.t_h/div.t_b) and either encoding (cp932 or utf-8).
+#
+#   python benchmarks/synthetic_thread.py --posts 10000 --layout t_h --encoding cp932 -o data/bench.html
+import argparse
+import datetime
+import html
+import os
+import random
+
+LAYOUTS = ('post', 't_h')
+ENCODINGS = ('cp932', 'utf-8')
+SIZES = (1000, 10000, 100000)
+
+_WEEKDAYS = '月火水木金土日'
+_ID_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+_TOPICS = [
+    ['アンベッサ', '強すぎ', 'ナーフ', 'はよ', 'Eのダッシュ', 'が長すぎる'],
+    ['パッチ', '14.5', 'アイテム', '変更', 'ミシック', '復活してくれ'],
+    ['ジャングル', 'ルート', 'スカトル', '取れない', '3キャンプ', 'ガンク'],
+    ['ADC', 'つらい', 'サポート', '来ない', 'ボット', '2v2'],
+    ['ランク', '勝率', '上がらない', 'ゴールド', '沼', 'デュオ'],
+    ['ワールド', 'T1', 'フェイカー', '決勝', '見た', 'やばい'],
+]
+_FILLERS = ['わかる', 'それな', 'ほんとこれ', 'いやいや', '草', 'ｗｗｗ', 'マジか', 'なんで？', '。', '！', '…']
+_NAMES = ['名無しさんの野望', '名無しさんの野望', '名無しさんの野望', 'ゲーム好き名無しさん']
+
+def _post_text(rng):
+    topic = rng.choice(_TOPICS)
+    words = [rng.choice(topic) for _ in range(rng.randint(2, 10))]
+    words += [rng.choice(_FILLERS) for _ in range(rng.randint(0, 3))]
+    rng.shuffle(words)
+    return ''.join(words)
+
+def generate_posts(count, seed=0):
+    """
+    Yields raw post fields: number, name, timestamp string, ID, reply targets and plain-text lines.
+    Replies mostly point at recent posts, sometimes at several, sometimes at >>1.
+    """
+    rng = random.Random(seed)
+    ids = [''.join(rng.choice(_ID_CHARS) for _ in range(8)) for _ in range(max(count // 8, 1))]
+    moment = datetime.datetime(2025, 3, 15, 12, 0, 0)
+    for number in range(1, count + 1):
+        moment += datetime.timedelta(seconds=rng.expovariate(1 / 20.0))
+        timestamp = (f"{moment:%Y/%m/%d}({_WEEKDAYS[moment.weekday()]}) "
+                     f"{moment:%H:%M:%S}.{moment.microsecond // 10000:02d}")
+        name = rng.choice(_NAMES)
+        if rng.random() < 0.3:
+            name += f" (ﾜｯﾁｮｲ {rng.randrange(16 ** 4):04x}-{rng.randrange(16 ** 4):04x})"
+        targets = []
+        if number > 1 and rng.random() < 0.45:
+            for _ in range(1 if rng.random() < 0.85 else rng.randint(2, 3)):
+                if rng.random() < 0.05:
+                    targets.append(1)
+                else:
+                    targets.append(max(1, number - int(rng.expovariate(1 / 8.0)) - 1))
+        lines = [_post_text(rng) for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.03:
+            lines = ['＿人人人人人人＿', '＞　突然の死　＜', '￣Y^Y^Y^Y^Y^Y￣'] # AA / copypasta
+        yield {
+            'number': number,
+            'name': name,
+            'timestamp': timestamp,
+            'id': rng.choice(ids),
+            'replies_to': sorted(set(targets)),
+            'lines': lines,
+        }
+
+def _content_html(post):
+    anchors = ''.join(f'<a href="../test/read.cgi/gamerpg/1700000000/{target}" rel="noopener noreferrer" '
+                      f'target="_blank">&gt;&gt;{target}</a><br>' for target in post['replies_to'])
+    return anchors + '<br>'.join(html.escape(line) for line in post['lines'])
+
+def _post_div(post):
+    return (f'<div class="post" id="{post["number"]}" data-date="NG" data-userid="ID:{post["id"]}" data-id="{post["number"]}">'
+            f'<div class="meta"><span class="number">{post["number"]}</span></div>'
+            f'<div class="post-header"><span class="postid">{post["number"]}</span>'
+            f'<span class="postusername"><b>{html.escape(post["name"])}</b></span>'
+            f'<span class="date">{post["timestamp"]}</span><span class="uid">ID:{post["id"]}</span></div>'
+            f'<div class="post-content">{_content_html(post)}</div></div>\n')
+
+def _t_h_pair(post):
+    return (f'<div class="t_h">{post["number"]} ：<span style="color: green;"><b>{html.escape(post["name"])}</b></span>'
+            f' ：{post["timestamp"]} ID:{post["id"]}</div>\n'
+            f'<div class="t_b">{_content_html(post)}</div>\n<br>\n')
+
+def write_thread(path, posts=1000, layout='t_h', encoding='utf-8', seed=0):
+    """Writes a synthetic thread page with the given number of posts and returns path."""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}; expected one of {LAYOUTS}")
+    charset = 'Shift_JIS' if encoding == 'cp932' else 'UTF-8'
+    render = _post_div if layout == 'post' else _t_h_pair
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding=encoding, errors='replace', newline='\n') as f:
+        f.write(f'<!DOCTYPE html>\n<html><head><meta charset="{charset}"><title>【LoL】League of Legends 総合 Part1</title></head>\n'
+                f'<body><h1>【LoL】League of Legends 総合 Part1</h1>\n<div id="threadcontent">\n')
+        for post in generate_posts(posts, seed):
+            f.write(render(post))
+        f.write('</div>\n</body></html>\n')
+    return path
+
+def thread_path(directory, posts, layout, encoding):
+    """Canonical file name for a generated thread, so benchmark runs can reuse them."""
+    return os.path.join(directory, f"thread-{layout}-{encoding}-{posts}.html")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic 2ch thread page for benchmarks.")
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--layout', choices=LAYOUTS, default='t_h')
+    parser.add_argument('--encoding', choices=ENCODINGS, default='utf-8')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', required=True)
+    args = parser.parse_args()
+    write_thread(args.output, args.posts, args.layout, args.encoding, args.seed)
+    print(f"Wrote {args.posts} posts ({args.layout}, {args.encoding}) to {args.output}")
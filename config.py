@@ -14,21 +14,127 @@ LOCAL_HTML_FILE = os.path.join('data', 'thread.html')
 TOPIC_KEYWORD = "アンベッサ"
 # START_POST_NUM = None # Alternative: specify a post number to start from
 
+# Batch mode (python main.py <dir|glob> ...)
+BATCH_MAX_WORKERS = None # Parser processes; None uses all CPUs
+BATCH_MERGE_THREADS = False # True clusters all threads together, False clusters each thread separately
+
+# Parsed-post cache (fetch_conversations), keyed by file content hash + parser version
+POST_CACHE_DIR = os.path.join('data', 'post_cache')
+POST_CACHE_MAX_BYTES = 512 * 1024 * 1024 # Oldest entries are evicted beyond this total size
+POST_CACHE_MAX_AGE_DAYS = 30 # Entries not used for this long are evicted
+
+# Embedding store (topic_cluster), one memory-mapped matrix per embedding model
+EMBEDDING_CACHE_DIR = os.path.join('data', 'embeddings')
+
+# Sentence-transformers model used for every embedding (clustering, topic centroids, warm-up)
+EMBEDDING_MODEL = 'pkshatech/GLuCoSE-base-ja-v2'
+
+# Embedding backend: 'torch' (sentence-transformers) or 'onnx' (int8-quantized ONNX Runtime, CPU only)
+EMBEDDING_BACKEND = 'torch'
+ONNX_EXPORT_DIR = os.path.join('data', 'onnx')
+ONNX_INTRA_OP_THREADS = None # None lets ONNX Runtime use all physical cores
+
+# Embedding batches: texts are sorted by token length and cut into batches of at most this many padded tokens
+EMBED_MAX_BATCH_TOKENS = 8192
+EMBED_MAX_BATCH_SIZE = 128
+EMBED_WORKERS = 1 # Encode processes; 1 encodes in-process, None uses one per CPU core
+
+# Clustering engine: 'bertopic' (UMAP + HDBSCAN, BERTopic's defaults) or 'fast' (PCA/TruncatedSVD + HDBSCAN/MiniBatchKMeans, seeded)
+CLUSTER_ENGINE = 'bertopic'
+FAST_REDUCTION = 'pca' # 'pca' or 'svd' (TruncatedSVD, no centering)
+FAST_COMPONENTS = 10 # Dimensions kept by the fast reduction
+FAST_CLUSTERER = 'kmeans' # 'kmeans' (MiniBatchKMeans: no outliers, every post gets a topic) or 'hdbscan'
+FAST_KMEANS_CLUSTERS = None # None picks sqrt(posts / 2), capped by posts / min_topic_size
+CLUSTER_SEED = 42 # Fixed seed for UMAP, the fast engine's reduction and k-means, so reruns give the same clusters
+
+# Time-windowed clustering: cluster sliding windows of the thread separately, then merge topics across overlaps
+TIME_WINDOW_MINUTES = None # e.g. 120; None clusters the whole thread at once
+TIME_WINDOW_OVERLAP = 0.5 # Fraction of each window shared with the next
+TIME_WINDOW_MIN_POSTS = 100 # Quieter windows are widened to this many posts
+TIME_WINDOW_MERGE_OVERLAP = 0.5 # Merge two window topics whose posts in the overlap have at least this Jaccard similarity
+
+# Incremental clustering (main.py --incremental): keep the fitted model per thread between runs
+INCREMENTAL_STATE_DIR = os.path.join('data', 'topic_state')
+INCREMENTAL_MAX_OUTLIER_RATE = 0.5 # Refit when more new posts than this are outliers
+INCREMENTAL_MAX_GROWTH_RATIO = 1.0 # Refit when the thread has grown by more than this since the last fit
+
+# Near-duplicate filter: embed one representative per group of copypasta/AA/near-identical posts
+DEDUP_ENABLED = True
+DEDUP_THRESHOLD = 0.8 # Estimated Jaccard similarity of character n-grams to count as a duplicate
+DEDUP_NGRAM = 3
+DEDUP_NUM_PERM = 64 # MinHash permutations
+DEDUP_BANDS = 16 # LSH bands (DEDUP_NUM_PERM must be divisible by this)
+
+# Reply graph: complete each topic cluster with the posts it replies to and the short replies it received
+REPLY_GRAPH_EXPAND = True
+REPLY_PARENT_HOPS = 2 # Follow >>N anchors up this many levels
+REPLY_CHILD_HOPS = 1 # Add short replies this many levels down
+REPLY_SHORT_MAX_LENGTH = 8 # "Short" = fewer characters than this (the default min_post_length)
+
+# Topic index: centroids of published clusters, so topics already covered by another thread are skipped
+TOPIC_DEDUP_ENABLED = True
+TOPIC_INDEX_DIR = os.path.join('data', 'topic_index')
+TOPIC_DUPLICATE_THRESHOLD = 0.93 # Cosine similarity to a published centroid (from another thread) to skip a cluster
+TOPIC_MERGE_THRESHOLD = 0.96 # Cosine similarity at which clusters of the same run are merged
+TOPIC_INDEX_TOP_K = 5
+TOPIC_INDEX_APPROX_THRESHOLD = 20000 # From this many centroids on, lookups use random-projection LSH
+TOPIC_INDEX_LSH_TABLES = 8
+TOPIC_INDEX_LSH_BITS = 12
+
+# Cluster summaries: optional lead paragraph above each blog post (loads a second model)
+SUMMARIZE_CLUSTERS = False
+SUMMARY_MODEL = 'tsmatz/mt5_summarize_japanese'
+SUMMARY_MAX_INPUT_TOKENS = 512 # Inputs are truncated to the model window
+SUMMARY_MAX_LENGTH = 150
+SUMMARY_MIN_LENGTH = 30
+SUMMARY_BATCH_SIZE = 8
+SUMMARY_CACHE_FILE = os.path.join('data', 'summary_cache.json') # Keyed by a hash of the cluster's text
+
+# Resident worker (python worker.py): jobs arrive via the spool directory or a localhost socket
+WORKER_SPOOL_DIR = os.path.join('data', 'spool')
+WORKER_HOST = '127.0.0.1'
+WORKER_PORT = 8765
+WORKER_POLL_SECONDS = 2.0
+
+# Watch mode (python watch.py): follow growing threads through repeated snapshots
+WATCH_SNAPSHOT_DIR = os.path.join('data', 'snapshots')
+WATCH_STATE_FILE = os.path.join('data', 'watch_state.json') # Last processed post number per thread
+WATCH_POLL_SECONDS = 5.0
+WATCH_SETTLE_SECONDS = 1.0 # A snapshot must be this old (not still being written) before it is read
+
 # Livedoor AtomPub API details (loaded from .env)
 API_URL = os.getenv('LIVEDOOR_API_URL')
 USERNAME = os.getenv('LIVEDOOR_USERNAME')
 ATOMPUB_PASSWORD = os.getenv('LIVEDOOR_ATOMPUB_PASSWORD')
 
-# Ensure data and logs directories exist
-if not os.path.exists('data'):
-    os.makedirs('data')
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+# Publishing: drafts are sent concurrently over one pooled HTTP session
+PUBLISH_MAX_CONCURRENCY = 4 # Requests in flight at once
+PUBLISH_REQUESTS_PER_SECOND = 2.0 # Cap on request starts per second, retries included (0 = no cap)
+PUBLISH_MAX_RETRIES = 3 # Retries on 5xx responses, timeouts and connection errors (creates: connection errors, 502/503)
+PUBLISH_BACKOFF_SECONDS = 1.0 # First retry delay; doubles on each further retry
+PUBLISH_TIMEOUT_SECONDS = 30
+PUBLISH_JOURNAL_PATH = os.path.join('data', 'publish_journal.sqlite3') # Clusters already published (skipped or updated on rerun)
+PUBLISH_MATCH_OVERLAP = 0.5 # A changed cluster updates the draft of a published one sharing this share of posts (Jaccard)
+
+# Run reports: per-stage timings for every run (JSON per run, one CSV row per stage)
+RUN_REPORT_DIR = os.path.join('logs', 'reports')
+RUN_REPORT_CSV = os.path.join('logs', 'run_report.csv')
+PROFILE_STAGES = () # Stage names to run under cProfile, e.g. ('cluster_posts_by_topic',)
+
+# main.py parse: warn when module imports take longer than this
+PARSE_STARTUP_TARGET_SECONDS = 0.5
+
+def ensure_directories():
+    """Ensure data and logs directories exist (called by entry points, not at import)."""
+    os.makedirs('data', exist_ok=True)
+    os.makedirs('logs', exist_ok=True)
 
 # --- Sanity Checks (Optional but Recommended) ---
-if not API_URL:
-    print("Warning: LIVEDOOR_API_URL not found in .env file or environment variables.")
-if not USERNAME:
-    print("Warning: LIVEDOOR_USERNAME not found in .env file or environment variables.")
-if not ATOMPUB_PASSWORD:
-    print("Warning: LIVEDOOR_ATOMPUB_PASSWORD not found in .env file or environment variables.")
+def warn_missing_credentials():
+    """Prints a warning for each missing Livedoor credential. Called before publishing."""
+    if not API_URL:
+        print("Warning: LIVEDOOR_API_URL not found in .env file or environment variables.")
+    if not USERNAME:
+        print("Warning: LIVEDOOR_USERNAME not found in .env file or environment variables.")
+    if not ATOMPUB_PASSWORD:
+        print("Warning: LIVEDOOR_ATOMPUB_PASSWORD not found in .env file or environment variables.")
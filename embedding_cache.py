@@ -0,0 +1,114 @@
+# embedding_cache.py
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+import numpy as np
+import config
+
+KEY_BYTES = 16 # blake2b digest size used for text keys
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_text(text):
+    """Normalizes post text so trivially different copies (width, spacing) compare equal, e.g. for deduplication."""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+def text_key(text):
+    """Returns the fixed-size binary key for a model input text, exactly as it is encoded."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+class EmbeddingStore:
+    """
+    Persistent embedding store for one model, keyed by the hash of the exact text given to the model.
+
+    Vectors live in a raw float32 file that is memory-mapped for reads and appended to for
+    new texts; keys.bin holds the matching KEY_BYTES digests in the same row order.
+    """
+
+    def __init__(self, model_name, cache_dir=None):
+        self.model_name = model_name
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+        self.directory = os.path.join(cache_dir or config.EMBEDDING_CACHE_DIR, safe_name)
+        self.keys_path = os.path.join(self.directory, 'keys.bin')
+        self.vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.dim = None
+        self.rows = {}
+        self.vectors = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            self.dim = json.load(f)['dim']
+        with open(self.keys_path, 'rb') as f:
+            key_data = f.read()
+        # Vectors are appended before keys, so a crash can only leave extra vector rows; ignore them
+        row_count = min(len(key_data) // KEY_BYTES, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        self.rows = {key_data[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(row_count)}
+        self._map(row_count)
+
+    def _map(self, row_count):
+        if row_count:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(row_count, self.dim))
+        else:
+            self.vectors = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _append(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'model_name': self.model_name, 'dim': self.dim}, f)
+            # Start from empty files in case a previous store was left without meta.json
+            open(self.vectors_path, 'wb').close()
+            open(self.keys_path, 'wb').close()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+        start_row = len(self.rows)
+        self.vectors = None # Release the old mapping before growing the file
+        with open(self.vectors_path, 'r+b') as f:
+            f.seek(start_row * 4 * self.dim)
+            f.write(vectors.tobytes())
+            f.truncate()
+        with open(self.keys_path, 'r+b') as f:
+            f.seek(start_row * KEY_BYTES)
+            f.write(b''.join(keys))
+            f.truncate()
+        for offset, key in enumerate(keys):
+            self.rows[key] = start_row + offset
+        self._map(len(self.rows))
+
+    def get_or_compute(self, texts, encode):
+        """
+        Returns an (n, dim) float32 matrix for texts, calling encode(list_of_texts) only for texts
+        that are not in the store yet. Texts are keyed and encoded exactly as given, so a stored
+        vector is always the model's output for that input; each distinct new text is encoded once.
+        """
+        keys = [text_key(text) for text in texts]
+        hits = 0
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self.rows:
+                hits += 1
+            elif key not in missing:
+                missing[key] = text
+
+        if missing:
+            # Repeats of a new text within this call are misses, not hits
+            logging.info(f"Embedding cache: {hits} hits, {len(texts) - hits} misses, "
+                         f"encoding {len(missing)} distinct new texts")
+            new_vectors = np.asarray(encode(list(missing.values())), dtype=np.float32)
+            self._append(list(missing.keys()), new_vectors)
+        else:
+            logging.info(f"Embedding cache: all {len(texts)} texts found")
+
+        return np.asarray(self.vectors[[self.rows[key] for key in keys]], dtype=np.float32)
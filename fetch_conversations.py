@@ -2,16 +2,66 @@ import re
 import logging
 import time
 import os
+import calendar
+import codecs
+import functools
+from collections import Counter
+import mmap
+from contextlib import contextmanager
 from bs4 import BeautifulSoup
+from lxml import etree
+import post_cache
 # Remove Playwright imports
 
+# Bump whenever the post dictionaries produced by this module change, so cached parses are not reused
+PARSER_VERSION = 5
+
+STREAM_CHUNK_SIZE = 64 * 1024 # Bytes fed to the incremental parser per call
+MMAP_THRESHOLD = 4 * 1024 * 1024 # Files at least this large are memory-mapped instead of read()
+SNIFF_BYTES = 8 * 1024 # How much non-ASCII text to test-decode when there is no <meta charset>
+TAIL_WINDOW_BYTES = 32 * 1024 # First window read back from the end of a snapshot by fetch_new_posts (then grows)
+ENCODINGS_TO_TRY = ['utf-8', 'cp932', 'euc-jp']
+
+_BOMS = [(codecs.BOM_UTF8, 'utf-8')]
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([A-Za-z0-9_.:\-]+)', re.IGNORECASE)
+_NON_ASCII_RE = re.compile(rb'[\x80-\xff]')
+# Start tag of a post (div.post or div.t_h). '<' never occurs inside a cp932/utf-8 multibyte character,
+# so matching raw bytes is safe in every supported encoding.
+_POST_START_RE = re.compile(rb'<div\b[^>]*?\bclass\s*=\s*["\']?(?:[^"\'>]*\s)?(?:post|t_h)(?=[\s"\'>])', re.IGNORECASE)
+_THREAD_CONTAINER_RE = re.compile(rb'<div\b[^>]*?\bid\s*=\s*["\']?threadcontent\b', re.IGNORECASE)
+_TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+_TAIL_PREFIX = b'<html><body><div id="threadcontent">'
+# Shift_JIS pages are almost always cp932 in practice (NEC/IBM extensions), so use the superset
+_CHARSET_ALIASES = {
+    'shift_jis': 'cp932', 'shift-jis': 'cp932', 'sjis': 'cp932', 'x-sjis': 'cp932',
+    'windows-31j': 'cp932', 'ms932': 'cp932', 'ms_kanji': 'cp932',
+}
+
+# --- Precompiled Post Patterns ---
+_PAREN_INFO_RE = re.compile(r'\s*\(.*\)')
+_DOUBLE_ID_PREFIX_RE = re.compile(r'^\s*ID:\s*ID:')
+_REPLY_RE = re.compile(r'>>(\d+)')
+_POST_NUMBER_RE = re.compile(r"^(\d+)\s*:?")
+_DATE_HINT_RE = re.compile(r'\d{4}/')
+_TIMESTAMP_RE = re.compile(r'(\d{4}/\d{2}/\d{2}\(.*?\)\s*\d{2}:\d{2}:\d{2}(?:\.\d+)?)')
+_ID_RE = re.compile(r'(ID:\s?\S+)')
+_TIMESTAMP_PARTS_RE = re.compile(r'(\d{4})/(\d{1,2})/(\d{1,2})(?:\([^)]*\))?\s*(\d{1,2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?')
+# Structure 2 fast path: "<number> : <name> : <timestamp> ID:<id>" matched in one pass over the header text.
+# The name may not start with a separator (no name goes to the slow path), and the ID must close the
+# header so that extra trailing info (BE points etc.) goes to the slow path.
+_HEADER_RE = re.compile(
+    r'^(?P<number>\d+)\s*[:：]?\s*(?P<name>[^:：\s].*?)\s*[:：]?\s*'
+    r'(?P<timestamp>\d{4}/\d{2}/\d{2}\([^)]*\)\s*\d{2}:\d{2}:\d{2}(?:\.\d+)?)'
+    r'\s*(?P<id>ID:\s?\S+)$'
+)
+
 # --- Helper Function for User ID and Info Cleanup ---
 def clean_user_info(user_info):
     """Removes parenthesized info and standardizes anonymous names."""
     if user_info is None:
         user_info = "Unknown"
     # Remove patterns like (ﾜｯﾁｮｲ ...)
-    user_info = re.sub(r'\s*\(.*\)', '', user_info).strip()
+    user_info = _PAREN_INFO_RE.sub('', user_info).strip()
     # Standardize anonymous names
     user_info = user_info.replace("名無しさんの野望", "名無しサモナー")
     # Add other potential anonymous names if needed
@@ -19,31 +69,26 @@ def clean_user_info(user_info):
     return user_info
 
 def clean_user_id(user_id):
-    """Removes redundant ID: prefix using regex and adds logging."""
+    """Removes redundant ID: prefix using regex and logs (at debug level) when it had to be changed."""
     if user_id is None:
         user_id = "Unknown"
-    
-    original_id_for_log = user_id # Store for logging
-    logging.debug(f"Cleaning User ID. Initial value: '{original_id_for_log}'")
-    
+
     # Initial cleanup of potential whitespace/nbsp
     user_id = user_id.replace('\xa0', ' ').strip()
 
     # Use regex to remove the first "ID:" if preceded by optional space and followed by another "ID:" (with optional space)
     # ^\s* asserts optional space at start of string
     # count=1 ensures only the first match is replaced
-    cleaned_user_id = re.sub(r'^\s*ID:\s*ID:', 'ID:', user_id, count=1)
-    
+    cleaned_user_id = _DOUBLE_ID_PREFIX_RE.sub('ID:', user_id, count=1)
+
     if cleaned_user_id != user_id:
-        logging.debug(f"Cleaned redundant ID prefix. Result: '{cleaned_user_id}'")
-    else:
-        logging.debug(f"No redundant ID prefix found or regex didn't match. ID remains: '{user_id}'")
-        
+        logging.debug("Cleaned redundant ID prefix. Result: '%s'", cleaned_user_id)
+
     user_id = cleaned_user_id # Update user_id with the result of re.sub
 
     # Ensure it still starts with ID: after potential cleaning, if not Unknown
     if user_id != "Unknown" and not user_id.startswith("ID:"):
-         logging.debug(f"User ID '{user_id}' lost its prefix during cleaning, prepending ID: back if non-empty")
+         logging.debug("User ID '%s' lost its prefix during cleaning, prepending ID: back if non-empty", user_id)
          if user_id: 
               user_id = "ID:" + user_id
          else: 
@@ -51,6 +96,35 @@ def clean_user_id(user_id):
 
     return user_id
 
+def parse_timestamp(timestamp):
+    """
+    Converts a post timestamp such as '2025/03/15(土) 12:34:56.78' into milliseconds since the epoch
+    (board-local time, no timezone conversion). Returns None if there is no recognizable date.
+    """
+    match = _TIMESTAMP_PARTS_RE.search(timestamp or '')
+    if not match:
+        return None
+    year, month, day, hour, minute, second, fraction = match.groups()
+    try:
+        seconds = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second or 0), 0, 0, 0))
+    except (ValueError, OverflowError):
+        return None
+    return seconds * 1000 + int((fraction or '').ljust(3, '0')[:3])
+
+def post_columns(posts_data):
+    """
+    Returns the posts' number, time and poster ID as parallel arrays (in the order of posts_data):
+    {'number': int64 (-1 if missing), 'posted_at': datetime64[ms] (NaT if missing), 'poster_id': str}.
+    """
+    import numpy as np # Only needed by the clustering side; keeps 'main.py parse' start-up light
+    numbers = np.fromiter((post.get('number') or -1 for post in posts_data), dtype=np.int64, count=len(posts_data))
+    posted_at = np.array([post.get('posted_at') for post in posts_data], dtype=np.float64) # None -> nan
+    times = np.full(len(posts_data), np.datetime64('NaT'), dtype='datetime64[ms]')
+    known = ~np.isnan(posted_at)
+    times[known] = posted_at[known].astype(np.int64).astype('datetime64[ms]')
+    poster_ids = np.array([post.get('id') or '' for post in posts_data], dtype=str)
+    return {'number': numbers, 'posted_at': times, 'poster_id': poster_ids}
+
 # --- Parsing Logic for Structure 1: div.post ---
 def parse_structure1(post_div):
     """Parses post data from a <div class='post'> structure."""
@@ -86,12 +160,13 @@ def parse_structure1(post_div):
     user_info = clean_user_info(user_info)
     user_id = clean_user_id(user_id)
 
-    replies_to = [int(match) for match in re.findall(r'>>(\d+)', content_text)]
+    replies_to = [int(match) for match in _REPLY_RE.findall(content_text)]
 
     return {
         'number': number,
         'user_info': user_info,
         'timestamp': timestamp,
+        'posted_at': parse_timestamp(timestamp),
         'id': user_id,
         'content_html': content_html.strip(),
         'content_text': content_text,
@@ -99,16 +174,33 @@ def parse_structure1(post_div):
     }
 
 # --- Parsing Logic for Structure 2: div.t_h / div.t_b ---
-def parse_structure2(header_div, content_div):
-    """Parses post data from a <div class='t_h'> / <div class='t_b'> structure."""
+def _parse_header_fast(header_div, header_text):
+    """
+    Single-pass header extraction for the usual layout, '<number> : <span>name</span> : <timestamp> ID:<id>'
+    with the name as the header's only span. Returns (number, user_info, timestamp, user_id), or None for
+    any other layout (no span or extra spans, names that look like a date or ID), which is left to
+    _parse_header_slow; on the layouts accepted here both paths give the same result.
+    """
+    match = _HEADER_RE.match(header_text)
+    if not match:
+        return None
+    spans = header_div.find_all('span')
+    if len(spans) != 1:
+        return None
+    user_info = spans[0].get_text(strip=True) # What the slow path takes as the name
+    if (not user_info or _DATE_HINT_RE.search(user_info) or "ID:" in user_info
+            or ''.join(user_info.split()) != ''.join(match.group('name').split())):
+        return None
+    return int(match.group('number')), user_info, match.group('timestamp'), match.group('id')
+
+def _parse_header_slow(header_div, header_text):
+    """Heuristic span-by-span header extraction, used when the fast path does not match."""
     number = None
     user_info = "Unknown"
     timestamp = "Unknown"
     user_id = "Unknown"
 
-    # Parse header (t_h)
-    header_text = header_div.get_text(separator=" ", strip=True).replace('\xa0', ' ')
-    match_num = re.match(r"^(\d+)\s*:?", header_text)
+    match_num = _POST_NUMBER_RE.match(header_text)
     if match_num:
         number = int(match_num.group(1))
     else:
@@ -125,48 +217,62 @@ def parse_structure2(header_div, content_div):
         # Assume first span is user info unless it looks like date/ID
         potential_user_span = spans[0]
         potential_user_text = potential_user_span.get_text(strip=True)
-        if not re.search(r'\d{4}/', potential_user_text) and "ID:" not in potential_user_text:
+        if not _DATE_HINT_RE.search(potential_user_text) and "ID:" not in potential_user_text:
              user_info = potential_user_text
 
     # Find timestamp and ID - often the last two spans or identified by content
-    for span in reversed(spans):
+    for span_index in range(len(spans) - 1, -1, -1):
+        span = spans[span_index]
         span_text = span.get_text(strip=True).replace('\xa0', ' ').strip()
         if span_text.startswith("ID:"):
             user_id = span_text # Assign full string first
             # Check preceding text/span for timestamp
             prev_node = span.find_previous() # Find previous node (could be tag or text)
             prev_text = prev_node.get_text(strip=True) if prev_node and hasattr(prev_node, 'get_text') else ""
-            if re.search(r'\d{4}/', prev_text):
+            if _DATE_HINT_RE.search(prev_text):
                  timestamp = prev_text.strip()
 
             # Fallback: Check span before ID span if previous text node didn't work
             elif len(spans) > 1:
-                 try:
-                     ts_text = spans[spans.index(span) - 1].get_text(strip=True)
-                     if re.search(r'\d{4}/', ts_text):
-                          timestamp = ts_text
-                 except IndexError:
-                      pass # No preceding span
+                 ts_text = spans[span_index - 1].get_text(strip=True)
+                 if _DATE_HINT_RE.search(ts_text):
+                      timestamp = ts_text
             break # Found ID span
 
     # Fallback timestamp search across all spans if needed
     if timestamp == "Unknown":
          for span in spans:
-              span_text = span.get_text(strip=True)
               # More flexible regex for timestamp
-              match_ts = re.search(r'(\d{4}/\d{2}/\d{2}\(.*?\)\s*\d{2}:\d{2}:\d{2}(?:\.\d+)?)', span_text)
+              match_ts = _TIMESTAMP_RE.search(span.get_text(strip=True))
               if match_ts:
                    timestamp = match_ts.group(1)
                    break
 
     # Fallback search in full text if spans failed (less reliable)
     if user_id == "Unknown":
-        match_id = re.search(r'(ID:\s?\S+)', header_text)
+        match_id = _ID_RE.search(header_text)
         if match_id: user_id = match_id.group(1)
     if timestamp == "Unknown":
-         match_ts = re.search(r'(\d{4}/\d{2}/\d{2}\(.*?\)\s*\d{2}:\d{2}:\d{2}(?:\.\d+)?)', header_text)
+         match_ts = _TIMESTAMP_RE.search(header_text)
          if match_ts: timestamp = match_ts.group(1)
 
+    return number, user_info, timestamp, user_id
+
+def parse_structure2(header_div, content_div, header_counts=None):
+    """
+    Parses post data from a <div class='t_h'> / <div class='t_b'> structure.
+    header_counts (Counter), if given, counts headers parsed by the 'fast' and 'slow' paths.
+    """
+    # Parse header (t_h): compiled single-pass match first, span heuristics only if that fails
+    header_text = header_div.get_text(separator=" ", strip=True).replace('\xa0', ' ')
+    header = _parse_header_fast(header_div, header_text)
+    if header_counts is not None:
+        header_counts['fast' if header is not None else 'slow'] += 1
+    if header is None:
+        header = _parse_header_slow(header_div, header_text)
+        if header is None:
+            return None
+    number, user_info, timestamp, user_id = header
 
     # Parse content (t_b)
     content_html = content_div.decode_contents()
@@ -176,12 +282,13 @@ def parse_structure2(header_div, content_div):
     user_info = clean_user_info(user_info)
     user_id = clean_user_id(user_id) # Apply the fix here too!
 
-    replies_to = [int(match) for match in re.findall(r'>>(\d+)', content_text)]
+    replies_to = [int(match) for match in _REPLY_RE.findall(content_text)]
 
     return {
         'number': number,
         'user_info': user_info,
         'timestamp': timestamp,
+        'posted_at': parse_timestamp(timestamp),
         'id': user_id,
         'content_html': content_html.strip(),
         'content_text': content_text,
@@ -189,105 +296,62 @@ def parse_structure2(header_div, content_div):
     }
 
 
-# --- Main Fetching Function ---
-def fetch_conversations(file_path):
-    """Parses conversation data from a locally saved HTML file with potentially mixed structures."""
-    posts_data = []
-    html_content = None
-    logging.info(f"Attempting to read and parse HTML from {file_path}...")
-
-    # Read HTML content
-    try:
-        encodings_to_try = ['utf-8', 'cp932', 'euc-jp']
-        for enc in encodings_to_try:
-            try:
-                with open(file_path, 'r', encoding=enc) as f:
-                    html_content = f.read()
-                logging.info(f"Successfully read file {file_path} using encoding {enc}")
-                break
-            except UnicodeDecodeError:
-                logging.warning(f"Failed to decode {file_path} with {enc}, trying next...")
-            except FileNotFoundError:
-                logging.error(f"File not found: {file_path}")
-                return []
-        if html_content is None:
-             logging.error(f"Could not decode file {file_path} with attempted encodings: {encodings_to_try}")
-             return []
-    except Exception as e:
-        logging.error(f"An error occurred reading file {file_path}: {e}", exc_info=True)
-        return []
-
-    # --- Modified Parsing Logic ---
-    try:
-        soup = BeautifulSoup(html_content, 'lxml')
-        thread_container = soup.find('div', id='threadcontent')
-
-        if not thread_container:
-            logging.error(f"Could not find <div id='threadcontent'> in local file {file_path}")
-            return []
-
-        logging.info("Scanning thread content for post structures...")
-        processed_elements = set() # Keep track of processed elements to avoid double counting
-
-        # Find potential starting elements for both structures
-        potential_posts = thread_container.find_all('div', recursive=False, limit=2500) # Limit to avoid excessive memory on huge files
-        if not potential_posts:
-             potential_posts = thread_container.find_all('div', recursive=True, limit=2500) # Fallback to recursive if no direct children work
-             logging.warning("No direct div children found in threadcontainer, searching recursively.")
-
-        logging.info(f"Found {len(potential_posts)} potential post start elements to check.")
-
-        for element in potential_posts:
-            # Skip already processed elements (e.g., a t_b processed via its preceding t_h)
-            if element in processed_elements:
-                continue
-
-            post_info = None
-
-            # Check for Structure 1: <div class="post">
-            if 'post' in element.get('class', []):
-                logging.debug(f"Processing element {element.get('id', 'No ID')} as Structure 1")
-                post_info = parse_structure1(element)
+# --- Shared Post Scanning Logic ---
+def _iter_potential_posts(potential_posts, header_counts=None):
+    """Yields parsed posts from a list of BeautifulSoup elements (legacy tree-walking scan)."""
+    processed_elements = set() # Keep track of processed elements to avoid double counting
+
+    for element in potential_posts:
+        # Skip already processed elements (e.g., a t_b processed via its preceding t_h)
+        if element in processed_elements:
+            continue
+
+        post_info = None
+
+        # Check for Structure 1: <div class="post">
+        if 'post' in element.get('class', []):
+            logging.debug(f"Processing element {element.get('id', 'No ID')} as Structure 1")
+            post_info = parse_structure1(element)
+            processed_elements.add(element)
+
+        # Check for Structure 2: <div class="t_h">
+        elif 't_h' in element.get('class', []):
+            logging.debug(f"Processing element {element.get_text(strip=True)[:30]} as Structure 2 Header")
+            # Find the next sibling that is t_b, skipping over non-element nodes or <br> etc.
+            content_div = None
+            next_sibling = element.next_sibling
+            while next_sibling:
+                 # Check if it's an element before accessing name/class
+                if hasattr(next_sibling, 'name') and next_sibling.name == 'div' and 't_b' in next_sibling.get('class', []):
+                    content_div = next_sibling
+                    break
+                elif hasattr(next_sibling, 'name') and next_sibling.name == 'br': # Skip <br> tags often between t_h and t_b
+                     pass
+                elif isinstance(next_sibling, str) and next_sibling.strip() == "": # Skip whitespace nodes
+                     pass
+                elif hasattr(next_sibling, 'name'): # If it's another tag, stop looking for t_b for this t_h
+                     break
+
+                next_sibling = next_sibling.next_sibling # Move to the next element
+
+            if content_div:
+                post_info = parse_structure2(element, content_div, header_counts)
                 processed_elements.add(element)
+                processed_elements.add(content_div) # Mark content div as processed too
+            else:
+                logging.warning(f"Structure 2: Found t_h but no matching t_b sibling for: {element.prettify()[:100]}")
+                processed_elements.add(element) # Mark header as processed even if no content found
 
-            # Check for Structure 2: <div class="t_h">
-            elif 't_h' in element.get('class', []):
-                logging.debug(f"Processing element {element.get_text(strip=True)[:30]} as Structure 2 Header")
-                # Find the next sibling that is t_b, skipping over non-element nodes or <br> etc.
-                content_div = None
-                next_sibling = element.next_sibling
-                while next_sibling:
-                     # Check if it's an element before accessing name/class
-                    if hasattr(next_sibling, 'name') and next_sibling.name == 'div' and 't_b' in next_sibling.get('class', []):
-                        content_div = next_sibling
-                        break
-                    elif hasattr(next_sibling, 'name') and next_sibling.name == 'br': # Skip <br> tags often between t_h and t_b
-                         pass
-                    elif isinstance(next_sibling, str) and next_sibling.strip() == "": # Skip whitespace nodes
-                         pass
-                    elif hasattr(next_sibling, 'name'): # If it's another tag, stop looking for t_b for this t_h
-                         break
-
-                    next_sibling = next_sibling.next_sibling # Move to the next element
-
-                if content_div:
-                    post_info = parse_structure2(element, content_div)
-                    processed_elements.add(element)
-                    processed_elements.add(content_div) # Mark content div as processed too
-                else:
-                    logging.warning(f"Structure 2: Found t_h but no matching t_b sibling for: {element.prettify()[:100]}")
-                    processed_elements.add(element) # Mark header as processed even if no content found
-
-            # Append valid parsed data
-            if post_info:
-                posts_data.append(post_info)
+        # Yield valid parsed data
+        if post_info:
+            yield post_info
 
-    except Exception as e:
-        logging.error(f"Error parsing HTML content from {file_path}: {e}", exc_info=True)
-        # Return partially parsed data? Or empty list? Returning empty for now.
-        return []
+def log_header_counts(header_counts, source):
+    if header_counts:
+        logging.info(f"Structure 2 header parsing ({source}): fast path={header_counts['fast']}, slow path={header_counts['slow']}")
 
-    # --- Final Sorting and Deduplication ---
+def _finalize_posts(posts_data, file_path):
+    """Sorts parsed posts by number and drops duplicate post numbers."""
     # Sort final list by post number
     posts_data.sort(key=lambda p: p.get('number', float('inf'))) # Ensure posts with no number sort last
 
@@ -313,4 +377,359 @@ def fetch_conversations(file_path):
     logging.info(f"Successfully parsed {len(final_posts)} unique posts from {file_path}")
     return final_posts
 
+# --- Input Reading and Encoding Detection ---
+@contextmanager
+def _open_html_bytes(file_path):
+    """Reads the file once as bytes; large snapshots are memory-mapped rather than copied into memory."""
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            yield f.read()
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+@functools.lru_cache(maxsize=None)
+def _parser_accepts(encoding):
+    """True if lxml's HTML parser knows the encoding name (it goes through libxml2/iconv, not Python codecs)."""
+    try:
+        etree.HTMLPullParser(encoding=encoding)
+    except LookupError:
+        return False
+    return True
+
+def sniff_encoding(data):
+    """
+    Picks the charset for raw HTML bytes without decoding the whole file.
+    Checks for a BOM, then a <meta charset> in the head, then test-decodes a window of
+    SNIFF_BYTES starting at the first non-ASCII byte with each of ENCODINGS_TO_TRY.
+    """
+    for bom, enc in _BOMS:
+        if data[:len(bom)] == bom:
+            return enc
+
+    match_meta = _META_CHARSET_RE.search(data[:SNIFF_BYTES])
+    if match_meta:
+        declared = match_meta.group(1).decode('ascii').lower()
+        declared = _CHARSET_ALIASES.get(declared, declared)
+        try:
+            codec_name = codecs.lookup(declared).name
+        except LookupError:
+            logging.warning(f"Ignoring unknown <meta charset> value: {declared}")
+        else:
+            # Python's canonical names (euc_jp) are unknown to libxml2, so return a label both accept
+            for name in (declared, codec_name.replace('_', '-')):
+                if _parser_accepts(name) and codecs.lookup(name).name == codec_name:
+                    return name
+            logging.warning(f"<meta charset> {declared} is not supported by the HTML parser; detecting the encoding instead")
+
+    match_non_ascii = _NON_ASCII_RE.search(data)
+    if not match_non_ascii:
+        return 'utf-8' # Pure ASCII decodes the same everywhere
+    window = data[match_non_ascii.start():match_non_ascii.start() + SNIFF_BYTES]
+    for enc in ENCODINGS_TO_TRY:
+        try:
+            # final=False tolerates a multi-byte character cut off at the end of the window
+            codecs.getincrementaldecoder(enc)().decode(window, final=False)
+            return enc
+        except UnicodeDecodeError:
+            logging.debug(f"Sniff window is not valid {enc}, trying next...")
+    return None
+
+def _iter_byte_chunks(data):
+    for start in range(0, len(data), STREAM_CHUNK_SIZE):
+        yield data[start:start + STREAM_CHUNK_SIZE]
+
+# --- Streaming Parser ---
+def _to_soup_tag(element):
+    """Re-materializes a finished lxml element as a BeautifulSoup tag so the parse_structure* helpers can be reused."""
+    fragment = etree.tostring(element, encoding='unicode', method='html', with_tail=False)
+    return BeautifulSoup(fragment, 'lxml').find(element.tag)
+
+def _sibling_nodes(child):
+    """Expands a direct child of the thread container into the sibling sequence BeautifulSoup would see (node, then tail text)."""
+    yield child
+    if child.tail:
+        yield child.tail
+
+def _iter_thread_children(chunks, encoding):
+    """
+    Feeds raw byte chunks to an incremental lxml HTML parser (which decodes them once, as it goes)
+    and yields the direct children of <div id='threadcontent'> once each one is complete (including its tail text).
+    Finishes with a (container, saw_direct_div) tuple; nothing is yielded if there is no container.
+    """
+    parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+    container = None
+    saw_direct_div = False
+
+    def drain(stop_at=None):
+        if not saw_direct_div:
+            return # Keep everything until we know the recursive fallback is not needed
+        while len(container):
+            child = container[0]
+            if child is stop_at:
+                break
+            yield child
+            container.remove(child) # Finished children are dropped to keep memory flat
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if container is None:
+                if event == 'start' and element.tag == 'div' and element.get('id') == 'threadcontent':
+                    container = element
+                continue
+            if event == 'start' and element.getparent() is container:
+                if element.tag == 'div':
+                    saw_direct_div = True
+                # Everything before this child is complete now
+                yield from drain(stop_at=element)
+            elif event == 'end' and element is container:
+                yield from drain()
+                yield (container, saw_direct_div)
+                return
+
+    parser.close()
+    if container is not None:
+        # Unterminated container: flush whatever was collected
+        yield from drain()
+        yield (container, saw_direct_div)
+
+def _iter_stream_posts(children, header_counts=None):
+    """
+    Pairs t_h/t_b siblings and parses div.post elements from the streamed children of the thread container.
+    Returns True if the thread container was found.
+    """
+    pending_header = None
+    found_container = False
+    for child in children:
+        if isinstance(child, tuple):
+            found_container = True
+            container, saw_direct_div = child
+            if not saw_direct_div:
+                # No direct div children: mirror the legacy recursive search on the retained container
+                logging.warning("No direct div children found in threadcontainer, searching recursively.")
+                yield from _iter_potential_posts(_to_soup_tag(container).find_all('div', recursive=True), header_counts)
+            break
+
+        for node in _sibling_nodes(child):
+            if pending_header is not None:
+                if isinstance(node, str):
+                    if node.strip() == "": # Skip whitespace nodes
+                        continue
+                elif node.tag == 'br': # Skip <br> tags often between t_h and t_b
+                    continue
+                elif node.tag == 'div' and 't_b' in node.get('class', '').split():
+                    post_info = parse_structure2(_to_soup_tag(pending_header), _to_soup_tag(node), header_counts)
+                    pending_header = None
+                    if post_info:
+                        yield post_info
+                    continue
+                _warn_unpaired_header(pending_header)
+                pending_header = None
+
+            if isinstance(node, str) or node.tag != 'div':
+                continue
+            classes = node.get('class', '').split()
+            if 'post' in classes:
+                logging.debug(f"Processing element {node.get('id', 'No ID')} as Structure 1")
+                post_info = parse_structure1(_to_soup_tag(node))
+                if post_info:
+                    yield post_info
+            elif 't_h' in classes:
+                pending_header = node
+
+    if pending_header is not None:
+        _warn_unpaired_header(pending_header)
+    return found_container
+
+def _warn_unpaired_header(header_element):
+    header_html = etree.tostring(header_element, encoding='unicode', method='html', with_tail=False)
+    logging.warning(f"Structure 2: Found t_h but no matching t_b sibling for: {header_html[:100]}")
+
+def _stream_posts_from_bytes(data, file_path, header_counts=None):
+    """Streams posts out of raw HTML bytes (see iter_posts)."""
+    encoding = sniff_encoding(data)
+    if encoding is None:
+        logging.error(f"Could not detect encoding of {file_path} (tried: {ENCODINGS_TO_TRY})")
+        return
+    logging.info(f"Reading file {file_path} using encoding {encoding}")
+
+    found_container = yield from _iter_stream_posts(_iter_thread_children(_iter_byte_chunks(data), encoding), header_counts)
+    if not found_container:
+        logging.error(f"Could not find <div id='threadcontent'> in local file {file_path}")
+
+def iter_posts(file_path):
+    """
+    Streams post dictionaries from a locally saved thread HTML file, one at a time and in document order.
+    Unlike the tree-based scan there is no post cap, and finished posts are released as soon as they are parsed.
+    Yields the same dictionaries as parse_structure1/parse_structure2 (no sorting or deduplication).
+    """
+    if not os.path.exists(file_path):
+        logging.error(f"File not found: {file_path}")
+        return
+
+    with _open_html_bytes(file_path) as data:
+        yield from _stream_posts_from_bytes(data, file_path)
+
+# --- Tree-Based Parser (legacy) ---
+def _tree_posts_from_bytes(data, file_path, header_counts=None):
+    """Parses posts by building the full BeautifulSoup tree (capped at 2500 elements)."""
+    encoding = sniff_encoding(data)
+    if encoding is None:
+        logging.error(f"Could not detect encoding of {file_path} (tried: {ENCODINGS_TO_TRY})")
+        return []
+    logging.info(f"Reading file {file_path} using encoding {encoding}")
+
+    html_bytes = data if isinstance(data, bytes) else data[:] # BeautifulSoup needs real bytes, not an mmap
+    soup = BeautifulSoup(html_bytes, 'lxml', from_encoding=encoding)
+    thread_container = soup.find('div', id='threadcontent')
+
+    if not thread_container:
+        logging.error(f"Could not find <div id='threadcontent'> in local file {file_path}")
+        return []
+
+    logging.info("Scanning thread content for post structures...")
+
+    # Find potential starting elements for both structures
+    potential_posts = thread_container.find_all('div', recursive=False, limit=2500) # Limit to avoid excessive memory on huge files
+    if not potential_posts:
+         potential_posts = thread_container.find_all('div', recursive=True, limit=2500) # Fallback to recursive if no direct children work
+         logging.warning("No direct div children found in threadcontainer, searching recursively.")
+
+    logging.info(f"Found {len(potential_posts)} potential post start elements to check.")
+
+    return list(_iter_potential_posts(potential_posts, header_counts))
+
+# --- Tail Parser (watch mode) ---
+def thread_title(file_path):
+    """Returns the page <title> of a saved thread (decoded with the sniffed charset), or None."""
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    match_title = _TITLE_RE.search(head)
+    if not match_title:
+        return None
+    encoding = sniff_encoding(head) or 'utf-8'
+    title = match_title.group(1).decode(encoding, errors='replace')
+    return ' '.join(title.split()) or None
+
+def _parse_fragment(fragment, encoding, header_counts=None):
+    """Parses the posts in a byte range that starts at a post boundary inside the thread container."""
+    chunks = _iter_byte_chunks(_TAIL_PREFIX + fragment)
+    return list(_iter_stream_posts(_iter_thread_children(chunks, encoding), header_counts))
+
+def fetch_new_posts(file_path, after_number=0):
+    """
+    Parses only the end of a saved thread: the posts numbered above after_number.
+
+    Reads backwards from the end of the file in growing windows (TAIL_WINDOW_BYTES, then sized from the
+    average post length seen so far), parses each window from its first post boundary, and stops as soon as the window reaches a post
+    that was already known (number <= after_number + 1). The work is proportional to the new posts,
+    not to the size of the snapshot. Falls back to a full parse when the window reaches the start
+    of the thread or the page layout is not recognized.
+
+    Args:
+        file_path (str): Path to the saved thread HTML.
+        after_number (int): Highest post number already processed (0 parses every post).
+
+    Returns:
+        list: Post dictionaries numbered above after_number, sorted by number.
+    """
+    if not os.path.exists(file_path):
+        logging.error(f"File not found: {file_path}")
+        return []
+
+    header_counts = Counter() # Of the last (successful) parse only
+    try:
+        with _open_html_bytes(file_path) as data:
+            encoding = sniff_encoding(data)
+            match_container = _THREAD_CONTAINER_RE.search(data)
+            if encoding is None or match_container is None or after_number <= 0:
+                posts_data = list(_stream_posts_from_bytes(data, file_path, header_counts))
+            else:
+                container_end = data.find(b'>', match_container.end()) + 1
+                window = TAIL_WINDOW_BYTES
+                while True:
+                    window_start = max(container_end, len(data) - window)
+                    match_post = _POST_START_RE.search(data, window_start)
+                    if window_start == container_end or match_post is None:
+                        logging.info(f"Tail of {file_path} reaches the start of the thread; parsing it fully.")
+                        header_counts.clear()
+                        posts_data = list(_stream_posts_from_bytes(data, file_path, header_counts))
+                        break
+                    header_counts.clear()
+                    posts_data = _parse_fragment(data[match_post.start():], encoding, header_counts)
+                    numbers = [post['number'] for post in posts_data if post.get('number') is not None]
+                    parsed_bytes = len(data) - match_post.start()
+                    if numbers and min(numbers) <= after_number + 1:
+                        logging.info(f"Parsed the last {parsed_bytes} of {len(data)} bytes "
+                                     f"of {file_path} ({len(posts_data)} posts).")
+                        break
+                    window *= 4
+                    if numbers:
+                        # Jump straight to a window that should cover the missing posts, from the average post size
+                        missing_posts = min(numbers) - after_number - 1
+                        window = max(window, int((parsed_bytes + parsed_bytes / len(numbers) * missing_posts) * 1.1))
+                    if window >= (len(data) - container_end) // 2:
+                        window = len(data) # Most of the thread is new; one full parse is cheaper
+    except Exception as e:
+        logging.error(f"Error parsing the tail of {file_path}: {e}", exc_info=True)
+        return []
+
+    log_header_counts(header_counts, file_path)
+    new_posts = [post for post in posts_data if post.get('number') is not None and post['number'] > after_number]
+    if not new_posts:
+        return []
+    return _finalize_posts(new_posts, file_path)
+
+# --- Main Fetching Function ---
+def fetch_conversations(file_path, streaming=True, use_cache=True, header_counts=None):
+    """
+    Parses conversation data from a locally saved HTML file with potentially mixed structures.
+    streaming=True (default) uses the incremental, uncapped parser (iter_posts);
+    streaming=False builds the full BeautifulSoup tree as before.
+    With use_cache=True, results are stored in (and served from) the parsed-post cache,
+    keyed by the file's content hash and PARSER_VERSION.
+    header_counts (Counter), if given, receives the number of Structure 2 headers parsed by the
+    'fast' and 'slow' paths (nothing when the posts come from the cache).
+    """
+    header_counts = Counter() if header_counts is None else header_counts
+    logging.info(f"Attempting to read and parse HTML from {file_path}...")
+    if not os.path.exists(file_path):
+        logging.error(f"File not found: {file_path}")
+        return []
+
+    cache_key = None
+    try:
+        # Read HTML content once as bytes; the parser decodes it with the sniffed charset
+        with _open_html_bytes(file_path) as data:
+            if use_cache:
+                cache_key = post_cache.cache_key(data, f"{PARSER_VERSION}-{'stream' if streaming else 'tree'}")
+                cached_posts = post_cache.load_posts(cache_key)
+                if cached_posts is not None:
+                    logging.info(f"Loaded {len(cached_posts)} parsed posts for {file_path} from cache")
+                    return cached_posts
+
+            if streaming:
+                posts_data = list(_stream_posts_from_bytes(data, file_path, header_counts))
+            else:
+                posts_data = _tree_posts_from_bytes(data, file_path, header_counts)
+    except Exception as e:
+        logging.error(f"Error parsing HTML content from {file_path}: {e}", exc_info=True)
+        # Return partially parsed data? Or empty list? Returning empty for now.
+        return []
+
+    log_header_counts(header_counts, file_path)
+    if not posts_data:
+        return []
+
+    # --- Final Sorting and Deduplication ---
+    final_posts = _finalize_posts(posts_data, file_path)
+    if cache_key is not None:
+        post_cache.store_posts(cache_key, final_posts)
+    return final_posts
+
 # Removed the __main__ block as it's for testing only
\ No newline at end of file
@@ -1,87 +1,137 @@
 # format_output.py
-import logging
 import html # For escaping
 import re
 from bs4 import BeautifulSoup # Import BeautifulSoup
 
-def generate_blog_html(selected_posts, topic_keyword):
+_REPLY_TEXT_RE = re.compile(r'^>>\d+$')
+# A complete <a ...>text</a> whose text contains no nested tags, as serialized by BeautifulSoup
+# (lower-case tag, double-quoted attribute values). Anything else goes through the BeautifulSoup path.
+_SIMPLE_ANCHOR_RE = re.compile(r'<a((?:\s+[^\s=<>"\'/]+(?:="[^"<>]*")?)*)>([^<]*)</a>')
+_ANCHOR_START_RE = re.compile(r'<a[\s>]', re.IGNORECASE)
+# BeautifulSoup's minimal formatter only ever writes these three entities
+_NON_CANONICAL_AMP_RE = re.compile(r'&(?!(?:amp|lt|gt);)')
+_ATTR_RE = re.compile(r'\s+([^\s=<>"\'/]+)(?:="([^"<>]*)")?')
+
+# Post templates, filled once per post and joined with "\n"
+_HEADER_TEMPLATE = ('<div class="t_h">\n'
+                    '{number}: <span style="color: green;">{user}</span> <span style="color: gray;"> {timestamp}</span>{id_span}\n'
+                    '</div>')
+_ID_TEMPLATE = '<span style="color: gray;"> ID:{post_id}</span>'
+_BODY_TEMPLATE = ('<div class="t_b" style="font-weight:bold;margin-bottom:90px;">\n'
+                  '  {content}\n'
+                  '</div><br />')
+_LEAD_TEMPLATE = '<p class="lead">{lead}</p>'
+_MISSING_CONTENT_HTML = '<p><i>Content not available.</i></p>'
+
+def _style_reply_links_soup(content_html):
+    """Reference implementation: parses the content with BeautifulSoup and styles >>N links blue."""
+    soup = BeautifulSoup(content_html, 'html.parser')
+    reply_links = soup.find_all('a')
+    for link in reply_links:
+        # Check if link text looks like a reply link (e.g., >>123)
+        link_text = link.get_text(strip=True)
+        if re.match(r'^>>\d+$', link_text):
+            # Add or update style attribute
+            if link.has_attr('style'):
+                # Append color if style exists, avoid duplication
+                existing_style = link['style'].rstrip(';') # Remove trailing semicolon if any
+                if 'color:' not in existing_style:
+                    link['style'] = f'{existing_style}; color: blue;'
+                # Only add if not present; an existing color is left alone.
+            else:
+                link['style'] = 'color: blue;'
+    # Get the modified HTML string back from soup
+    # Use prettify() or just str() - str() avoids adding extra whitespace
+    return str(soup)
+
+def _style_anchor(match):
+    """Rewrites one simple anchor; returns None if it needs the BeautifulSoup path."""
+    attrs, text = match.group(1), match.group(2)
+    if not _REPLY_TEXT_RE.match(html.unescape(text).strip()):
+        return match.group(0)
+    parsed_attrs = list(_ATTR_RE.finditer(attrs))
+    if any(attr.group(2) is None or attr.group(0) != f' {attr.group(1)}="{attr.group(2)}"' for attr in parsed_attrs):
+        return None # Not in BeautifulSoup's serialized form
+    attr_values = {attr.group(1): attr.group(2) for attr in parsed_attrs}
+    if 'style' not in attr_values:
+        attr_values['style'] = 'color: blue;'
+    else:
+        existing_style = attr_values['style']
+        if '&' in existing_style:
+            return None # Escaped characters: let BeautifulSoup handle the round trip
+        existing_style = existing_style.rstrip(';')
+        if 'color:' in existing_style:
+            return match.group(0)
+        attr_values['style'] = f'{existing_style}; color: blue;'
+    # BeautifulSoup writes attributes in sorted order
+    return '<a' + ''.join(f' {name}="{value}"' for name, value in sorted(attr_values.items())) + f'>{text}</a>'
+
+def style_reply_links(content_html):
+    """
+    Styles reply links (<a>>>N</a>) blue in a single regex pass over the serialized content.
+    Produces the same bytes as the BeautifulSoup round trip for content serialized by
+    fetch_conversations; anchors with nested tags or unusual quoting fall back to BeautifulSoup.
+    """
+    if _NON_CANONICAL_AMP_RE.search(content_html):
+        return _style_reply_links_soup(content_html) # Not BeautifulSoup output; take the reference path
+    if '<a' not in content_html and '<A' not in content_html:
+        return content_html
+    parts = []
+    position = 0
+    for match in _SIMPLE_ANCHOR_RE.finditer(content_html):
+        if _ANCHOR_START_RE.search(content_html, position, match.start()):
+            return _style_reply_links_soup(content_html) # An anchor the regex could not take apart
+        replacement = _style_anchor(match)
+        if replacement is None:
+            return _style_reply_links_soup(content_html)
+        parts.append(content_html[position:match.start()])
+        parts.append(replacement)
+        position = match.end()
+    if _ANCHOR_START_RE.search(content_html, position):
+        return _style_reply_links_soup(content_html)
+    parts.append(content_html[position:])
+    return ''.join(parts)
+
+def generate_blog_html(selected_posts, topic_keyword, lead=None):
     """
     Generates an HTML string representing the blog post from selected posts,
     formatted similarly to the Livedoor example (t_h, t_b divs).
     Ensures reply links (>>number) are styled blue.
+    An optional lead (plain text, e.g. a summary of the cluster) is placed above the first post.
     """
     if not selected_posts:
         return "<p>No posts selected for this topic.</p>"
 
     html_parts = []
     # Removed H1 title generation - handled by publish function
+    if lead:
+        html_parts.append(_LEAD_TEMPLATE.format(lead=html.escape(lead)))
 
     for i, post in enumerate(selected_posts):
-        post_number = post.get('number', 'N/A')
-        user_info_raw = post.get('user_info', '名無しさん')
-        timestamp = post.get('timestamp', '')
         post_id = post.get('id', '')
         original_content_html = post.get('content_html', '')
 
         # --- Consistent User Info ---
         # Replace specific anonymous name with the desired one
-        if user_info_raw == "名無しさんの野望":
-            user_info_display = "名無しサモナー"
-        else:
-            user_info_display = user_info_raw # Keep other names as is
-
-        # --- Process Content HTML for Reply Link Styling ---
-        if original_content_html:
-            soup = BeautifulSoup(original_content_html, 'html.parser')
-            reply_links = soup.find_all('a')
-            for link in reply_links:
-                # Check if link text looks like a reply link (e.g., >>123)
-                link_text = link.get_text(strip=True)
-                if re.match(r'^>>\d+$', link_text):
-                    # Add or update style attribute
-                    if link.has_attr('style'):
-                        # Append color if style exists, avoid duplication
-                        existing_style = link['style'].rstrip(';') # Remove trailing semicolon if any
-                        if 'color:' not in existing_style:
-                            link['style'] = f'{existing_style}; color: blue;'
-                        # else: color already defined, maybe override or leave?
-                        # Let's override for simplicity/consistency:
-                        # Find existing color property and replace, or append if not found.
-                        # This is complex to do perfectly with just string manipulation.
-                        # Simpler: Just append, browser should handle precedence or override.
-                        # link['style'] = f'{existing_style}; color: blue;' # Re-appending might be messy
-                        # Safest basic approach: only add if not present.
-                    else:
-                        link['style'] = 'color: blue;'
-            # Get the modified HTML string back from soup
-            # Use prettify() or just str() - str() avoids adding extra whitespace
-            processed_content_html = str(soup)
-        else:
-            processed_content_html = '<p><i>Content not available.</i></p>'
+        user_info_display = post.get('user_info', '名無しさん')
+        if user_info_display == "名無しさんの野望":
+            user_info_display = "名無しサモナー" # Keep other names as is
 
         # --- Separator after first post ---
         if i == 1: # Add separator *before* the second post (which is the start of the body)
-             html_parts.append("<!-- Body -->") # Keep this comment for source readability
-             html_parts.append("<!--more-->") # Add the Livedoor/Standard Read More marker
-             # Maybe add a visual separator too?
-             # html_parts.append("<hr style='border-top: 1px dashed #ccc;'>") 
-
-        # --- Header (t_h) ---
-        html_parts.append('<div class="t_h">')
-        header_content = f'{post_number}: '
-        # Use the display version of user_info
-        header_content += f'<span style="color: green;">{html.escape(user_info_display)}</span> '
-        header_content += f'<span style="color: gray;"> {html.escape(timestamp)}</span>'
-        if post_id:
-            header_content += f'<span style="color: gray;"> ID:{html.escape(post_id)}</span>'
-        html_parts.append(header_content)
-        html_parts.append('</div>')
+            html_parts.append("<!-- Body -->") # Keep this comment for source readability
+            html_parts.append("<!--more-->") # Add the Livedoor/Standard Read More marker
 
-        # --- Body (t_b) ---
-        body_style = "font-weight:bold;margin-bottom:90px;"
-        html_parts.append(f'<div class="t_b" style="{body_style}">')
-        html_parts.append(f'  {processed_content_html}')
-        html_parts.append('</div><br />')
+        # --- Header (t_h) and Body (t_b) ---
+        html_parts.append(_HEADER_TEMPLATE.format(
+            number=post.get('number', 'N/A'),
+            user=html.escape(user_info_display),
+            timestamp=html.escape(post.get('timestamp', '')),
+            id_span=_ID_TEMPLATE.format(post_id=html.escape(post_id)) if post_id else '',
+        ))
+        html_parts.append(_BODY_TEMPLATE.format(
+            content=style_reply_links(original_content_html) if original_content_html else _MISSING_CONTENT_HTML,
+        ))
 
     # Optional: Add the source link (requires original URL)
     # if config.SOURCE_URL:
@@ -0,0 +1,196 @@
+# incremental_cluster.py
+import json
+import logging
+import os
+import re
+import time
+from bertopic import BERTopic
+import config
+from topic_cluster import (bertopic_embedding_model, cluster_posts_by_topic, embed_texts,
+                           filter_posts_for_clustering, group_posts_by_topic)
+
+STATE_FILE = 'state.json'
+MODEL_FILE = 'topic_model.pkl'
+
+def _state_dir(thread_key, state_root):
+    return os.path.join(state_root, re.sub(r'[^\w.-]', '_', thread_key))
+
+def _load_state(state_dir, model_name, backend):
+    state_path = os.path.join(state_dir, STATE_FILE)
+    model_path = os.path.join(state_dir, MODEL_FILE)
+    if not (os.path.exists(state_path) and os.path.exists(model_path)):
+        return None, None
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('model_name') != model_name or state.get('embedding_backend', 'torch') != backend:
+            logging.info("Incremental state was built with a different embedding model; refitting.")
+            return None, None
+        topic_model = BERTopic.load(model_path, embedding_model=bertopic_embedding_model(model_name, backend))
+    except Exception as e:
+        logging.warning(f"Could not load incremental topic state from {state_dir}: {e}. Refitting.")
+        return None, None
+    if 'fit_id' not in state:
+        logging.info("Incremental state predates topic keys; refitting.")
+        return None, None
+    # JSON object keys are strings
+    state['assignments'] = {int(number): topic for number, topic in state['assignments'].items()}
+    state['details'] = {int(topic_num): detail for topic_num, detail in state['details'].items()}
+    return state, topic_model
+
+def _save_state(state_dir, state, topic_model):
+    os.makedirs(state_dir, exist_ok=True)
+    topic_model.save(os.path.join(state_dir, MODEL_FILE), serialization='pickle', save_embedding_model=False)
+    tmp_path = os.path.join(state_dir, STATE_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(state_dir, STATE_FILE))
+
+def _clusters_for_topics(posts_data, assignments, topic_nums):
+    """Builds clusters (all current posts of each topic) for the given topic numbers."""
+    original_indices = []
+    topics = []
+    for i, post in enumerate(posts_data):
+        topic_num = assignments.get(post.get('number'))
+        if topic_num is not None and topic_num in topic_nums:
+            original_indices.append(i)
+            topics.append(topic_num)
+    return group_posts_by_topic(posts_data, original_indices, topics)
+
+def _topic_key(thread_key, fit_id, topic_num):
+    """Journal identity of a topic of one fit: its draft is updated in place while the topic grows."""
+    return f"{thread_key}#{fit_id}#{topic_num}"
+
+def _with_topic_keys(details, thread_key, fit_id):
+    return [{**detail, 'topic_key': _topic_key(thread_key, fit_id, detail['topic'])} for detail in details]
+
+def cluster_new_posts(posts_data,
+                      thread_key,
+                      model_name=config.EMBEDDING_MODEL,
+                      min_topic_size=6,
+                      min_post_length=8,
+                      embedding_backend=config.EMBEDDING_BACKEND,
+                      max_outlier_rate=config.INCREMENTAL_MAX_OUTLIER_RATE,
+                      max_growth_ratio=config.INCREMENTAL_MAX_GROWTH_RATIO,
+                      state_root=config.INCREMENTAL_STATE_DIR,
+                      engine=None,
+                      time_window_minutes=None,
+                      with_details=False,
+                      since_number=None):
+    """
+    Incrementally clusters a growing thread, keeping the fitted BERTopic model between runs.
+
+    Posts numbered above the highest post seen so far are assigned to existing topics with
+    topic_model.transform. The model is refit on the whole thread instead when there is no saved
+    state, when the new posts' outlier rate exceeds max_outlier_rate, or when the posts added
+    since the last fit exceed max_growth_ratio times the size of the fitted set (drift).
+    Fits go through cluster_posts_by_topic, so engine, time windows and titles match a full run.
+    Time-windowed topics have no transform(), so with time windows every run refits.
+
+    Args:
+        posts_data (list): All parsed posts of the thread (as from fetch_conversations).
+        thread_key (str): Stable identity of the thread (e.g. its page title), used to find saved state.
+        model_name, min_topic_size, min_post_length, embedding_backend, engine, time_window_minutes:
+            As for cluster_posts_by_topic.
+        max_outlier_rate (float): Refit when more than this fraction of new posts are outliers.
+        max_growth_ratio (float): Refit when posts added since the last fit exceed this ratio of the fitted set.
+        state_root (str): Directory holding one state subdirectory per thread.
+        with_details (bool): Also return the details of each cluster, as cluster_posts_by_topic does,
+                             plus a 'topic_key' that stays the same while the topic grows (until the
+                             next refit), so the publish journal updates the topic's draft in place.
+        since_number (int): Also return topics with posts numbered above since_number that were
+                            assigned in earlier runs (e.g. posts whose publish failed). By default
+                            only topics gaining posts in this run are returned.
+
+    Returns:
+        list: Clusters (lists of post dicts) for topics that gained posts in this run, with all their
+              posts. After a refit, every topic counts as new. With with_details=True, (clusters, details).
+    """
+    no_clusters = ([], []) if with_details else []
+    if not posts_data:
+        logging.warning("No posts provided for incremental clustering.")
+        return no_clusters
+
+    state_dir = _state_dir(thread_key, state_root)
+    state, topic_model = _load_state(state_dir, model_name, embedding_backend)
+
+    if state is not None:
+        new_posts = [post for post in posts_data if (post.get('number') or 0) > state['last_number']]
+        pending_topics = set()
+        if since_number is not None and since_number < state['last_number']:
+            pending_topics = {topic_num for number, topic_num in state['assignments'].items()
+                              if since_number < number <= state['last_number'] and topic_num != -1}
+        if not new_posts and not pending_topics:
+            logging.info(f"No posts after #{state['last_number']} in thread {thread_key}; nothing to cluster.")
+            return no_clusters
+
+        _, texts = filter_posts_for_clustering(new_posts, min_post_length)
+        long_posts = [post for post in new_posts if len(post.get('content_text', '')) >= min_post_length]
+        refit_reason = None
+        new_topics = []
+        if texts:
+            try:
+                embeddings = embed_texts(texts, model_name=model_name, backend=embedding_backend)
+                new_topics, _ = topic_model.transform(texts, embeddings=embeddings)
+                new_topics = [int(topic_num) for topic_num in new_topics]
+            except Exception as e:
+                logging.error(f"Error assigning new posts with the saved topic model: {e}", exc_info=True)
+                refit_reason = "transform failed"
+
+        if refit_reason is None and new_topics:
+            outlier_rate = new_topics.count(-1) / len(new_topics)
+            posts_since_fit = state['posts_since_fit'] + len(new_topics)
+            logging.info(f"Incremental assignment: {len(new_topics)} new posts, outlier rate {outlier_rate:.2f}, "
+                         f"{posts_since_fit} posts since last fit of {state['fit_size']}.")
+            if outlier_rate > max_outlier_rate:
+                refit_reason = f"outlier rate {outlier_rate:.2f} > {max_outlier_rate}"
+            elif posts_since_fit > max_growth_ratio * state['fit_size']:
+                refit_reason = f"{posts_since_fit} posts since last fit exceeds growth ratio {max_growth_ratio}"
+
+        if refit_reason is None:
+            for post, topic_num in zip(long_posts, new_topics):
+                if post.get('number') is not None:
+                    state['assignments'][post['number']] = topic_num
+            if new_posts:
+                state['last_number'] = max(post.get('number') or 0 for post in new_posts)
+            state['posts_since_fit'] += len(new_topics)
+            _save_state(state_dir, state, topic_model)
+            gained_topics = {topic_num for topic_num in new_topics if topic_num != -1}
+            logging.info(f"Topics that gained posts: {sorted(gained_topics)}"
+                         + (f"; pending from earlier runs: {sorted(pending_topics - gained_topics)}" if pending_topics else ''))
+            gained_topics |= pending_topics
+            clusters = _clusters_for_topics(posts_data, state['assignments'], gained_topics)
+            if not with_details:
+                return clusters
+            details = [state['details'].get(topic_num, {'topic': topic_num}) for topic_num in sorted(gained_topics)]
+            return clusters, _with_topic_keys(details, thread_key, state['fit_id'])
+
+        logging.info(f"Refitting topic model for thread {thread_key}: {refit_reason}")
+
+    # --- Full fit on the whole thread (same path as a non-incremental run) ---
+    fit_state = {}
+    clusters, details = cluster_posts_by_topic(posts_data, model_name=model_name, min_topic_size=min_topic_size,
+                                               min_post_length=min_post_length, embedding_backend=embedding_backend,
+                                               with_details=True, engine=engine,
+                                               time_window_minutes=time_window_minutes,
+                                               seed=config.CLUSTER_SEED, fit_state=fit_state)
+    if not fit_state:
+        return no_clusters
+
+    fit_id = str(int(time.time())) # Topic numbers of different fits are unrelated
+    if isinstance(fit_state['topic_model'], BERTopic):
+        state = {
+            'model_name': model_name,
+            'embedding_backend': embedding_backend,
+            'fit_id': fit_id,
+            'last_number': max(post.get('number') or 0 for post in posts_data),
+            'fit_size': len(fit_state['post_topics']),
+            'posts_since_fit': 0,
+            'assignments': {posts_data[i]['number']: topic_num for i, topic_num in fit_state['post_topics'].items()
+                            if posts_data[i].get('number') is not None},
+            'details': {detail['topic']: detail for detail in details},
+        }
+        _save_state(state_dir, state, fit_state['topic_model'])
+    else:
+        logging.info("Time-windowed topics cannot assign new posts later; the next run refits.")
+    return (clusters, _with_topic_keys(details, thread_key, fit_id)) if with_details else clusters
@@ -0,0 +1,156 @@
+# instrumentation.py
+# Per-stage wall time, CPU time, memory and item counts for a pipeline run, written as a
+# JSON report per run plus one CSV row per stage, with optional cProfile dumps.
+import cProfile
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+import config
+
+try:
+    import resource # Not available on Windows; CPU of child processes and peak RSS are then omitted
+except ImportError:
+    resource = None
+
+CSV_FIELDS = ('run_id', 'command', 'stage', 'calls', 'wall_seconds', 'cpu_seconds', 'child_cpu_seconds',
+              'peak_rss_growth_mb', 'process_peak_rss_mb', 'items', 'item_unit', 'items_per_second', 'bytes')
+
+def _peak_rss_mb():
+    """High-water mark of this process's RSS so far (not of the current stage)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _child_cpu_seconds():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class RunReport:
+    """Collects stage measurements for one run. Entering the same stage again adds to its totals."""
+
+    def __init__(self, command='run', profile_stages=None):
+        self.command = command
+        # Milliseconds and pid keep ids unique for runs started in the same second (e.g. worker jobs)
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}.{int(time.time() * 1000) % 1000:03d}-{os.getpid()}"
+        self.started = time.perf_counter()
+        self.stages = {} # name -> measurements, in first-entered order
+        self.profile_stages = set(config.PROFILE_STAGES if profile_stages is None else profile_stages)
+        self._profilers = {}
+
+    @contextmanager
+    def stage(self, name, item_unit='items'):
+        """
+        Measures the enclosed block. The yielded dict takes counters set by the caller:
+        'items' (posts, clusters, ...) and 'bytes'.
+
+        The OS only reports the process's RSS high-water mark, so memory is recorded as
+        peak_rss_growth_mb, how far the stage raised that mark (0 if it stayed below an earlier
+        peak), and process_peak_rss_mb, the mark itself when the stage ended.
+        """
+        record = self.stages.setdefault(name, {
+            'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'child_cpu_seconds': 0.0,
+            'peak_rss_growth_mb': None, 'process_peak_rss_mb': None, 'items': 0, 'item_unit': item_unit, 'bytes': 0,
+        })
+        counters = {'items': 0, 'bytes': 0}
+        profiler = None
+        if name in self.profile_stages:
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        child_cpu_started = _child_cpu_seconds()
+        peak_rss_started = _peak_rss_mb()
+        try:
+            yield counters
+        finally:
+            if profiler:
+                profiler.disable()
+            record['calls'] += 1
+            record['wall_seconds'] += time.perf_counter() - wall_started
+            record['cpu_seconds'] += time.process_time() - cpu_started
+            record['child_cpu_seconds'] += _child_cpu_seconds() - child_cpu_started
+            peak_rss = _peak_rss_mb()
+            if peak_rss is not None:
+                record['peak_rss_growth_mb'] = (record['peak_rss_growth_mb'] or 0.0) + peak_rss - peak_rss_started
+                record['process_peak_rss_mb'] = peak_rss
+            record['items'] += counters['items']
+            record['bytes'] += counters['bytes']
+
+    def rows(self):
+        rows = []
+        for name, record in self.stages.items():
+            wall = record['wall_seconds']
+            rows.append({
+                'run_id': self.run_id,
+                'command': self.command,
+                'stage': name,
+                **{key: round(value, 4) if isinstance(value, float) else value for key, value in record.items()},
+                'items_per_second': round(record['items'] / wall, 2) if wall > 0 else None,
+            })
+        return rows
+
+    def write(self, report_dir=None, csv_path=None):
+        """Writes <report_dir>/run-<run_id>.json, appends one row per stage to the CSV, and dumps profiles."""
+        report_dir = report_dir or config.RUN_REPORT_DIR
+        csv_path = csv_path or config.RUN_REPORT_CSV
+        os.makedirs(report_dir, exist_ok=True)
+        rows = self.rows()
+        report_path = os.path.join(report_dir, f"run-{self.run_id}.json")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'run_id': self.run_id,
+                'command': self.command,
+                'total_wall_seconds': round(time.perf_counter() - self.started, 4),
+                'stages': rows,
+            }, f, ensure_ascii=False, indent=2)
+
+        write_header = not os.path.exists(csv_path)
+        if not write_header:
+            with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+                header = next(csv.reader(f), None)
+            if header != list(CSV_FIELDS):
+                # Columns changed since the file was started; keep the old rows apart
+                os.replace(csv_path, csv_path + '.old')
+                logging.info(f"Run report columns changed; moved the previous CSV to {csv_path}.old")
+                write_header = True
+        with open(csv_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+
+        for name, profiler in self._profilers.items():
+            profile_path = os.path.join(report_dir, f"run-{self.run_id}-{name}.prof")
+            profiler.dump_stats(profile_path)
+            logging.info(f"cProfile stats for stage {name}: {profile_path}")
+
+        for row in rows:
+            logging.info(f"Stage {row['stage']}: {row['wall_seconds']}s wall, {row['cpu_seconds']}s CPU, "
+                         f"{row['items']} {row['item_unit']} ({row['items_per_second']}/s), "
+                         f"peak RSS +{row['peak_rss_growth_mb']} MB (process high-water mark {row['process_peak_rss_mb']} MB)")
+        logging.info(f"Run report written to {report_path}")
+        return report_path
+
+_current = None
+
+def start_run(command='run', profile_stages=None):
+    """Starts a new run report and makes it the one stage() records into."""
+    global _current
+    _current = RunReport(command, profile_stages)
+    return _current
+
+def current_run():
+    """Returns the active run report, starting one if needed."""
+    return _current or start_run()
+
+def stage(name, item_unit='items'):
+    """Shortcut for current_run().stage(name, item_unit)."""
+    return current_run().stage(name, item_unit)
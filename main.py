@@ -1,36 +1,71 @@
+import time
+_IMPORT_STARTED = time.perf_counter() # Used to check that lightweight subcommands start quickly
 import config
 # Remove unused clean_text, preprocess_text, summarize_text imports if they exist
-# Keep publish_blog import if needed later
+import argparse
 import logging
 import os
 import json
-from fetch_conversations import fetch_conversations # Import the updated function
+import re
+import sys
+from fetch_conversations import fetch_conversations, thread_title # Import the updated function
+from batch_ingest import expand_thread_paths, parse_threads, group_thread_posts, thread_name
+import instrumentation
 # Remove single-topic selection import
 # from select_topic_posts import find_related_posts 
-from topic_cluster import cluster_posts_by_topic # <--- Import the clustering function
+# Heavy or network modules are imported by the steps that need them:
+#   topic_cluster / incremental_cluster (torch, BERTopic) in cluster_post_groups
+#   publish_blog (requests) in publish_drafts
 from format_output import generate_blog_html # <--- Import the HTML generator
-from publish_blog import publish_to_blog
-from config import API_URL, USERNAME, ATOMPUB_PASSWORD
 # Remove unused transformers import
 # from transformers import pipeline 
 
-# Ensure the logs directory exists
-os.makedirs('logs', exist_ok=True)
-# Ensure the data directory exists
-os.makedirs('data', exist_ok=True)
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+config.ensure_directories()
 
 logging.basicConfig(filename='logs/run.log', level=logging.INFO)
 
-def generate_cluster_title(cluster_posts):
-    """Generates a simple title based on the first post's content."""
+# Intermediate artifacts exchanged by the parse / cluster / render / publish subcommands
+PARSED_POSTS_ARTIFACT = os.path.join('data', 'parsed_posts.json')
+CLUSTERS_ARTIFACT = os.path.join('data', 'clusters.json')
+DRAFTS_ARTIFACT = os.path.join('data', 'drafts.json')
+HEAVY_MODULES = ('torch', 'transformers', 'sentence_transformers', 'bertopic', 'pandas')
+
+def save_artifact(path, payload):
+    """Writes an intermediate artifact as compact UTF-8 JSON (atomically)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logging.info(f"Saved {path}")
+
+def load_artifact(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+_LEADING_ANCHORS_RE = re.compile(r'^(?:\s*>>\d+(?:-\d+)?)+\s*')
+
+def generate_cluster_title(cluster_posts, details=None):
+    """
+    Generates a title for a cluster. With details from cluster_posts_by_topic(with_details=True),
+    uses the post nearest the topic's centroid (leading >>N anchors removed), or the topic's
+    keywords if that post is only anchors; otherwise falls back to the first post's content.
+    """
     if not cluster_posts:
         return "まとめ" # Default title
-    
-    first_post_text = cluster_posts[0].get('content_text', '')
+
+    title_text = ''
+    if details:
+        title_text = _LEADING_ANCHORS_RE.sub('', details.get('central_text') or '')
+        if not title_text and details.get('keywords'):
+            title_text = '・'.join(details['keywords'][:3])
+    if not title_text:
+        title_text = cluster_posts[0].get('content_text', '')
     # Take the first ~30 characters, trying to avoid partial words if possible
-    # This is a very basic strategy and can be improved
-    title_part = first_post_text[:30].strip()
-    if len(first_post_text) > 30:
+    title_part = title_text[:30].strip()
+    if len(title_text) > 30:
         # Try to backtrack to the last space if we cut mid-word
         last_space = title_part.rfind(' ')
         if last_space > 15: # Only backtrack if it makes sense
@@ -40,86 +75,373 @@ def generate_cluster_title(cluster_posts):
     # Return in the format "【LoL】Title here"
     return f"【LoL】{title_part}"
 
-def main():
-    # --- 1. Fetch/Parse from Local File ---
-    local_html_path = config.LOCAL_HTML_FILE # Get path from config
-    if not os.path.exists(local_html_path):
-        logging.error(f"Local HTML file not found: {local_html_path}")
-        logging.error("Please save the target 2chan thread page to this location first.")
-        return
+def load_post_groups(thread_sources=None, merge_threads=False, max_workers=None):
+    """
+    Parses the input thread(s) and returns a list of post lists, one per clustering run.
+    With no thread_sources the single file at config.LOCAL_HTML_FILE is used.
+    """
+    with instrumentation.stage('fetch_conversations', item_unit='posts') as counters:
+        post_groups = _parse_post_groups(thread_sources, merge_threads, max_workers)
+        counters['items'] = sum(len(posts) for posts in post_groups)
+    return post_groups
 
-    logging.info(f"Parsing posts from local file: {local_html_path}")
-    all_posts_data = fetch_conversations(local_html_path) # Use the function that reads local file
+def _parse_post_groups(thread_sources, merge_threads, max_workers):
+    if not thread_sources:
+        # --- 1. Fetch/Parse from Local File ---
+        local_html_path = config.LOCAL_HTML_FILE # Get path from config
+        if not os.path.exists(local_html_path):
+            logging.error(f"Local HTML file not found: {local_html_path}")
+            logging.error("Please save the target 2chan thread page to this location first.")
+            return []
 
-    if not all_posts_data:
-        logging.error("Failed to parse any posts from the local file.")
-        return
+        logging.info(f"Parsing posts from local file: {local_html_path}")
+        all_posts_data = fetch_conversations(local_html_path) # Use the function that reads local file
+        title = thread_title(local_html_path)
+        for post in all_posts_data:
+            post['thread'] = thread_name(local_html_path) # Same tag as batch mode; part of the publish fingerprint
+            post['thread_title'] = title # Tells consecutive threads saved to the same file apart (topic dedup)
+        return [all_posts_data] if all_posts_data else []
 
-    logging.info(f"Successfully parsed {len(all_posts_data)} posts.")
-    # Optional: Save the full parsed data if needed for debugging elsewhere
-    # full_parsed_path = os.path.join('data', 'fetched_posts.json')
-    # with open(full_parsed_path, 'w', encoding='utf-8') as f:
-    #     json.dump(all_posts_data, f, ensure_ascii=False, indent=2)
-    # logging.info(f"Saved all parsed posts to {full_parsed_path}")
+    # --- 1. Batch: Parse Every Thread File in Parallel ---
+    paths = expand_thread_paths(thread_sources)
+    if not paths:
+        logging.error(f"No thread HTML files found in: {thread_sources}")
+        return []
+    parsed_threads = parse_threads(paths, max_workers=max_workers)
+    return group_thread_posts(parsed_threads, merge_threads=merge_threads)
 
-    # --- 2. Cluster Posts into Topics ---
-    logging.info("Clustering posts into topics...")
-    # Call the updated function without DBSCAN parameters
-    topic_clusters = cluster_posts_by_topic(all_posts_data)
+def cluster_post_groups(post_groups, incremental=False):
+    """
+    Clusters each post group into topics.
 
-    if not topic_clusters:
-        logging.warning("No topic clusters identified. Exiting.")
-        return
+    Returns:
+        tuple: (topic_clusters, cluster_details) - all clusters in one list, and for each cluster the
+               title hints from cluster_posts_by_topic (with a 'topic_key' for incremental runs).
+    """
+    logging.info("Clustering posts into topics...")
+    topic_clusters = []
+    cluster_details = []
+    with instrumentation.stage('cluster_posts_by_topic', item_unit='posts') as counters:
+        counters['items'] = sum(len(posts) for posts in post_groups)
+        _cluster_each_group(post_groups, incremental, topic_clusters, cluster_details)
 
     logging.info(f"Identified {len(topic_clusters)} potential topic clusters.")
+    return topic_clusters, cluster_details
 
-    # --- Loop Through Clusters and Process Each --- 
+def _cluster_each_group(post_groups, incremental, topic_clusters, cluster_details):
+    """Appends the clusters (and their details) of every post group to the given lists."""
+    # Heavy imports (torch, BERTopic), only needed from here on
+    if incremental:
+        from incremental_cluster import cluster_new_posts
+    from topic_cluster import cluster_posts_by_topic
+    from topic_index import thread_identity
+    from reply_graph import complete_clusters
+    for posts in post_groups:
+        threads = {thread_identity(post) for post in posts}
+        if incremental and len(threads) > 1:
+            # Post numbers from different threads collide, so there is no "highest post seen" to track
+            logging.warning("Incremental clustering is not supported for merged threads; clustering from scratch.")
+            group_clusters, group_details = cluster_posts_by_topic(posts, with_details=True)
+        elif incremental:
+            thread_key = threads.pop() or thread_name(config.LOCAL_HTML_FILE)
+            group_clusters, group_details = cluster_new_posts(posts, thread_key, with_details=True)
+        else:
+            # Call the updated function without DBSCAN parameters
+            group_clusters, group_details = cluster_posts_by_topic(posts, with_details=True)
+        if config.REPLY_GRAPH_EXPAND:
+            # Pull in the posts each cluster answers and the short replies it got, in conversation order
+            group_clusters = complete_clusters(posts, group_clusters)
+        topic_clusters.extend(group_clusters)
+        cluster_details.extend(group_details)
+
+def render_clusters(topic_clusters, cluster_details=None):
+    """
+    Generates a title and HTML for each cluster (cluster_details: optional title hints, one per cluster).
+
+    With config.TOPIC_DEDUP_ENABLED, near-identical clusters are merged first and clusters already
+    published from another thread are dropped (see topic_index.dedupe_topics).
+
+    Returns:
+        list: Draft dicts (title, html, thread, post_numbers, fingerprint, plus the cluster's
+              embedding centroid when topic dedup is enabled).
+    """
+    from publish_journal import cluster_fingerprint
+    from topic_index import cluster_threads
+    centroids = [None] * len(topic_clusters)
+    if config.TOPIC_DEDUP_ENABLED and topic_clusters:
+        from topic_index import dedupe_topics # Embedding model only for posts not in the store
+        with instrumentation.stage('dedupe_topics', item_unit='clusters') as counters:
+            counters['items'] = len(topic_clusters)
+            topic_clusters, cluster_details, centroids = dedupe_topics(topic_clusters, cluster_details,
+                                                                       model_name=config.EMBEDDING_MODEL,
+                                                                       backend=config.EMBEDDING_BACKEND)
+    leads = [None] * len(topic_clusters)
+    if config.SUMMARIZE_CLUSTERS:
+        from summarize_text import summarize_clusters # transformers, only when summaries are enabled
+        with instrumentation.stage('summarize_clusters', item_unit='clusters') as counters:
+            leads = summarize_clusters(topic_clusters)
+            counters['items'] = len(topic_clusters)
+    drafts = []
     for i, cluster in enumerate(topic_clusters):
         cluster_id = i + 1 # Simple 1-based ID for logging/filenames
         logging.info(f"--- Processing Cluster {cluster_id} ({len(cluster)} posts) ---")
 
         # --- 3a. Generate Title for Cluster ---
         # Using a helper function for title generation
-        topic_title = generate_cluster_title(cluster)
+        topic_title = generate_cluster_title(cluster, cluster_details[i] if cluster_details else None)
         logging.info(f"Generated title: {topic_title}")
 
         # --- 3b. Generate Output HTML for Cluster ---
         # Pass the list of posts *for this cluster* and the generated title/keyword
         # Note: generate_blog_html uses the second arg for logging/placeholder only now
-        output_html = generate_blog_html(cluster, topic_title) 
-
-        # Save the generated HTML for review/debugging - Commented out
-        # Use cluster ID in filename to avoid overwrites
-        # output_html_path = os.path.join('data', f'blog_post_cluster_{cluster_id}.html')
-        # try:
-        #     with open(output_html_path, 'w', encoding='utf-8') as f:
-        #         f.write(output_html)
-        #     logging.info(f"Saved generated HTML fragment for cluster {cluster_id} to {output_html_path}")
-        # except Exception as e:
-        #     logging.error(f"Error saving generated HTML for cluster {cluster_id}: {e}")
-        #     continue # Skip to next cluster if saving fails
-
-        # print(f"Cluster {cluster_id}: Generated HTML for {len(cluster)} posts. Saved to {output_html_path}") # Commented out print
-
-        # --- 4a. Publish Cluster as Draft ---
-        logging.info(f"Attempting to publish blog post for cluster {cluster_id}...")
-        if not config.API_URL or not config.USERNAME or not config.ATOMPUB_PASSWORD:
-            logging.error("Livedoor API credentials missing. Skipping publish for cluster {cluster_id}.")
-            print(f"Error: Livedoor API credentials not found. Skipping publish for cluster {cluster_id}.")
-            continue # Skip to next cluster
-        else:
-            success = publish_to_blog(config.API_URL, config.USERNAME, config.ATOMPUB_PASSWORD, topic_title, output_html)
-            if success:
-                logging.info(f"Publishing successful for cluster {cluster_id}.")
-            else:
-                logging.error(f"Publishing failed for cluster {cluster_id}. Check logs.")
-        
-        # Optional: Add a small delay between posts?
-        # import time
-        # time.sleep(5) 
+        with instrumentation.stage('generate_blog_html', item_unit='clusters') as counters:
+            output_html = generate_blog_html(cluster, topic_title, lead=leads[i])
+            counters['items'] = 1
+            counters['bytes'] = len(output_html.encode('utf-8'))
+        draft = {
+            'title': topic_title,
+            'html': output_html,
+            'thread': ','.join(sorted({str(post.get('thread') or '') for post in cluster})),
+            'post_numbers': [post.get('number') for post in cluster],
+            'fingerprint': cluster_fingerprint(cluster),
+            'threads': cluster_threads(cluster), # Thread identities: journal and topic index matching
+        }
+        if cluster_details and cluster_details[i] and cluster_details[i].get('topic_key'):
+            draft['topic_key'] = cluster_details[i]['topic_key'] # Incremental topic: update its draft while it grows
+        if centroids[i] is not None and len(centroids[i]):
+            draft['centroid'] = [round(value, 6) for value in centroids[i].tolist()] # Indexed once published
+        drafts.append(draft)
+    return drafts
+
+def index_published_drafts(drafts):
+    """Adds the centroids of published drafts to the topic index, so later threads skip their topics."""
+    indexed = [draft for draft in drafts if draft.get('centroid')]
+    if not indexed:
+        return
+    from topic_index import TopicIndex
+    TopicIndex(config.EMBEDDING_MODEL, config.EMBEDDING_BACKEND).add(
+        [draft['centroid'] for draft in indexed],
+        [{'fingerprint': draft['fingerprint'], 'title': draft['title'], 'thread': draft['thread'],
+          'threads': draft.get('threads'), 'entry_id': draft.get('entry_id')} for draft in indexed])
+
+def publish_drafts(drafts):
+    """
+    Publishes the rendered drafts to Livedoor via AtomPub, several at a time.
+    Drafts already in the publish journal with the same content are skipped; changed ones
+    update their existing entry. Each success is journaled as soon as it completes.
+
+    Returns:
+        list: Per-cluster result dicts (status 'published', 'failed' or 'skipped'); empty if credentials are missing.
+    """
+    from publish_blog import publish_many # requests is only needed when publishing
+    from publish_journal import PublishJournal
+    config.warn_missing_credentials()
+    if not config.API_URL or not config.USERNAME or not config.ATOMPUB_PASSWORD:
+        logging.error(f"Livedoor API credentials missing. Skipping publish for {len(drafts)} clusters.")
+        print(f"Error: Livedoor API credentials not found. Skipping publish for {len(drafts)} clusters.")
+        return []
+
+    with PublishJournal() as journal:
+        to_send, already_published = journal.plan(drafts)
+        logging.info(f"Publish journal: {len(to_send)} new or changed clusters, {len(already_published)} unchanged.")
+
+        def journal_result(result):
+            if result['status'] == 'published':
+                journal.record(to_send[result['index']], result['entry_id'], result['edit_url'])
+
+        # --- 4a. Publish Clusters as Drafts ---
+        logging.info(f"Attempting to publish {len(to_send)} blog posts...")
+        with instrumentation.stage('publish_to_blog', item_unit='drafts') as counters:
+            sent = publish_many(config.API_URL, config.USERNAME, config.ATOMPUB_PASSWORD, to_send,
+                                on_result=journal_result)
+            published_drafts = [to_send[result['index']] for result in sent if result['status'] == 'published']
+            counters['items'] = len(published_drafts)
+            counters['bytes'] = sum(len(draft['html'].encode('utf-8')) for draft in published_drafts)
+    index_published_drafts([{**to_send[result['index']], 'entry_id': result['entry_id']}
+                            for result in sent if result['status'] == 'published'])
+
+    # Report in the original cluster order
+    results_by_fingerprint = {draft['fingerprint']: {'title': draft['title'], 'status': 'skipped', 'attempts': 0,
+                                                     'seconds': 0.0, 'entry_id': draft['entry_id'],
+                                                     'edit_url': draft['edit_url'], 'error': None}
+                              for draft in already_published}
+    for result in sent:
+        updated = bool(to_send[result['index']].get('edit_url'))
+        results_by_fingerprint[to_send[result['index']]['fingerprint']] = {**result, 'updated': updated}
+    results = []
+    for i, draft in enumerate(drafts):
+        result = {**results_by_fingerprint[draft['fingerprint']], 'index': i}
+        results.append(result)
+        cluster_id = i + 1
+        if result['status'] == 'published':
+            logging.info(f"Publishing successful for cluster {cluster_id} ({result['attempts']} attempt(s)).")
+        elif result['status'] == 'failed':
+            logging.error(f"Publishing failed for cluster {cluster_id}: {result['error']}. Check logs.")
+
+    # Per-cluster summary
+    for result in results:
+        status = 'updated' if result.get('updated') and result['status'] == 'published' else result['status']
+        print(f"  cluster {result['index'] + 1:>3}  {status:<9}  attempts={result['attempts']}  "
+              f"{result['seconds']:.2f}s  {result['title']}")
+    published = sum(1 for result in results if result['status'] == 'published')
+    skipped = sum(1 for result in results if result['status'] == 'skipped')
+    print(f"Published {published}/{len(results)} drafts ({skipped} already published).")
+    return results
+
+def publish_clusters(topic_clusters, cluster_details=None):
+    """Generates a title and HTML for each cluster and publishes it as a draft."""
+    publish_drafts(render_clusters(topic_clusters, cluster_details))
+
+def main(thread_sources=None, merge_threads=config.BATCH_MERGE_THREADS, max_workers=config.BATCH_MAX_WORKERS,
+         incremental=False, profile_stages=None):
+    """
+    Runs the parse -> cluster -> format -> publish pipeline in one process.
+
+    Args:
+        thread_sources (list): Optional files, directories or glob patterns of saved threads (batch mode).
+                               Defaults to the single config.LOCAL_HTML_FILE.
+        merge_threads (bool): In batch mode, cluster all threads together instead of one by one.
+        max_workers (int): In batch mode, number of parser processes.
+        incremental (bool): Keep each thread's fitted topic model between runs, assign only posts
+                            that are new since the last run, and process only topics that gained posts.
+        profile_stages (list): Stage names to run under cProfile (default config.PROFILE_STAGES).
+
+    Returns:
+        list: The topic clusters that were processed (empty if nothing was parsed or clustered).
+    """
+    # Each run gets its own stage report under logs/
+    report = instrumentation.start_run('run', profile_stages)
+    try:
+        return _run_pipeline(thread_sources, merge_threads, max_workers, incremental)
+    finally:
+        report.write()
+
+def _run_pipeline(thread_sources, merge_threads, max_workers, incremental):
+    post_groups = load_post_groups(thread_sources, merge_threads=merge_threads, max_workers=max_workers)
+
+    if not post_groups:
+        logging.error("Failed to parse any posts from the input file(s).")
+        return []
+
+    logging.info(f"Successfully parsed {sum(len(posts) for posts in post_groups)} posts in {len(post_groups)} group(s).")
+
+    # --- 2. Cluster Posts into Topics ---
+    topic_clusters, cluster_details = cluster_post_groups(post_groups, incremental=incremental)
+
+    if not topic_clusters:
+        logging.warning("No topic clusters identified. Exiting.")
+        return []
+
+    publish_clusters(topic_clusters, cluster_details)
 
     logging.info("Main script finished processing all clusters.")
+    return topic_clusters
+
+# --- CLI Subcommands ---
+def cmd_parse(args):
+    post_groups = load_post_groups(args.sources, merge_threads=args.merge, max_workers=args.workers)
+    save_artifact(args.out, {'groups': post_groups})
+    total_posts = sum(len(posts) for posts in post_groups)
+    print(f"Parsed {total_posts} posts in {len(post_groups)} group(s) -> {args.out}")
+
+    # parse must stay lightweight: report start-up cost and flag any heavy ML import that crept in
+    loaded_heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    logging.info(f"parse start-up (imports): {IMPORT_SECONDS:.3f}s, target {config.PARSE_STARTUP_TARGET_SECONDS}s")
+    if loaded_heavy:
+        logging.warning(f"parse imported heavy modules: {loaded_heavy}")
+    if IMPORT_SECONDS > config.PARSE_STARTUP_TARGET_SECONDS:
+        logging.warning(f"parse start-up {IMPORT_SECONDS:.3f}s exceeds target {config.PARSE_STARTUP_TARGET_SECONDS}s")
+    return 0 if post_groups else 1
+
+def cmd_cluster(args):
+    post_groups = load_artifact(args.input)['groups']
+    topic_clusters, cluster_details = cluster_post_groups(post_groups, incremental=args.incremental)
+    save_artifact(args.out, {'clusters': topic_clusters, 'details': cluster_details})
+    print(f"Found {len(topic_clusters)} clusters -> {args.out}")
+    return 0
+
+def cmd_render(args):
+    artifact = load_artifact(args.input)
+    drafts = render_clusters(artifact['clusters'], artifact.get('details'))
+    save_artifact(args.out, {'drafts': drafts})
+    print(f"Rendered {len(drafts)} drafts -> {args.out}")
+    return 0
+
+def cmd_publish(args):
+    drafts = load_artifact(args.input)['drafts']
+    results = publish_drafts(drafts)
+    if drafts and not results:
+        return 1 # Credentials missing
+    return 0 if all(result['status'] != 'failed' for result in results) else 1
+
+def cmd_run(args):
+    main(args.sources, merge_threads=args.merge, max_workers=args.workers, incremental=args.incremental,
+         profile_stages=args.profile)
+    return 0
+
+SUBCOMMANDS = ('run', 'parse', 'cluster', 'render', 'publish')
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Cluster saved 2chan threads into topics and publish them as Livedoor drafts.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_source_args(subparser):
+        subparser.add_argument('sources', nargs='*', help="Thread HTML files, directories or glob patterns (default: config.LOCAL_HTML_FILE)")
+        subparser.add_argument('--merge', action='store_true', default=config.BATCH_MERGE_THREADS, help="Cluster all threads together instead of per thread")
+        subparser.add_argument('--workers', type=int, default=config.BATCH_MAX_WORKERS, help="Number of parser processes in batch mode")
+
+    run_parser = subparsers.add_parser('run', help="Full pipeline in one process (default)")
+    add_source_args(run_parser)
+    run_parser.add_argument('--incremental', action='store_true', help="Only assign and publish posts that are new since the last run of each thread")
+    run_parser.set_defaults(func=cmd_run)
+
+    parse_parser = subparsers.add_parser('parse', help="Parse thread HTML into a posts artifact (no ML imports)")
+    add_source_args(parse_parser)
+    parse_parser.add_argument('--out', default=PARSED_POSTS_ARTIFACT)
+    parse_parser.set_defaults(func=cmd_parse)
+
+    cluster_parser = subparsers.add_parser('cluster', help="Cluster a posts artifact into topics")
+    cluster_parser.add_argument('--input', default=PARSED_POSTS_ARTIFACT)
+    cluster_parser.add_argument('--out', default=CLUSTERS_ARTIFACT)
+    cluster_parser.add_argument('--incremental', action='store_true', help="Only assign posts that are new since the last run of each thread")
+    cluster_parser.set_defaults(func=cmd_cluster)
+
+    render_parser = subparsers.add_parser('render', help="Render a clusters artifact into titled HTML drafts")
+    render_parser.add_argument('--input', default=CLUSTERS_ARTIFACT)
+    render_parser.add_argument('--out', default=DRAFTS_ARTIFACT)
+    render_parser.set_defaults(func=cmd_render)
+
+    publish_parser = subparsers.add_parser('publish', help="Publish a drafts artifact to Livedoor")
+    publish_parser.add_argument('--input', default=DRAFTS_ARTIFACT)
+    publish_parser.set_defaults(func=cmd_publish)
+
+    for subparser in (run_parser, cluster_parser):
+        # Same values as topic_cluster.CLUSTER_ENGINES (not imported here: it loads torch)
+        subparser.add_argument('--engine', choices=('bertopic', 'fast'), default=None,
+                               help="Clustering engine: BERTopic's UMAP + HDBSCAN, or the seeded PCA/SVD + HDBSCAN/k-means "
+                                    f"fast mode (default: {config.CLUSTER_ENGINE})")
+        subparser.add_argument('--time-window', type=float, metavar='MINUTES', default=None,
+                               help="Cluster sliding windows of this many minutes separately and merge topics across overlaps")
 
+    for subparser in (run_parser, parse_parser, cluster_parser, render_parser, publish_parser):
+        subparser.add_argument('--profile', action='append', metavar='STAGE', default=None,
+                               help="Write cProfile stats for this stage (e.g. cluster_posts_by_topic); repeatable")
+    return parser
 
 if __name__ == "__main__":
-    main()
+    argv = sys.argv[1:]
+    if not argv or (argv[0] not in SUBCOMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['run'] + argv # "python main.py [sources...]" keeps running the whole pipeline
+    args = build_arg_parser().parse_args(argv)
+    if getattr(args, 'engine', None):
+        config.CLUSTER_ENGINE = args.engine
+    if getattr(args, 'time_window', None):
+        config.TIME_WINDOW_MINUTES = args.time_window
+    if args.command == 'run':
+        sys.exit(args.func(args)) # main() writes its own run report
+    report = instrumentation.start_run(args.command, args.profile)
+    try:
+        exit_code = args.func(args)
+    finally:
+        report.write()
+    sys.exit(exit_code)
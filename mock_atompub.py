@@ -0,0 +1,140 @@
+# mock_atompub.py
+# Local stand-in for the Livedoor AtomPub endpoint, for trying out and benchmarking publishing
+# without touching the real blog. Point LIVEDOOR_API_URL at http://127.0.0.1:<port>/atom/article.
+import argparse
+import logging
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+
+class MockAtomPubServer(ThreadingHTTPServer):
+    """
+    Accepts AtomPub entries and answers like the real endpoint (201 + Location + entry XML).
+
+    Args:
+        latency (float): Seconds to wait before answering each request.
+        fail_rate (float): Probability of answering a request with 503 instead.
+        fail_first (int): Answer the first N requests with 503 (deterministic retry testing).
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, fail_rate=0.0, fail_first=0, seed=None):
+        super().__init__(address, _AtomPubHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_first = fail_first
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.entries = {} # entry id -> {'title', 'content', 'updated'}
+        self.requests_seen = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+class _AtomPubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logging.debug(f"mock_atompub: {format % args}")
+
+    def _begin(self):
+        server = self.server
+        with server.lock:
+            server.requests_seen += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            fail = server.requests_seen <= server.fail_first or server.random.random() < server.fail_rate
+        if server.latency:
+            time.sleep(server.latency)
+        return fail
+
+    def _end(self):
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+    def _reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_entry(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        entry = ET.fromstring(self.rfile.read(length))
+        return {
+            'title': entry.findtext(f'{{{ATOM_NS}}}title') or '',
+            'content': entry.findtext(f'{{{ATOM_NS}}}content') or '',
+            'updated': time.time(),
+        }
+
+    def _entry_xml(self, entry_id, entry):
+        edit_url = f"{self.server.base_url}/atom/article/{entry_id}"
+        root = ET.Element(f'{{{ATOM_NS}}}entry')
+        ET.SubElement(root, f'{{{ATOM_NS}}}id').text = f"tag:mock.atompub,2024:article-{entry_id}"
+        ET.SubElement(root, f'{{{ATOM_NS}}}title').text = entry['title']
+        ET.SubElement(root, f'{{{ATOM_NS}}}link', rel='edit', href=edit_url)
+        return edit_url, ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+    def do_POST(self):
+        try:
+            if self._begin():
+                self._reply(503, b'Service Unavailable')
+                return
+            entry = self._read_entry()
+            with self.server.lock:
+                entry_id = str(len(self.server.entries) + 1)
+                self.server.entries[entry_id] = entry
+            edit_url, body = self._entry_xml(entry_id, entry)
+            self._reply(201, body, {'Content-Type': 'application/atom+xml', 'Location': edit_url})
+        finally:
+            self._end()
+
+    def do_PUT(self):
+        try:
+            if self._begin():
+                self._reply(503, b'Service Unavailable')
+                return
+            entry_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+            if entry_id not in self.server.entries:
+                self._reply(404, b'Not Found')
+                return
+            entry = self._read_entry()
+            with self.server.lock:
+                self.server.entries[entry_id] = entry
+            _, body = self._entry_xml(entry_id, entry)
+            self._reply(200, body, {'Content-Type': 'application/atom+xml'})
+        finally:
+            self._end()
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Starts a MockAtomPubServer on a background thread and returns it (port=0 picks a free port)."""
+    server = MockAtomPubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Local stand-in for the Livedoor AtomPub endpoint.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds before each response")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--fail-first', type=int, default=0, help="Answer the first N requests with 503")
+    args = parser.parse_args()
+
+    mock = MockAtomPubServer((args.host, args.port), latency=args.latency, fail_rate=args.fail_rate,
+                             fail_first=args.fail_first)
+    print(f"Mock AtomPub endpoint: {mock.base_url}/atom/article")
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,117 @@
+# near_duplicates.py
+# Groups exact and near-duplicate posts (copypasta, AA, "草" spam) with MinHash over character
+# n-grams, so only one representative per group needs to be embedded and clustered.
+import logging
+import zlib
+import numpy as np
+import config
+from embedding_cache import normalize_text
+
+_MERSENNE_PRIME = np.uint64(4294967311) # Smallest prime above 2**32; (a * x + b) stays below 2**64
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+def char_ngrams(text, n):
+    """Returns the set of character n-grams of text (the whole text if it is shorter than n)."""
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def minhash_signatures(texts, num_perm, ngram, seed=1):
+    """Returns an (len(texts), num_perm) uint64 matrix of MinHash signatures over character n-grams."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        shingles = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in char_ngrams(text, ngram)), dtype=np.uint64)
+        # One vectorized (shingles x permutations) hash, minimum per permutation
+        hashed = (np.outer(shingles, a) + b) % _MERSENNE_PRIME & _MAX_HASH
+        signatures[row] = hashed.min(axis=0)
+    return signatures
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def _union(parent, i, j):
+    root_i, root_j = _find(parent, i), _find(parent, j)
+    if root_i != root_j:
+        # Lower index becomes the root, so the representative is the earliest post
+        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+def find_duplicate_groups(texts, threshold=None, num_perm=None, bands=None, ngram=None):
+    """
+    Maps every text to the representative of its duplicate group.
+
+    Exact duplicates (after NFKC/whitespace normalization) are grouped first; the remaining unique
+    texts are compared with MinHash + LSH banding, and candidate pairs whose estimated Jaccard
+    similarity reaches threshold are merged (transitively, via union-find).
+
+    Returns:
+        tuple: (representatives, stats). representatives[i] is the index of the earliest text in
+               text i's group; stats counts exact and near duplicates.
+    """
+    threshold = config.DEDUP_THRESHOLD if threshold is None else threshold
+    num_perm = num_perm or config.DEDUP_NUM_PERM
+    bands = bands or config.DEDUP_BANDS
+    ngram = ngram or config.DEDUP_NGRAM
+    rows_per_band = num_perm // bands
+
+    parent = list(range(len(texts)))
+    first_by_text = {}
+    unique = [] # Indices of the first occurrence of each normalized text
+    normalized = []
+    for i, text in enumerate(texts):
+        key = normalize_text(text)
+        if key in first_by_text:
+            parent[i] = first_by_text[key]
+        else:
+            first_by_text[key] = i
+            unique.append(i)
+            normalized.append(key)
+    exact_duplicates = len(texts) - len(unique)
+
+    if len(unique) > 1:
+        signatures = minhash_signatures(normalized, num_perm, ngram)
+        for band in range(bands):
+            band_rows = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            buckets = {}
+            for position, row in enumerate(band_rows):
+                buckets.setdefault(row.tobytes(), []).append(position)
+            for members in buckets.values():
+                # Compare against the bucket's first member only; union-find makes it transitive
+                head = members[0]
+                for other in members[1:]:
+                    if _find(parent, unique[head]) == _find(parent, unique[other]):
+                        continue
+                    if np.mean(signatures[head] == signatures[other]) >= threshold:
+                        _union(parent, unique[head], unique[other])
+
+    representatives = np.fromiter((_find(parent, i) for i in range(len(texts))), dtype=np.int64, count=len(texts))
+    groups = len(np.unique(representatives))
+    stats = {
+        'posts': len(texts),
+        'representatives': groups,
+        'exact_duplicates': exact_duplicates,
+        'near_duplicates': len(unique) - groups,
+    }
+    return representatives, stats
+
+def dedupe_texts(texts):
+    """
+    Reduces texts to one representative per duplicate group.
+
+    Returns:
+        tuple: (unique_positions, group_of) where texts[unique_positions[k]] is the k-th representative
+               and group_of[i] is the k of text i, so per-representative results map back as
+               results[group_of].
+    """
+    representatives, stats = find_duplicate_groups(texts)
+    unique_positions, group_of = np.unique(representatives, return_inverse=True)
+    saved = len(texts) - len(unique_positions)
+    logging.info(f"Near-duplicate filter: {len(texts)} posts -> {len(unique_positions)} representatives "
+                 f"({stats['exact_duplicates']} exact, {stats['near_duplicates']} near duplicates); "
+                 f"skipped embedding {saved} posts ({saved / max(len(texts), 1):.1%}).")
+    return unique_positions, group_of
@@ -0,0 +1,198 @@
+# onnx_embedder.py
+import argparse
+import json
+import logging
+import os
+import re
+import numpy as np
+import config
+
+ONNX_FP32_FILE = 'model.onnx'
+ONNX_INT8_FILE = 'model.int8.onnx'
+EXPORT_META_FILE = 'export.json'
+
+def export_dir_for(model_name, export_root=None):
+    """Returns the directory holding the ONNX export of model_name."""
+    return os.path.join(export_root or config.ONNX_EXPORT_DIR, re.sub(r'[^A-Za-z0-9_.-]', '_', model_name))
+
+def _pooling_settings(st_model):
+    """Reads the pooling mode and normalization from a loaded SentenceTransformer's module list."""
+    pooling_mode = None
+    normalize = False
+    for module in st_model:
+        name = type(module).__name__
+        if name == 'Pooling':
+            pooling_mode = getattr(module, 'pooling_mode', None)
+            if not isinstance(pooling_mode, str) and hasattr(module, 'get_pooling_mode_str'):
+                pooling_mode = module.get_pooling_mode_str() # Older sentence-transformers releases
+        elif name == 'Normalize':
+            normalize = True
+    if pooling_mode not in ('mean', 'cls'):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling_mode}")
+    return pooling_mode, normalize
+
+def export_quantized_model(model_name, output_dir):
+    """
+    Exports the transformer inside a sentence-transformers model to ONNX and writes an
+    int8 dynamically quantized copy next to it, plus the tokenizer and pooling settings.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    logging.info(f"Exporting {model_name} to ONNX in {output_dir}...")
+    st_model = SentenceTransformer(model_name, device='cpu')
+    pooling_mode, normalize = _pooling_settings(st_model)
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    sample = tokenizer(["エクスポート用のサンプル文です"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+    class _HiddenStates(torch.nn.Module):
+        """Returns only last_hidden_state so the graph has a single output."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, ONNX_FP32_FILE)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStates(transformer),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+
+    quantize_dynamic(fp32_path, os.path.join(output_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, EXPORT_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'input_names': input_names,
+            'pooling_mode': pooling_mode,
+            'normalize': normalize,
+            'max_seq_length': st_model.max_seq_length,
+        }, f, ensure_ascii=False, indent=2)
+    logging.info(f"ONNX export finished: {os.path.join(output_dir, ONNX_INT8_FILE)}")
+
+class OnnxEmbedder:
+    """
+    CPU embedding backend running an int8-quantized ONNX export through ONNX Runtime.
+    Exposes a sentence-transformers style encode() so it can stand in for the PyTorch model.
+    """
+
+    def __init__(self, model_name, export_root=None, intra_op_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        model_dir = export_dir_for(model_name, export_root)
+        if not os.path.exists(os.path.join(model_dir, ONNX_INT8_FILE)):
+            export_quantized_model(model_name, model_dir)
+
+        with open(os.path.join(model_dir, EXPORT_META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.input_names = meta['input_names']
+        self.pooling_mode = meta['pooling_mode']
+        self.normalize = meta['normalize']
+        self.max_seq_length = meta['max_seq_length']
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(os.path.join(model_dir, ONNX_INT8_FILE), options,
+                                            providers=['CPUExecutionProvider'])
+        logging.info(f"Loaded ONNX int8 model for {model_name} (intra-op threads: {intra_op_threads or 'auto'})")
+
+    def _pool(self, hidden, attention_mask):
+        if self.pooling_mode == 'cls':
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        """Returns an (n, dim) float32 matrix of sentence embeddings for texts."""
+        if isinstance(texts, str):
+            texts = [texts]
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(list(texts[start:start + batch_size]), padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors='np')
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            batches.append(self._pool(hidden, encoded['attention_mask']))
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(batches).astype(np.float32)
+
+def check_backend_agreement(texts, model_name=config.EMBEDDING_MODEL, min_topic_size=6,
+                            tolerance=0.1, seed=42):
+    """
+    Embeds texts with the PyTorch and ONNX backends, clusters both with the same fixed-seed BERTopic
+    setup, and compares the topic assignments with the adjusted Rand index.
+
+    Returns:
+        dict: mean/min cosine similarity between the two embedding sets, the ARI, and 'passed'
+              (True when ARI >= 1 - tolerance).
+    """
+    from sklearn.metrics import adjusted_rand_score
+    from topic_cluster import embed_texts, fit_topic_model
+
+    torch_embeddings = embed_texts(texts, model_name=model_name, use_cache=False, backend='torch')
+    onnx_embeddings = embed_texts(texts, model_name=model_name, use_cache=False, backend='onnx')
+
+    def unit(matrix):
+        return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+    cosine = np.sum(unit(torch_embeddings) * unit(onnx_embeddings), axis=1)
+
+    _, torch_topics = fit_topic_model(texts, torch_embeddings, model_name, min_topic_size, backend='torch', seed=seed)
+    _, onnx_topics = fit_topic_model(texts, onnx_embeddings, model_name, min_topic_size, backend='onnx', seed=seed)
+    ari = adjusted_rand_score(torch_topics, onnx_topics)
+
+    result = {
+        'posts': len(texts),
+        'mean_cosine': float(cosine.mean()),
+        'min_cosine': float(cosine.min()),
+        'adjusted_rand_index': float(ari),
+        'tolerance': tolerance,
+        'passed': bool(ari >= 1 - tolerance),
+    }
+    logging.info(f"ONNX vs PyTorch backend check: {result}")
+    return result
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX and check it against PyTorch.")
+    parser.add_argument('--model', default=config.EMBEDDING_MODEL)
+    parser.add_argument('--export', action='store_true', help="(Re-)export and quantize the model")
+    parser.add_argument('--check', metavar='THREAD_HTML', help="Compare topic assignments of both backends on this thread")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Allowed 1 - ARI between the two backends")
+    args = parser.parse_args()
+
+    if args.export:
+        export_quantized_model(args.model, export_dir_for(args.model))
+    if args.check:
+        from fetch_conversations import fetch_conversations
+        from topic_cluster import filter_posts_for_clustering
+        _, check_texts = filter_posts_for_clustering(fetch_conversations(args.check), min_post_length=8)
+        outcome = check_backend_agreement(check_texts, model_name=args.model, tolerance=args.tolerance)
+        print(json.dumps(outcome, indent=2))
+        raise SystemExit(0 if outcome['passed'] else 1)
@@ -0,0 +1,87 @@
+# post_cache.py
+import hashlib
+import logging
+import os
+import pickle
+import time
+import zlib
+import config
+
+CACHE_FILE_SUFFIX = '.posts'
+COMPRESSION_LEVEL = 1 # zlib level for the pickled posts; low levels keep writes cheap
+
+def cache_key(data, parser_version):
+    """Returns the cache key for raw file bytes parsed by a given parser version."""
+    digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+    return f"{digest}-v{parser_version}"
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, key + CACHE_FILE_SUFFIX)
+
+def load_posts(key, cache_dir=None):
+    """Returns the cached post list for key, or None on a miss (or an unreadable entry)."""
+    path = _entry_path(key, cache_dir or config.POST_CACHE_DIR)
+    try:
+        with open(path, 'rb') as f:
+            posts = pickle.loads(zlib.decompress(f.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Discarding unreadable post cache entry {path}: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    os.utime(path) # Mark as recently used for age/size eviction
+    return posts
+
+def store_posts(key, posts, cache_dir=None):
+    """Writes posts to the cache (atomically) and evicts old entries."""
+    cache_dir = cache_dir or config.POST_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _entry_path(key, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(posts, protocol=pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"Could not write post cache entry {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    evict(cache_dir)
+
+def evict(cache_dir=None, max_bytes=None, max_age_days=None):
+    """Removes entries unused for max_age_days, then the least recently used ones until under max_bytes."""
+    cache_dir = cache_dir or config.POST_CACHE_DIR
+    max_bytes = config.POST_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_days = config.POST_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(CACHE_FILE_SUFFIX):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    cutoff = time.time() - max_age_days * 86400
+    entries.sort() # Oldest first
+    total_bytes = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_bytes -= size
+        removed += 1
+    if removed:
+        logging.info(f"Evicted {removed} post cache entries from {cache_dir}")
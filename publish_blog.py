@@ -1,69 +1,270 @@
 import requests
 import logging
+import threading
+import time
 import xml.etree.ElementTree as ET
-# config import is no longer needed here if called from main.py which imports config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+import config
 
-def publish_to_blog(api_url, username, atompub_password, title, content):
-    """Publishes content to a Livedoor blog using AtomPub."""
-    headers = {
-        'Content-Type': 'application/atom+xml'
-    }
-    
+ATOM_NS = "http://www.w3.org/2005/Atom"
+
+# Status codes worth retrying: the server (or a proxy in front of it) failed, not the request itself
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+# Creating an entry (POST) is not idempotent: after a 500/504 or a read timeout the draft may already
+# exist, so only failures where the request never reached Livedoor are retried
+CREATE_RETRY_STATUS_CODES = {502, 503}
+
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+def get_session(pool_size=None):
+    """
+    Returns the shared requests.Session, so all publishes reuse pooled keep-alive connections.
+    The connection pool is enlarged if a caller needs more concurrent connections than before.
+    """
+    global _session, _session_pool_size
+    pool_size = pool_size or config.PUBLISH_MAX_CONCURRENCY
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session_pool_size = pool_size
+        return _session
+
+class RateLimiter:
+    """Thread-safe limiter that spaces request starts at least 1/requests_per_second apart."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def build_entry_xml(title, content):
+    """Builds the AtomPub entry XML (as a string) for a draft post."""
     # Register app namespace for control elements
     ET.register_namespace('app', "http://www.w3.org/2007/app")
-    
+
     entry = ET.Element("entry", xmlns="http://www.w3.org/2005/Atom")
-    
+
     title_element = ET.SubElement(entry, "title")
     title_element.text = title
-    
+
     content_element = ET.SubElement(entry, "content", type="html")
     # Ensure content is properly escaped within CDATA or handled by ET
-    # Using text directly might be okay if content is simple HTML, 
+    # Using text directly might be okay if content is simple HTML,
     # but CDATA is safer for complex/user-generated HTML.
     # content_element.text = f"<![CDATA[{content}]]>"
     content_element.text = content # Keep simple for now, Livedoor might handle it
-    
+
     # Add app:control element for draft status
     # Need to use the namespace when creating the element tag
-    control = ET.SubElement(entry, "{http://www.w3.org/2007/app}control") 
+    control = ET.SubElement(entry, "{http://www.w3.org/2007/app}control")
     draft = ET.SubElement(control, "{http://www.w3.org/2007/app}draft")
     draft.text = "yes" # Post as draft first
     # draft.text = "no" # Post directly (not as draft)
-    
+
     # Convert XML Element Tree to string
     # Use xml_declaration=True for standard XML output
-    entry_xml_string = ET.tostring(entry, encoding='utf-8', method='xml', xml_declaration=True).decode('utf-8')
-    
-    logging.info(f'Publishing to API URL: {api_url}')
-    # Avoid logging password directly
-    logging.info(f'Using Username: {username}') 
-    logging.debug(f'XML Payload: {entry_xml_string}') # Log payload only in debug
-    
+    return ET.tostring(entry, encoding='utf-8', method='xml', xml_declaration=True).decode('utf-8')
+
+def _send_with_retries(method, url, body, auth, session, max_retries, backoff_seconds, timeout, rate_limiter=None):
+    """
+    Sends one AtomPub request, retrying with exponential backoff on 5xx responses, timeouts and
+    connection errors. 4xx responses are not retried. POST (entry creation) is only retried on
+    connection failures and 502/503; other server errors and read timeouts fail at once, since
+    the entry may have been created and a retry would duplicate it.
+
+    Returns:
+        tuple: (response or None, attempts made, error message or None, last HTTP status or None)
+    """
+    headers = {
+        'Content-Type': 'application/atom+xml'
+    }
+    error = None
+    status_code = None
+    idempotent = method != 'POST'
+    retry_status_codes = RETRY_STATUS_CODES if idempotent else CREATE_RETRY_STATUS_CODES
+    for attempt in range(1, max_retries + 2):
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            response = session.request(method, url, headers=headers, data=body, auth=auth, timeout=timeout)
+            status_code = response.status_code
+            if status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status() # Raise HTTPError for bad responses (4xx)
+                return response, attempt, None, status_code
+            error = f"HTTP {status_code}"
+            if status_code not in retry_status_codes:
+                return None, attempt, _outcome_unknown(url, error), status_code
+        except requests.exceptions.ConnectionError as e: # Includes ConnectTimeout
+            error = str(e)
+        except requests.exceptions.Timeout as e: # ReadTimeout: the request was sent
+            if not idempotent:
+                return None, attempt, _outcome_unknown(url, str(e)), status_code
+            error = str(e)
+        except requests.exceptions.RequestException as e:
+            return None, attempt, str(e), status_code # Client errors will not succeed on retry
+        if attempt <= max_retries:
+            delay = backoff_seconds * (2 ** (attempt - 1))
+            logging.warning(f"Publish attempt {attempt} failed ({error}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return None, max_retries + 1, error, status_code
+
+def _outcome_unknown(url, error):
+    """Logs and returns the error of a create request that may or may not have created the entry."""
+    logging.error(f"POST to {url} failed with {error} after it reached the server; not retrying. "
+                  f"The draft may have been created anyway: check the blog's drafts before publishing it again.")
+    return f"{error} (outcome unknown, check drafts)"
+
+def parse_entry_response(response):
+    """
+    Extracts the entry ID and edit URL from an AtomPub create/update response.
+    The edit URL comes from <link rel="edit">, falling back to the Location header.
+
+    Returns:
+        tuple: (entry_id or None, edit_url or None)
+    """
+    entry_id = None
+    edit_url = None
+    try:
+        entry = ET.fromstring(response.content)
+        entry_id = entry.findtext(f'{{{ATOM_NS}}}id')
+        for link in entry.iter(f'{{{ATOM_NS}}}link'):
+            if link.get('rel') == 'edit':
+                edit_url = link.get('href')
+                break
+    except ET.ParseError:
+        logging.warning("Could not parse the AtomPub response body as an entry.")
+    return entry_id, edit_url or response.headers.get('Location')
+
+def publish_to_blog(api_url, username, atompub_password, title, content, session=None,
+                    max_retries=None, rate_limiter=None):
+    """
+    Publishes content to a Livedoor blog using AtomPub.
+
+    Returns:
+        dict: On success, {'status', 'entry_id', 'edit_url', ...} for the created draft; None on failure.
+    """
+    result = _publish_entry(api_url, username, atompub_password, title, content, session=session,
+                            max_retries=max_retries, rate_limiter=rate_limiter)
+    return result if result['status'] == 'published' else None
+
+def update_blog_entry(edit_url, username, atompub_password, title, content, session=None,
+                      max_retries=None, rate_limiter=None):
+    """Replaces an existing entry (draft) in place via PUT to its edit URL. Same return value as publish_to_blog."""
+    result = _publish_entry(None, username, atompub_password, title, content, session=session,
+                            max_retries=max_retries, rate_limiter=rate_limiter, edit_url=edit_url)
+    return result if result['status'] == 'published' else None
+
+def _publish_entry(api_url, username, atompub_password, title, content, session=None,
+                   max_retries=None, rate_limiter=None, edit_url=None):
+    """
+    Publishes one draft (POST to api_url, or PUT to edit_url to update an existing entry) and returns
+    a result dict (status, http_status, attempts, error, seconds, entry_id, edit_url).
+    """
+    started = time.perf_counter()
     try:
-        response = requests.post(
-            api_url, 
-            headers=headers, 
-            data=entry_xml_string.encode('utf-8'), # Ensure UTF-8 encoding for the request body
-            auth=(username, atompub_password),
-            timeout=30 # Add a timeout
-        )
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        
-        logging.info(f'Response Status Code: {response.status_code}')
-        logging.info(f'Response Text: {response.text[:500]}...') # Log truncated response
-        print(f'Post published successfully as draft! Status: {response.status_code}')
-        return True # Indicate success
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f'Failed to publish post due to network error: {e}')
-        print(f'Failed to publish post: {e}')
+        entry_xml_string = build_entry_xml(title, content)
     except Exception as e:
         # Catch other potential errors like XML building issues
-        logging.error(f'An unexpected error occurred during publishing: {e}')
-        print(f'An unexpected error occurred: {e}')
-        
-    return False # Indicate failure
+        logging.error(f'An unexpected error occurred while building the entry for "{title}": {e}')
+        return {'status': 'failed', 'http_status': None, 'attempts': 0, 'error': str(e), 'seconds': 0.0,
+                'entry_id': None, 'edit_url': edit_url}
+
+    method, target_url = ('PUT', edit_url) if edit_url else ('POST', api_url)
+    logging.info(f'Publishing to API URL: {target_url} ({method})')
+    # Avoid logging password directly
+    logging.info(f'Using Username: {username}')
+    logging.debug(f'XML Payload: {entry_xml_string}') # Log payload only in debug
+
+    response, attempts, error, http_status = _send_with_retries(
+        method, target_url,
+        entry_xml_string.encode('utf-8'), # Ensure UTF-8 encoding for the request body
+        (username, atompub_password),
+        session or get_session(),
+        config.PUBLISH_MAX_RETRIES if max_retries is None else max_retries,
+        config.PUBLISH_BACKOFF_SECONDS,
+        config.PUBLISH_TIMEOUT_SECONDS,
+        rate_limiter,
+    )
+    seconds = time.perf_counter() - started
+    if response is None:
+        logging.error(f'Failed to publish post "{title}" after {attempts} attempt(s): {error}')
+        return {'status': 'failed', 'http_status': http_status, 'attempts': attempts, 'error': error,
+                'seconds': seconds, 'entry_id': None, 'edit_url': edit_url}
+
+    # No per-post print: drafts finish concurrently, so the caller prints one summary in draft order
+    logging.info(f'Post "{title}" published as draft. Status: {response.status_code}')
+    logging.debug(f'Response Text: {response.text[:500]}...') # Log truncated response
+    entry_id, returned_edit_url = parse_entry_response(response)
+    return {'status': 'published', 'http_status': response.status_code, 'attempts': attempts,
+            'error': None, 'seconds': seconds, 'entry_id': entry_id, 'edit_url': returned_edit_url or edit_url}
+
+def publish_many(api_url, username, atompub_password, drafts, max_concurrency=None, requests_per_second=None,
+                 max_retries=None, on_result=None):
+    """
+    Publishes several drafts concurrently over the shared session.
+
+    Args:
+        drafts (list): Dicts with 'title' and 'html'. Drafts with an 'edit_url' update that entry
+                       instead of creating a new one (and are re-created if it no longer exists).
+        max_concurrency (int): Maximum number of requests in flight (default config.PUBLISH_MAX_CONCURRENCY).
+        requests_per_second (float): Cap on request starts per second, retries included
+                                     (default config.PUBLISH_REQUESTS_PER_SECOND; 0/None = no cap).
+        max_retries (int): Retries per draft on 5xx/timeouts (default config.PUBLISH_MAX_RETRIES).
+        on_result (callable): Called in the calling thread with each result as soon as it completes,
+                              e.g. to journal it before the remaining drafts finish.
+
+    Returns:
+        list: One result dict per draft, in input order, with 'index' and 'title' added.
+    """
+    max_concurrency = max_concurrency or config.PUBLISH_MAX_CONCURRENCY
+    if requests_per_second is None:
+        requests_per_second = config.PUBLISH_REQUESTS_PER_SECOND
+    session = get_session(max_concurrency)
+    rate_limiter = RateLimiter(requests_per_second)
+
+    def publish_one(index):
+        draft = drafts[index]
+        result = _publish_entry(api_url, username, atompub_password, draft['title'], draft['html'],
+                                session=session, max_retries=max_retries, rate_limiter=rate_limiter,
+                                edit_url=draft.get('edit_url'))
+        if draft.get('edit_url') and result['http_status'] in (404, 410):
+            # The draft was deleted on the blog side; create it again
+            logging.warning(f"Entry {draft['edit_url']} no longer exists; publishing \"{draft['title']}\" as new.")
+            result = _publish_entry(api_url, username, atompub_password, draft['title'], draft['html'],
+                                    session=session, max_retries=max_retries, rate_limiter=rate_limiter)
+        return {'index': index, 'title': draft['title'], **result}
+
+    started = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [executor.submit(publish_one, index) for index in range(len(drafts))]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    results.sort(key=lambda result: result['index'])
+    published = sum(1 for result in results if result['status'] == 'published')
+    logging.info(f"Published {published}/{len(drafts)} drafts in {time.perf_counter() - started:.2f}s "
+                 f"(concurrency {max_concurrency}, {requests_per_second or 'unlimited'} req/s)")
+    return results
 
 # Remove the old test block
 # if __name__ == '__main__':
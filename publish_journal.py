@@ -0,0 +1,195 @@
+# publish_journal.py
+# Durable record of which clusters have already been published, so a crashed or repeated run
+# does not post the same cluster twice.
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS published (
+    fingerprint TEXT PRIMARY KEY,
+    thread TEXT,
+    post_numbers TEXT,
+    content_hash TEXT,
+    title TEXT,
+    entry_id TEXT,
+    edit_url TEXT,
+    published_at REAL,
+    updated_at REAL,
+    threads TEXT,
+    topic_key TEXT
+)
+"""
+_COLUMNS = ('fingerprint', 'thread', 'post_numbers', 'content_hash', 'title', 'entry_id', 'edit_url',
+            'published_at', 'updated_at', 'threads', 'topic_key')
+_ADDED_COLUMNS = ('threads', 'topic_key') # Added to journals created by earlier versions
+
+def cluster_fingerprint(posts, default_thread=''):
+    """
+    Stable identity of a cluster: its sorted post numbers plus the thread they came from.
+    Posts of merged threads are keyed by (thread, number) so equal numbers don't collide.
+    """
+    members = sorted((str(post.get('thread') or default_thread), int(post.get('number', 0))) for post in posts)
+    key = '\n'.join(f"{thread}:{number}" for thread, number in members)
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+def post_overlap(numbers_a, numbers_b):
+    """Jaccard similarity of two collections of post numbers."""
+    a, b = set(numbers_a), set(numbers_b)
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+def _draft_threads(draft):
+    return set(draft.get('threads') or str(draft.get('thread') or '').split(','))
+
+def _entry_threads(entry):
+    # Rows written before 'threads' was recorded only have the joined thread tags
+    return set(entry['threads'].split('\n') if entry.get('threads') else str(entry.get('thread') or '').split(','))
+
+def content_hash(title, html):
+    """Hash of what would be sent, used to tell whether an already published cluster changed."""
+    return hashlib.blake2b(f"{title}\n{html}".encode('utf-8'), digest_size=16).hexdigest()
+
+class PublishJournal:
+    """
+    SQLite journal of published clusters keyed by cluster_fingerprint.
+    Each row keeps the AtomPub entry ID and edit URL returned when the draft was created, and the
+    thread identities of its posts (draft['threads'], one per line) and, for incremental topics,
+    the topic key that identifies the topic while it grows (draft['topic_key']).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.PUBLISH_JOURNAL_PATH
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(_SCHEMA)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(published)")}
+        for column in _ADDED_COLUMNS:
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE published ADD COLUMN {column} TEXT")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, fingerprint):
+        """Returns the journal row for fingerprint as a dict, or None if it was never published."""
+        row = self.connection.execute(f"SELECT {', '.join(_COLUMNS)} FROM published WHERE fingerprint = ?",
+                                      (fingerprint,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row is not None else None
+
+    def lookup_topic(self, topic_key):
+        """Returns the latest journal row published for an incremental topic key, or None."""
+        row = self.connection.execute(f"SELECT {', '.join(_COLUMNS)} FROM published WHERE topic_key = ? "
+                                      f"ORDER BY updated_at DESC LIMIT 1", (topic_key,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row is not None else None
+
+    def entries(self):
+        """Returns every journal row as a dict."""
+        return [dict(zip(_COLUMNS, row)) for row in self.connection.execute(f"SELECT {', '.join(_COLUMNS)} FROM published")]
+
+    def record(self, draft, entry_id, edit_url):
+        """
+        Records (or refreshes) a successfully published draft. Committed immediately.
+        A draft matched to the entry of an earlier version of its cluster (draft['journal_fingerprint'],
+        see plan) replaces that row.
+        """
+        now = time.time()
+        previous_fingerprint = draft.get('journal_fingerprint') or draft['fingerprint']
+        previous = self.lookup(previous_fingerprint)
+        if previous_fingerprint != draft['fingerprint']:
+            self.connection.execute("DELETE FROM published WHERE fingerprint = ?", (previous_fingerprint,))
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO published ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            (draft['fingerprint'], draft.get('thread'), ','.join(str(n) for n in draft.get('post_numbers', [])),
+             content_hash(draft['title'], draft['html']), draft['title'],
+             entry_id or (previous or {}).get('entry_id'), edit_url or (previous or {}).get('edit_url'),
+             previous['published_at'] if previous else now, now, '\n'.join(sorted(_draft_threads(draft))),
+             draft.get('topic_key')))
+        self.connection.commit()
+
+    def _match_changed(self, drafts, min_overlap, claimed=()):
+        """
+        For drafts with no journal row of their own, finds the row of an earlier version of the same
+        cluster: same threads, and post numbers overlapping by at least min_overlap (Jaccard).
+        The best-overlapping pairs are matched first and every row is used at most once; rows in
+        claimed (fingerprints already matched to other drafts) are not considered.
+
+        Returns:
+            dict: draft position -> journal row.
+        """
+        if not drafts:
+            return {}
+        taken = {draft['fingerprint'] for draft in drafts} | set(claimed)
+        rows = [row for row in self.entries() if row['fingerprint'] not in taken]
+        rows_by_threads = {}
+        for row_position, row in enumerate(rows):
+            rows_by_threads.setdefault(frozenset(_entry_threads(row)), []).append(row_position)
+        candidates = []
+        for position, draft in enumerate(drafts):
+            numbers = draft.get('post_numbers', [])
+            for row_position in rows_by_threads.get(frozenset(_draft_threads(draft)), ()):
+                row = rows[row_position]
+                overlap = post_overlap(numbers, (int(n) for n in row['post_numbers'].split(',') if n))
+                if overlap >= min_overlap:
+                    candidates.append((overlap, position, row_position))
+        matches, used_rows = {}, set()
+        for overlap, position, row_position in sorted(candidates, key=lambda c: -c[0]):
+            if position not in matches and row_position not in used_rows:
+                matches[position] = rows[row_position]
+                used_rows.add(row_position)
+        return matches
+
+    def plan(self, drafts, min_overlap=None):
+        """
+        Splits drafts into work to do and work already done.
+
+        A draft whose exact post set was never published is matched to the entry of an earlier
+        version of its cluster: the entry of the same incremental topic (draft['topic_key']), or else
+        an entry of the same threads whose post numbers overlap by at least min_overlap (Jaccard,
+        default config.PUBLISH_MATCH_OVERLAP), so a cluster that gained or lost posts updates its draft.
+
+        Returns:
+            tuple: (to_send, skipped). to_send holds new drafts and drafts whose content changed since
+                   they were published (the latter with 'edit_url' set so they are updated in place, and
+                   'journal_fingerprint' when matched by overlap); skipped holds drafts that were
+                   published with identical content.
+        """
+        min_overlap = config.PUBLISH_MATCH_OVERLAP if min_overlap is None else min_overlap
+        drafts = list(drafts)
+        entries = [self.lookup(draft['fingerprint']) for draft in drafts]
+        for i, draft in enumerate(drafts):
+            if entries[i] is None and draft.get('topic_key'):
+                entry = self.lookup_topic(draft['topic_key'])
+                if entry is not None:
+                    entries[i] = entry
+                    drafts[i] = {**draft, 'journal_fingerprint': entry['fingerprint']}
+        unmatched = [i for i, entry in enumerate(entries) if entry is None]
+        claimed = {entry['fingerprint'] for entry in entries if entry is not None}
+        for position, entry in self._match_changed([drafts[i] for i in unmatched], min_overlap, claimed).items():
+            i = unmatched[position]
+            entries[i] = entry
+            drafts[i] = {**drafts[i], 'journal_fingerprint': entry['fingerprint']}
+            logging.info(f"Cluster {drafts[i]['fingerprint']} matches published cluster {entry['fingerprint']} "
+                         f"('{entry['title']}'); updating that draft.")
+        to_send, skipped = [], []
+        for draft, entry in zip(drafts, entries):
+            if entry is None:
+                to_send.append(draft)
+            elif entry['content_hash'] == content_hash(draft['title'], draft['html']):
+                skipped.append({**draft, 'entry_id': entry['entry_id'], 'edit_url': entry['edit_url']})
+            elif entry['edit_url']:
+                to_send.append({**draft, 'edit_url': entry['edit_url']})
+            else:
+                # Published before, but the server gave no edit URL: cannot update in place
+                logging.warning(f"Cluster {draft['fingerprint']} changed but has no edit URL; skipping.")
+                skipped.append({**draft, 'entry_id': entry['entry_id'], 'edit_url': None})
+        return to_send, skipped
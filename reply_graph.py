@@ -0,0 +1,141 @@
+# reply_graph.py
+# Reply-graph index over a thread's posts, used to complete topic clusters with the posts
+# they answer and the short replies they received, and to order them as a conversation.
+import logging
+import numpy as np
+import config
+
+class ReplyGraph:
+    """
+    Reply edges between posts stored as CSR arrays over post positions (0..n-1 in the posts list).
+
+    parent_indptr/parent_indices: for post i, the posts it replies to are
+        parent_indices[parent_indptr[i]:parent_indptr[i + 1]]
+    child_indptr/child_indices: the reverse edges (replies received), in post order.
+
+    Posts of merged threads are told apart by their 'thread' tag; an anchor only links to an
+    earlier post of the same thread, so the graph has no cycles.
+    """
+
+    def __init__(self, posts):
+        self.posts = posts
+        count = len(posts)
+        threads = [post.get('thread') for post in posts]
+        numbers = np.fromiter((int(post.get('number') or 0) for post in posts), dtype=np.int64, count=count)
+
+        # (thread, number) -> position via one dense array per thread: O(1) lookups, no dict per post
+        self._position_tables = {}
+        for thread in set(threads):
+            thread_mask = np.fromiter((t == thread for t in threads), dtype=bool, count=count)
+            positions = np.flatnonzero(thread_mask)
+            table = np.full(int(numbers[positions].max()) + 1 if len(positions) else 1, -1, dtype=np.int64)
+            table[numbers[positions]] = positions # Later duplicates win; _finalize_posts already dedups numbers
+            self._position_tables[thread] = table
+
+        sources = []
+        targets = []
+        for position, post in enumerate(posts):
+            table = self._position_tables[threads[position]]
+            number = numbers[position]
+            for target_number in set(post.get('replies_to') or ()):
+                if 0 < target_number < number and target_number < len(table) and table[target_number] >= 0:
+                    sources.append(position)
+                    targets.append(table[target_number])
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        self.parent_indptr, self.parent_indices = self._to_csr(sources, targets, count)
+        self.child_indptr, self.child_indices = self._to_csr(targets, sources, count)
+        self.text_lengths = np.fromiter((len(post.get('content_text', '')) for post in posts), dtype=np.int64, count=count)
+        self.threads = threads
+        logging.info(f"Built reply graph: {count} posts, {len(sources)} reply edges.")
+
+    @staticmethod
+    def _to_csr(rows, columns, count):
+        order = np.lexsort((columns, rows))
+        indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=count), out=indptr[1:])
+        return indptr, columns[order]
+
+    def position_of(self, post):
+        """Returns the position of post in the graph, or -1 if it is not part of it."""
+        table = self._position_tables.get(post.get('thread'))
+        number = int(post.get('number') or 0)
+        if table is None or not 0 <= number < len(table):
+            return -1
+        return int(table[number])
+
+    def parents(self, position):
+        return self.parent_indices[self.parent_indptr[position]:self.parent_indptr[position + 1]]
+
+    def children(self, position):
+        return self.child_indices[self.child_indptr[position]:self.child_indptr[position + 1]]
+
+    def expand(self, positions, parent_hops, reply_hops, short_reply_length):
+        """
+        Adds to a set of positions the posts they reply to (up to parent_hops levels up) and
+        the short replies they received (text shorter than short_reply_length, up to reply_hops levels down).
+        Longer replies are left to whatever topic they were clustered into.
+        """
+        members = set(positions)
+        frontier = list(members)
+        for _ in range(parent_hops):
+            frontier = [int(p) for position in frontier for p in self.parents(position) if int(p) not in members]
+            members.update(frontier)
+        frontier = list(members)
+        for _ in range(reply_hops):
+            frontier = [int(c) for position in frontier for c in self.children(position)
+                        if int(c) not in members and self.text_lengths[c] < short_reply_length]
+            members.update(frontier)
+        return members
+
+    def conversation_order(self, positions):
+        """
+        Orders positions as a conversation: each post is followed by its replies (depth-first, in post order).
+        A post replying to several members is placed under the first one visited.
+        """
+        members = set(positions)
+        ordered = []
+        visited = set()
+        roots = [position for position in sorted(members)
+                 if not any(int(parent) in members for parent in self.parents(position))]
+        for root in roots:
+            stack = [root]
+            while stack:
+                position = stack.pop()
+                if position in visited:
+                    continue
+                visited.add(position)
+                ordered.append(position)
+                # Push in reverse so the earliest reply is visited first
+                stack.extend(int(c) for c in self.children(position)[::-1] if int(c) in members and int(c) not in visited)
+        return ordered
+
+    def complete_cluster(self, cluster_posts, parent_hops=None, reply_hops=None, short_reply_length=None):
+        """Expands a cluster (list of post dicts) with parents and short replies and returns it in conversation order."""
+        parent_hops = config.REPLY_PARENT_HOPS if parent_hops is None else parent_hops
+        reply_hops = config.REPLY_CHILD_HOPS if reply_hops is None else reply_hops
+        short_reply_length = config.REPLY_SHORT_MAX_LENGTH if short_reply_length is None else short_reply_length
+
+        positions = [self.position_of(post) for post in cluster_posts]
+        if any(position < 0 for position in positions):
+            logging.warning("Cluster contains posts outside the reply graph; leaving it unchanged.")
+            return cluster_posts
+        members = self.expand(positions, parent_hops, reply_hops, short_reply_length)
+        return [self.posts[position] for position in self.conversation_order(members)]
+
+def complete_clusters(posts, topic_clusters, **options):
+    """Builds the reply graph for posts once and completes every cluster with it (see ReplyGraph.complete_cluster)."""
+    if not topic_clusters:
+        return topic_clusters
+    graph = ReplyGraph(posts)
+    completed = [graph.complete_cluster(cluster, **options) for cluster in topic_clusters]
+    added = sum(len(after) - len(before) for before, after in zip(topic_clusters, completed))
+    logging.info(f"Reply graph added {added} parent/short-reply posts to {len(completed)} clusters.")
+    return completed
+
+def order_conversation(posts):
+    """Returns the posts of one cluster in conversation order, using only the replies between them."""
+    posts = sorted(posts, key=lambda post: (str(post.get('thread') or ''), post.get('number') or 0)) # Positions in thread order
+    graph = ReplyGraph(posts)
+    return [posts[position] for position in graph.conversation_order(range(len(posts)))]
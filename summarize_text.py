@@ -1,26 +1,103 @@
-from transformers import pipeline
+import hashlib
+import json
 import logging
-import torch
+import os
+import config
 
+_summarizers = {} # model_name -> transformers pipeline, loaded once per process
 
-def summarize_text(text, summarizer):
-    summary = summarizer(text, max_length=150, min_length=30, do_sample=False)
-    return summary[0]['summary_text']
+def load_summarizer(model_name=None):
+    """Loads (once per process) the summarization pipeline."""
+    model_name = model_name or config.SUMMARY_MODEL
+    if model_name not in _summarizers:
+        # Heavy imports, only needed when summarization is enabled
+        import torch
+        from transformers import pipeline
+        device = 0 if torch.cuda.is_available() else -1  # Use GPU if available
+        logging.info(f'Loading summarization model {model_name}...')
+        _summarizers[model_name] = pipeline('summarization', model=model_name, device=device)
+    return _summarizers[model_name]
 
+def cluster_input_text(cluster_posts):
+    """Text fed to the summarizer for a cluster: its posts' text, one post per line."""
+    return '\n'.join(post.get('content_text', '') for post in cluster_posts if post.get('content_text'))
 
-if __name__ == '__main__':
-    model_name = 'tsmatz/mt5_summarize_japanese'
-    logging.info('Loading tokenizer and model...')
-    device = 0 if torch.cuda.is_available() else -1  # Use GPU if available
+def _cache_key(text, model_name):
+    settings = f"{model_name}|{config.SUMMARY_MAX_INPUT_TOKENS}|{config.SUMMARY_MAX_LENGTH}|{config.SUMMARY_MIN_LENGTH}"
+    return hashlib.blake2b(f"{settings}\n{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+def _load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable summary cache {path}: {e}")
+        return {}
+
+def _save_cache(path, cache):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def summarize_texts(texts, model_name=None, batch_size=None, use_cache=True, cache_path=None):
+    """
+    Summarizes texts in length-sorted batches, each input truncated to the model's window
+    (config.SUMMARY_MAX_INPUT_TOKENS). Summaries are cached by a hash of the input text and the
+    generation settings, so unchanged inputs are never summarized again.
+
+    Returns:
+        list: One summary string per text ('' for empty texts).
+    """
+    model_name = model_name or config.SUMMARY_MODEL
+    batch_size = batch_size or config.SUMMARY_BATCH_SIZE
+    cache_path = cache_path or config.SUMMARY_CACHE_FILE
+    cache = _load_cache(cache_path) if use_cache else {}
+
+    keys = [_cache_key(text, model_name) for text in texts]
+    missing = [i for i, text in enumerate(texts) if text and keys[i] not in cache]
+    logging.info(f"Summaries: {len(texts) - len(missing)} cached, {len(missing)} to generate.")
 
-    summarizer = pipeline('summarization', model=model_name, device=device)
+    if missing:
+        summarizer = load_summarizer(model_name)
+        tokenizer = summarizer.tokenizer
+        encoded = tokenizer([texts[i] for i in missing], truncation=True,
+                            max_length=config.SUMMARY_MAX_INPUT_TOKENS)['input_ids']
+        # Truncated inputs, decoded back to text so the pipeline sees at most the window
+        inputs = {i: tokenizer.decode(ids, skip_special_tokens=True) for i, ids in zip(missing, encoded)}
+        lengths = {i: len(ids) for i, ids in zip(missing, encoded)}
+
+        # Similar lengths share a batch, so little time goes to padding
+        ordered = sorted(missing, key=lambda i: lengths[i])
+        for start in range(0, len(ordered), batch_size):
+            batch = ordered[start:start + batch_size]
+            outputs = summarizer([inputs[i] for i in batch], max_length=config.SUMMARY_MAX_LENGTH,
+                                 min_length=config.SUMMARY_MIN_LENGTH, do_sample=False, batch_size=len(batch))
+            for i, output in zip(batch, outputs):
+                cache[keys[i]] = output['summary_text']
+            logging.info(f"Summarized {min(start + batch_size, len(ordered))}/{len(ordered)} inputs.")
+        if use_cache:
+            _save_cache(cache_path, cache)
+
+    return [cache.get(key, '') if text else '' for text, key in zip(texts, keys)]
+
+def summarize_clusters(topic_clusters, **options):
+    """Returns a lead-paragraph summary for each cluster (see summarize_texts for options)."""
+    return summarize_texts([cluster_input_text(cluster) for cluster in topic_clusters], **options)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     logging.info('Loading conversations...')
     with open('data/cleaned_conversations.txt', 'r', encoding='utf-8') as f:
         conversations = f.readlines()
 
     logging.info('Generating summaries...')
-    summaries = [summarize_text(conv, summarizer) for conv in conversations]
+    summaries = summarize_texts([conv.strip() for conv in conversations])
 
     logging.info('Saving summaries...')
     with open('data/summaries.txt', 'w', encoding='utf-8') as f:
@@ -0,0 +1,177 @@
+# sweep.py
+# Hyperparameter sweep around cluster_posts_by_topic. Embeddings and reduced vectors are computed
+# once; a grid of min_topic_size / min_post_length / clustering settings then runs in parallel
+# worker processes, and a table of topic counts, outlier rates and coherence per configuration
+# is printed and saved.
+#
+#   python sweep.py data/thread.html --min-topic-size 4 6 8 10 --min-post-length 4 8 16
+#   python sweep.py --input data/parsed_posts.json --engine bertopic fast --clusterer hdbscan kmeans
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import config
+
+SWEEP_RESULTS_CSV = os.path.join('logs', 'sweep.csv')
+RESULT_FIELDS = ('engine', 'clusterer', 'min_topic_size', 'min_post_length', 'posts', 'topics', 'outlier_rate',
+                 'largest_topic_share', 'coherence', 'silhouette', 'seconds')
+
+_reduced = {} # Worker processes: engine -> reduced vectors of every swept post (set by the pool initializer)
+
+def sweep_grid(min_topic_sizes, min_post_lengths, engines=('bertopic',), clusterers=('hdbscan',)):
+    """Returns the list of settings to try. The 'bertopic' engine always clusters with HDBSCAN."""
+    settings = []
+    for engine in engines:
+        for clusterer in (clusterers if engine == 'fast' else ('hdbscan',)):
+            for min_topic_size in min_topic_sizes:
+                for min_post_length in min_post_lengths:
+                    settings.append({'engine': engine, 'clusterer': clusterer, 'min_topic_size': min_topic_size,
+                                     'min_post_length': min_post_length})
+    return settings
+
+def reduce_once(embeddings, engine, seed):
+    """Fits the engine's reduction (seeded UMAP, or the fast engine's PCA/SVD) once on all swept posts."""
+    from topic_cluster import bertopic_reduction_model, fast_reduction_model
+    started = time.perf_counter()
+    reduction_model = fast_reduction_model(len(embeddings), seed=seed) if engine == 'fast' else bertopic_reduction_model(seed)
+    reduced = np.asarray(reduction_model.fit_transform(embeddings), dtype=np.float32)
+    logging.info(f"Sweep: {engine} reduction of {len(embeddings)} posts to {reduced.shape[1]} dimensions "
+                 f"in {time.perf_counter() - started:.2f}s")
+    return reduced
+
+def _init_sweep_worker(reduced):
+    _reduced.update(reduced)
+
+def _cluster_in_worker(engine, cluster_model, rows):
+    """Fits one (unfitted, pickled) cluster model on the selected rows of the reduced vectors."""
+    started = time.perf_counter()
+    labels = cluster_model.fit(_reduced[engine][rows]).labels_
+    return np.asarray(labels), time.perf_counter() - started
+
+def _cluster_model(setting, n_docs, seed):
+    # The clusterers fit_topic_model would use; sent to the workers unfitted
+    from topic_cluster import fast_cluster_model
+    if setting['engine'] == 'fast':
+        return fast_cluster_model(n_docs, setting['min_topic_size'], clusterer=setting['clusterer'], seed=seed)
+    from hdbscan import HDBSCAN
+    return HDBSCAN(min_cluster_size=setting['min_topic_size'], metric='euclidean', cluster_selection_method='eom')
+
+def score_labels(labels, unit_embeddings, reduced, seed=0, silhouette_sample=2000):
+    """
+    Scores one clustering.
+
+    Returns:
+        dict: topics, outlier_rate, largest_topic_share (of clustered posts), coherence (mean cosine
+              similarity of each clustered post to its topic's embedding centroid) and silhouette
+              (on the reduced vectors, sampled; None with fewer than two topics).
+    """
+    from sklearn.metrics import silhouette_score
+    inliers = np.flatnonzero(labels != -1)
+    topic_ids, row_topic, counts = np.unique(labels[inliers], return_inverse=True, return_counts=True)
+    scores = {'topics': len(topic_ids), 'outlier_rate': round(1 - len(inliers) / max(len(labels), 1), 4),
+              'largest_topic_share': None, 'coherence': None, 'silhouette': None}
+    if not len(inliers):
+        return scores
+    scores['largest_topic_share'] = round(counts.max() / len(inliers), 4)
+
+    centroids = np.zeros((len(topic_ids), unit_embeddings.shape[1]), dtype=np.float64)
+    np.add.at(centroids, row_topic, unit_embeddings[inliers])
+    centroids /= np.clip(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12, None)
+    scores['coherence'] = round(float(np.einsum('ij,ij->i', unit_embeddings[inliers], centroids[row_topic]).mean()), 4)
+
+    if 1 < len(topic_ids) < len(inliers):
+        scores['silhouette'] = round(float(silhouette_score(reduced[inliers], labels[inliers],
+                                                            sample_size=min(silhouette_sample, len(inliers)),
+                                                            random_state=seed)), 4)
+    return scores
+
+def run_sweep(posts_data, settings, model_name=config.EMBEDDING_MODEL, backend=config.EMBEDDING_BACKEND,
+              workers=None, seed=config.CLUSTER_SEED):
+    """
+    Runs every setting on posts_data and returns one result dict per setting (see RESULT_FIELDS).
+
+    Posts are filtered with the smallest min_post_length of the grid, embedded once (through the
+    embedding store) and reduced once per engine; each setting then clusters its own subset of rows
+    (posts at least its min_post_length long) in a worker process. Reductions are fitted on the
+    whole swept set, so results for larger min_post_length values can differ slightly from a full
+    run with that setting. Duplicate posts are not collapsed.
+    """
+    from topic_cluster import embed_texts, filter_posts_for_clustering
+    _, texts = filter_posts_for_clustering(posts_data, min(setting['min_post_length'] for setting in settings))
+    if not texts:
+        logging.warning("Sweep: no posts left after filtering.")
+        return []
+    lengths = np.array([len(text) for text in texts])
+    embeddings = embed_texts(texts, model_name=model_name, backend=backend)
+    unit_embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+    reduced = {engine: reduce_once(embeddings, engine, seed) for engine in dict.fromkeys(s['engine'] for s in settings)}
+
+    jobs = []
+    for setting in settings:
+        rows = np.flatnonzero(lengths >= setting['min_post_length'])
+        if len(rows) <= setting['min_topic_size']:
+            logging.warning(f"Sweep: skipping {setting}, only {len(rows)} posts.")
+            continue
+        jobs.append((setting, rows, _cluster_model(setting, len(rows), seed)))
+
+    started = time.perf_counter()
+    results = []
+    # spawn rather than fork: the parent has torch loaded (see topic_cluster._get_encode_pool)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_sweep_worker, initargs=(reduced,)) as pool:
+        futures = [pool.submit(_cluster_in_worker, setting['engine'], cluster_model, rows)
+                   for setting, rows, cluster_model in jobs]
+        for (setting, rows, _), future in zip(jobs, futures):
+            labels, seconds = future.result()
+            scores = score_labels(labels, unit_embeddings[rows], reduced[setting['engine']][rows], seed=seed)
+            results.append({**setting, 'posts': len(rows), **scores, 'seconds': round(seconds, 3)})
+    logging.info(f"Sweep: {len(results)} configurations clustered in {time.perf_counter() - started:.2f}s")
+    return results
+
+def print_results(results):
+    print(f"{'engine':<9} {'clusterer':<8} {'min_topic':>9} {'min_len':>7} {'posts':>6} {'topics':>6} "
+          f"{'outliers':>8} {'largest':>7} {'coherence':>9} {'silhouette':>10} {'seconds':>7}")
+    for row in results:
+        def show(value, width, fmt):
+            return f"{'-':>{width}}" if value is None else f"{value:{width}{fmt}}"
+        print(f"{row['engine']:<9} {row['clusterer']:<8} {row['min_topic_size']:>9} {row['min_post_length']:>7} "
+              f"{row['posts']:>6} {row['topics']:>6} {row['outlier_rate']:>8.1%} {show(row['largest_topic_share'], 7, '.1%')} "
+              f"{show(row['coherence'], 9, '.3f')} {show(row['silhouette'], 10, '.3f')} {row['seconds']:>7.2f}")
+
+def save_results(results, path=SWEEP_RESULTS_CSV):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep clustering settings on one thread, embedding and reducing it only once.")
+    parser.add_argument('sources', nargs='*', help="Thread HTML files, directories or glob patterns (default: config.LOCAL_HTML_FILE)")
+    parser.add_argument('--input', help="Use a posts artifact from 'main.py parse' instead of parsing sources")
+    parser.add_argument('--min-topic-size', nargs='+', type=int, default=[4, 6, 8, 10])
+    parser.add_argument('--min-post-length', nargs='+', type=int, default=[4, 8, 16])
+    parser.add_argument('--engine', nargs='+', choices=('bertopic', 'fast'), default=['bertopic'])
+    parser.add_argument('--clusterer', nargs='+', choices=('hdbscan', 'kmeans'), default=['hdbscan'],
+                        help="Clusterers tried with the fast engine")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--out', default=SWEEP_RESULTS_CSV)
+    args = parser.parse_args()
+
+    import main as pipeline # Sets up logging to logs/run.log
+    if args.input:
+        post_groups = pipeline.load_artifact(args.input)['groups']
+    else:
+        post_groups = pipeline.load_post_groups(args.sources, merge_threads=True)
+    posts_data = [post for posts in post_groups for post in posts]
+
+    settings = sweep_grid(args.min_topic_size, args.min_post_length, args.engine, args.clusterer)
+    print(f"Sweeping {len(settings)} configurations over {len(posts_data)} posts...")
+    results = run_sweep(posts_data, settings, workers=args.workers)
+    print_results(results)
+    print(f"\nResults saved to {save_results(results, args.out)}")
@@ -1,5 +1,10 @@
 # topic_cluster.py
+import atexit
 import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from sentence_transformers import SentenceTransformer # Still needed for specifying the model
 from bertopic import BERTopic
 import pandas as pd # BERTopic often works well with pandas DataFrames
@@ -7,30 +12,168 @@ import pandas as pd # BERTopic often works well with pandas DataFrames
 # import hdbscan 
 import numpy as np
 import torch # To check for GPU
+from bertopic.backend import BaseEmbedder
+from umap import UMAP
+import config
+from embedding_cache import EmbeddingStore
+from fetch_conversations import post_columns
+from near_duplicates import dedupe_texts
 
-def cluster_posts_by_topic(posts_data, 
-                           model_name='pkshatech/GLuCoSE-base-ja-v2', 
-                           min_topic_size=6,
-                           min_post_length=8):
+EMBEDDING_BACKENDS = ('torch', 'onnx')
+CLUSTER_ENGINES = ('bertopic', 'fast')
+_loaded_models = {} # (model_name, backend) -> model, so repeated calls in one process reuse the weights
+_encode_pools = {} # (model_name, backend, workers) -> ProcessPoolExecutor with the model loaded in every worker
+
+class _EncodeEmbedder(BaseEmbedder):
+    """Lets BERTopic call any model with a sentence-transformers style encode() (e.g. the ONNX backend)."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.embedding_model = model
+
+    def embed(self, documents, verbose=False):
+        return self.embedding_model.encode(list(documents), show_progress_bar=verbose)
+
+def load_embedding_model(model_name, backend=config.EMBEDDING_BACKEND):
     """
-    Clusters posts into topics using BERTopic.
+    Loads (once per process) the model used for embeddings.
+    backend='torch' uses sentence-transformers (GPU if available); backend='onnx' uses the
+    int8-quantized ONNX Runtime export from onnx_embedder (CPU).
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+    key = (model_name, backend)
+    if key not in _loaded_models:
+        if backend == 'onnx':
+            from onnx_embedder import OnnxEmbedder
+            _loaded_models[key] = OnnxEmbedder(model_name, intra_op_threads=config.ONNX_INTRA_OP_THREADS)
+        else:
+            # Determine device for sentence transformer embedding
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            logging.info(f"Loading embedding model {model_name} on device: {device}")
+            _loaded_models[key] = SentenceTransformer(model_name, device=device)
+    return _loaded_models[key]
 
-    Args:
-        posts_data (list): List of post dictionaries from fetch_conversations.
-        model_name (str): Name of the sentence-transformer model for BERTopic to use.
-        min_topic_size (int): The minimum size of a topic (passed to HDBSCAN internally).
-        min_post_length (int): Minimum character length for a post to be included in clustering.
+def bertopic_embedding_model(model_name, backend=config.EMBEDDING_BACKEND):
+    """Returns the loaded embedding model in a form BERTopic accepts without loading anything itself."""
+    model = load_embedding_model(model_name, backend)
+    return model if isinstance(model, SentenceTransformer) else _EncodeEmbedder(model)
+
+def _token_lengths(model, texts):
+    """Token counts per text (after truncation); falls back to character counts if the model has no tokenizer."""
+    tokenizer = getattr(model, 'tokenizer', None)
+    if tokenizer is None:
+        return [len(text) for text in texts]
+    max_length = getattr(model, 'max_seq_length', None)
+    encoded = tokenizer(list(texts), add_special_tokens=True, truncation=max_length is not None, max_length=max_length)
+    return [len(ids) for ids in encoded['input_ids']]
+
+def make_length_buckets(lengths, max_batch_tokens=config.EMBED_MAX_BATCH_TOKENS, max_batch_size=config.EMBED_MAX_BATCH_SIZE):
+    """
+    Sorts text indices by token length (longest first) and cuts them into dynamic batches whose
+    padded size (batch size x longest text) stays within max_batch_tokens.
 
     Returns:
-        list: A list of clusters. Each cluster is a list of post dictionaries.
-              Returns an empty list if no posts or no topics found (excluding outliers).
+        list: Batches, each a list of indices into the original texts.
     """
-    if not posts_data:
-        logging.warning("No posts provided for BERTopic clustering.")
-        return []
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    current = []
+    current_max = 0
+    for i in order:
+        # Padded cost if this text joins the batch (lengths only shrink, so the first is the longest)
+        padded_max = max(current_max, lengths[i])
+        if current and (len(current) >= max_batch_size or padded_max * (len(current) + 1) > max_batch_tokens):
+            batches.append(current)
+            current = []
+            padded_max = lengths[i]
+        current.append(i)
+        current_max = padded_max
+    if current:
+        batches.append(current)
+    return batches
 
-    # --- 1. Prepare and Filter Text Data --- 
-    filtered_posts_data = []
+def _init_encode_worker(model_name, backend, threads):
+    """Pool initializer: pins the per-process thread count and loads the model once per worker."""
+    torch.set_num_threads(threads)
+    config.ONNX_INTRA_OP_THREADS = threads
+    load_embedding_model(model_name, backend)
+
+def _encode_in_worker(model_name, backend, batch_texts):
+    model = load_embedding_model(model_name, backend)
+    return np.asarray(model.encode(batch_texts, batch_size=len(batch_texts), show_progress_bar=False,
+                                   convert_to_numpy=True), dtype=np.float32)
+
+def _get_encode_pool(model_name, backend, workers):
+    key = (model_name, backend, workers)
+    if key not in _encode_pools:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        logging.info(f"Starting encode pool: {workers} processes x {threads} threads for {model_name} ({backend})")
+        # spawn rather than fork: forking after torch has started its thread pool can deadlock the children
+        _encode_pools[key] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_encode_worker, initargs=(model_name, backend, threads))
+    return _encode_pools[key]
+
+@atexit.register
+def shutdown_encode_pools():
+    """Stops any encode worker processes started by this process."""
+    for pool in _encode_pools.values():
+        pool.shutdown(cancel_futures=True)
+    _encode_pools.clear()
+
+def encode_bucketed(texts, model_name=config.EMBEDDING_MODEL, backend=config.EMBEDDING_BACKEND,
+                    workers=config.EMBED_WORKERS):
+    """
+    Embeds texts in length-sorted dynamic batches so short posts are not padded to the length of
+    long ones, optionally spread over a pool of worker processes, and returns the vectors in the
+    original order. Throughput is logged as posts/sec.
+
+    Args:
+        texts (list): Texts to embed.
+        model_name (str): Embedding model name.
+        backend (str): 'torch' or 'onnx' (see load_embedding_model).
+        workers (int): Encode processes. 1 encodes in this process; None uses one per CPU core.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    started = time.perf_counter()
+    model = load_embedding_model(model_name, backend)
+    batches = make_length_buckets(_token_lengths(model, texts))
+    batch_texts = [[texts[i] for i in batch] for batch in batches]
+    workers = workers or os.cpu_count() or 1
+
+    if workers > 1 and len(batches) > 1:
+        pool = _get_encode_pool(model_name, backend, workers)
+        results = list(pool.map(_encode_in_worker, [model_name] * len(batches), [backend] * len(batches), batch_texts))
+    else:
+        results = [_encode_in_worker(model_name, backend, batch) for batch in batch_texts]
+
+    embeddings = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+    for batch, vectors in zip(batches, results):
+        embeddings[batch] = vectors # Scatter back to the original positions
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Embedded {len(texts)} posts in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} posts/sec, "
+                 f"{len(batches)} length-bucketed batches, {workers} process(es))")
+    return embeddings
+
+def embed_texts(texts, model_name=config.EMBEDDING_MODEL, use_cache=True, cache_dir=None,
+                backend=config.EMBEDDING_BACKEND, workers=config.EMBED_WORKERS):
+    """
+    Returns an (n, dim) embedding matrix for texts, computed with encode_bucketed.
+    With use_cache=True only texts missing from the on-disk EmbeddingStore are encoded.
+    Each backend gets its own store since quantized vectors differ slightly from fp32 ones.
+    """
+    def encode(batch_texts):
+        return encode_bucketed(batch_texts, model_name=model_name, backend=backend, workers=workers)
+
+    if not use_cache:
+        return encode(texts)
+    store_name = model_name if backend == 'torch' else f"{model_name}@{backend}"
+    return EmbeddingStore(store_name, cache_dir).get_or_compute(texts, encode)
+
+def filter_posts_for_clustering(posts_data, min_post_length):
+    """Returns (original_indices, texts) for posts long enough to be clustered."""
     original_indices = []
     texts = []
     initial_count = len(posts_data)
@@ -39,48 +182,285 @@ def cluster_posts_by_topic(posts_data,
     for i, post in enumerate(posts_data):
         text = post.get('content_text', '')
         if len(text) >= min_post_length:
-            filtered_posts_data.append(post) # Keep the post data if using it later
             original_indices.append(i)      # Store the *original* index
             texts.append(text)             # Store the text for BERTopic
     
     filtered_count = len(texts)
     logging.info(f"Removed {initial_count - filtered_count} short posts. Clustering {filtered_count} posts.")
+    return original_indices, texts
 
-    if not texts:
-        logging.warning("No posts remaining after filtering. Cannot perform clustering.")
-        return []
+def bertopic_reduction_model(seed):
+    """BERTopic's default UMAP settings with a fixed random_state, so the reduction is repeatable."""
+    return UMAP(n_neighbors=15, n_components=5, min_dist=0.0, metric='cosine', low_memory=False, random_state=seed)
 
-    # Determine device for sentence transformer embedding
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    logging.info(f"Attempting to use device: {device} for embeddings within BERTopic.")
+def fast_reduction_model(n_docs, reduction=None, components=None, seed=None):
+    """
+    The 'fast' engine's reduction: L2 normalization followed by PCA or TruncatedSVD (a linear
+    projection, fast and deterministic). Settings default to the FAST_* values in config.
+    """
+    from sklearn.decomposition import PCA, TruncatedSVD
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import Normalizer
+    reduction = reduction or config.FAST_REDUCTION
+    components = components or config.FAST_COMPONENTS
+    seed = config.CLUSTER_SEED if seed is None else seed
 
-    # --- 2. Initialize and Run BERTopic --- 
-    try:
-        logging.info(f"Initializing BERTopic with model: {model_name} and min_topic_size: {min_topic_size}")
-        
-        topic_model = BERTopic(
-            embedding_model=model_name, 
-            language="japanese", 
-            min_topic_size=min_topic_size,
-            verbose=True
-        )
-
-        logging.info("Running BERTopic fit_transform...")
-        # Pass *filtered* texts to fit_transform
-        topics, probs = topic_model.fit_transform(texts) 
-        
-        num_found_topics = len(set(topics)) - (1 if -1 in topics else 0)
-        num_outliers = list(topics).count(-1)
-        logging.info(f"BERTopic found {num_found_topics} topics and {num_outliers} outliers on filtered data.")
+    # Never ask for more components than the data can have
+    components = max(1, min(components, n_docs - 1))
+    if reduction == 'pca':
+        projection = PCA(n_components=components, random_state=seed)
+    elif reduction == 'svd':
+        projection = TruncatedSVD(n_components=components, random_state=seed)
+    else:
+        raise ValueError(f"Unknown fast reduction '{reduction}', expected 'pca' or 'svd'")
+    # Unit vectors, so euclidean distances in the projection follow cosine similarity
+    return make_pipeline(Normalizer(), projection)
 
-    except Exception as e:
-        logging.error(f"Error during BERTopic processing: {e}", exc_info=True)
-        return [] 
+def fast_cluster_model(n_docs, min_topic_size, clusterer=None, seed=None):
+    """The 'fast' engine's clusterer: HDBSCAN or MiniBatchKMeans (config.FAST_CLUSTERER by default)."""
+    from sklearn.cluster import MiniBatchKMeans
+    clusterer = clusterer or config.FAST_CLUSTERER
+    seed = config.CLUSTER_SEED if seed is None else seed
+    if clusterer == 'hdbscan':
+        from hdbscan import HDBSCAN
+        return HDBSCAN(min_cluster_size=min_topic_size, metric='euclidean',
+                       cluster_selection_method='eom', prediction_data=True)
+    if clusterer == 'kmeans':
+        n_clusters = config.FAST_KMEANS_CLUSTERS or int(np.sqrt(n_docs / 2))
+        n_clusters = max(2, min(n_clusters, n_docs // max(min_topic_size, 1)))
+        return MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=3, batch_size=min(1024, max(n_docs, 1)))
+    raise ValueError(f"Unknown fast clusterer '{clusterer}', expected 'hdbscan' or 'kmeans'")
 
-    if num_found_topics == 0:
-        logging.warning("BERTopic found no topics (excluding outliers). Returning empty list.")
-        return []
+def fast_engine_models(n_docs, min_topic_size, reduction=None, clusterer=None, components=None, seed=None):
+    """
+    Builds the reduction and clustering steps of the 'fast' engine, for BERTopic's umap_model and
+    hdbscan_model slots (see fast_reduction_model and fast_cluster_model).
+
+    Returns:
+        tuple: (reduction_model, cluster_model)
+    """
+    return (fast_reduction_model(n_docs, reduction, components, seed),
+            fast_cluster_model(n_docs, min_topic_size, clusterer, seed))
+
+def fit_topic_model(texts, embeddings, model_name, min_topic_size, backend=config.EMBEDDING_BACKEND, seed=None,
+                    engine=None):
+    """
+    Fits a BERTopic model on texts with precomputed embeddings. Returns (topic_model, topics).
+    With a seed, UMAP uses BERTopic's default settings plus that random_state so runs are repeatable.
+    engine='fast' swaps UMAP + HDBSCAN for the linear reduction and clusterer of fast_engine_models
+    (always seeded); topic words and transform() work the same. Defaults to config.CLUSTER_ENGINE.
+    """
+    engine = engine or config.CLUSTER_ENGINE
+    if engine not in CLUSTER_ENGINES:
+        raise ValueError(f"Unknown clustering engine '{engine}', expected one of {CLUSTER_ENGINES}")
+    logging.info(f"Initializing BERTopic with model: {model_name}, min_topic_size: {min_topic_size}, engine: {engine}")
+
+    extra_args = {}
+    if engine == 'fast':
+        extra_args['umap_model'], extra_args['hdbscan_model'] = fast_engine_models(len(texts), min_topic_size, seed=seed)
+    elif seed is not None:
+        extra_args['umap_model'] = bertopic_reduction_model(seed)
+    
+    topic_model = BERTopic(
+        embedding_model=bertopic_embedding_model(model_name, backend), 
+        language="japanese", 
+        min_topic_size=min_topic_size,
+        verbose=True,
+        **extra_args
+    )
+
+    logging.info("Running BERTopic fit_transform...")
+    # Pass *filtered* texts and their precomputed embeddings to fit_transform
+    topics, probs = topic_model.fit_transform(texts, embeddings=embeddings) 
+    
+    num_found_topics = len(set(topics)) - (1 if -1 in topics else 0)
+    num_outliers = list(topics).count(-1)
+    logging.info(f"BERTopic found {num_found_topics} topics and {num_outliers} outliers on filtered data.")
+    return topic_model, list(topics)
+
+class _TopicWords:
+    """Stands in for a fitted BERTopic model in describe_topics when topics come from several models."""
+
+    def __init__(self, words):
+        self.words = words
+
+    def get_topic(self, topic_num):
+        return self.words.get(topic_num, [])
+
+def time_windows(times_ms, window_minutes, overlap, min_posts):
+    """
+    Cuts ascending post times (int64 milliseconds) into sliding windows of window_minutes that
+    overlap by the given fraction. Windows with fewer than min_posts posts are widened to min_posts,
+    so quiet stretches of the thread are still clustered.
+
+    Returns:
+        list: (start, end) index ranges into times_ms, in time order.
+    """
+    window = int(window_minutes * 60000)
+    step = max(1, int(window * (1 - overlap)))
+    ranges = []
+    start_time = int(times_ms[0])
+    while True:
+        start = int(np.searchsorted(times_ms, start_time, 'left'))
+        end = int(np.searchsorted(times_ms, start_time + window, 'left'))
+        if end - start < min_posts:
+            end = min(len(times_ms), start + min_posts)
+            start = max(0, end - min_posts)
+        if not ranges or end > ranges[-1][1]:
+            ranges.append((start, end))
+        if end >= len(times_ms):
+            return ranges
+        # Advance by the time step, and by at least the non-overlapping share of this window's posts
+        next_start = start + max(1, int((end - start) * (1 - overlap)))
+        start_time = max(start_time + step, int(times_ms[min(next_start, len(times_ms) - 1)]))
+
+def _root(parent, node):
+    while parent[node] != node:
+        parent[node] = parent[parent[node]]
+        node = parent[node]
+    return node
+
+def fit_windowed_topics(texts, embeddings, times, model_name, min_topic_size, window_minutes=None, overlap=None,
+                        min_posts=None, merge_overlap=None, backend=config.EMBEDDING_BACKEND, engine=None, seed=None):
+    """
+    Clusters sliding time windows of the thread independently and merges the results.
+
+    Each window gets its own topic model (fit_topic_model), so every HDBSCAN run stays small and
+    topics are local in time. Two topics of neighbouring windows are merged (union-find) when their
+    posts in the shared stretch of time overlap by at least merge_overlap (Jaccard). A post in several windows takes its topic from the window whose middle it is closest to.
+    Settings default to the TIME_WINDOW_* values in config.
+
+    Args:
+        times (np.ndarray): datetime64 post times aligned with texts (NaT is filled from neighbouring posts).
+
+    Returns:
+        tuple: (topic_words, topics) - an object with BERTopic's get_topic() for the merged topics, and
+               one topic number per text (-1 for outliers), numbered in order of first appearance.
+    """
+    overlap = config.TIME_WINDOW_OVERLAP if overlap is None else overlap
+    min_posts = min_posts or config.TIME_WINDOW_MIN_POSTS
+    merge_overlap = config.TIME_WINDOW_MERGE_OVERLAP if merge_overlap is None else merge_overlap
+
+    times_ms = np.asarray(times, dtype='datetime64[ms]').astype(np.int64)
+    missing = np.isnat(np.asarray(times, dtype='datetime64[ms]'))
+    if missing.all():
+        logging.warning("No parsed timestamps; clustering the whole thread in one window.")
+        return fit_topic_model(texts, embeddings, model_name, min_topic_size, backend=backend, seed=seed, engine=engine)
+    if missing.any():
+        # Posts are in thread order, so a missing time is taken from the previous (or next) known post
+        known_positions = np.flatnonzero(~missing)
+        nearest = known_positions[np.clip(np.searchsorted(known_positions, np.arange(len(times_ms)), 'right') - 1, 0, None)]
+        times_ms = np.where(missing, times_ms[nearest], times_ms)
+
+    order = np.argsort(times_ms, kind='stable')
+    ranges = time_windows(times_ms[order], window_minutes, overlap, min_posts)
+    logging.info(f"Time-windowed clustering: {len(texts)} posts in {len(ranges)} windows of {window_minutes} min "
+                 f"({overlap:.0%} overlap).")
+
+    parent = []      # Union-find over (window, local topic) nodes
+    node_words = []  # Topic words of each node
+    node_sizes = []
+    window_labels = [] # Per window: node per post of the window (-1 for outliers)
+    for start, end in ranges:
+        members = order[start:end]
+        topic_model, local_topics = fit_topic_model([texts[i] for i in members], embeddings[members], model_name,
+                                                    min_topic_size, backend=backend, seed=seed, engine=engine)
+        local_topics = np.asarray(local_topics)
+        base = len(parent)
+        local_ids = sorted(set(local_topics.tolist()) - {-1})
+        node_of = {topic_num: base + offset for offset, topic_num in enumerate(local_ids)}
+        for topic_num in local_ids:
+            parent.append(len(parent))
+            node_words.append(topic_model.get_topic(topic_num) or [])
+            node_sizes.append(int(np.sum(local_topics == topic_num)))
+        window_labels.append(np.array([node_of.get(topic_num, -1) for topic_num in local_topics.tolist()], dtype=np.int64))
 
+    # Merge topics of neighbouring windows that share most of their posts in the overlap
+    for w in range(1, len(ranges)):
+        shared_start, shared_end = ranges[w][0], ranges[w - 1][1]
+        if shared_end <= shared_start:
+            continue
+        previous = window_labels[w - 1][shared_start - ranges[w - 1][0]:shared_end - ranges[w - 1][0]]
+        current = window_labels[w][:shared_end - shared_start]
+        both = (previous != -1) & (current != -1)
+        if not both.any():
+            continue
+        pairs, pair_counts = np.unique(np.stack([previous[both], current[both]], axis=1), axis=0, return_counts=True)
+        previous_counts = dict(zip(*np.unique(previous[previous != -1], return_counts=True)))
+        current_counts = dict(zip(*np.unique(current[current != -1], return_counts=True)))
+        for (node_a, node_b), count in zip(pairs.tolist(), pair_counts.tolist()):
+            # Jaccard of the two topics' posts in the overlap, so a small topic is not swallowed by a large one
+            if count / (previous_counts[node_a] + current_counts[node_b] - count) >= merge_overlap:
+                root_a, root_b = _root(parent, node_a), _root(parent, node_b)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    # Each post takes its label from the window whose middle is closest (in time order)
+    best_distance = np.full(len(texts), np.inf)
+    node_of_post = np.full(len(texts), -1, dtype=np.int64)
+    for (start, end), labels in zip(ranges, window_labels):
+        positions = np.arange(start, end)
+        distance = np.abs(positions - (start + end - 1) / 2)
+        members = order[start:end]
+        better = (labels != -1) & (distance < best_distance[members])
+        best_distance[members[better]] = distance[better]
+        node_of_post[members[better]] = labels[better]
+
+    # Number the merged topics in order of first appearance; words come from their largest window topic
+    topics = np.full(len(texts), -1, dtype=np.int64)
+    topic_of_root = {}
+    words = {}
+    for i in order.tolist():
+        if node_of_post[i] == -1:
+            continue
+        root = _root(parent, int(node_of_post[i]))
+        topics[i] = topic_of_root.setdefault(root, len(topic_of_root))
+    for node in range(len(parent)):
+        topic_num = topic_of_root.get(_root(parent, node))
+        if topic_num is not None and node_sizes[node] > words.get(topic_num, (0, []))[0]:
+            words[topic_num] = (node_sizes[node], node_words[node])
+    logging.info(f"Time-windowed clustering: {len(parent)} window topics merged into {len(topic_of_root)} topics, "
+                 f"{int(np.sum(topics == -1))} outliers.")
+    return _TopicWords({topic_num: topic_words for topic_num, (_, topic_words) in words.items()}), topics.tolist()
+
+def describe_topics(topic_model, topics, embeddings, top_n_words=5):
+    """
+    Finds, for every topic, the document closest to the topic's embedding centroid (cosine) and
+    BERTopic's top c-TF-IDF words, using the embeddings that were already computed for clustering.
+
+    Returns:
+        dict: topic number -> {'central_index': index into topics/embeddings, 'keywords': [words]}
+              (outlier topic -1 excluded).
+    """
+    topics = np.asarray(topics)
+    inliers = np.flatnonzero(topics != -1)
+    if not len(inliers):
+        return {}
+    unit = embeddings[inliers] / np.clip(np.linalg.norm(embeddings[inliers], axis=1, keepdims=True), 1e-12, None)
+    topic_ids, row_topic = np.unique(topics[inliers], return_inverse=True)
+
+    # All centroids in one scatter-add, then each row's cosine to its own centroid
+    centroids = np.zeros((len(topic_ids), unit.shape[1]), dtype=np.float64)
+    np.add.at(centroids, row_topic, unit)
+    centroids /= np.clip(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12, None)
+    similarity = np.einsum('ij,ij->i', unit, centroids[row_topic])
+
+    # Highest similarity per topic: sort by (topic, -similarity) and take each topic's first row
+    order = np.lexsort((-similarity, row_topic))
+    first_rows = order[np.searchsorted(row_topic[order], np.arange(len(topic_ids)))]
+
+    descriptions = {}
+    for topic_position, row in enumerate(first_rows):
+        topic_num = int(topic_ids[topic_position])
+        words = topic_model.get_topic(topic_num) or []
+        descriptions[topic_num] = {
+            'central_index': int(inliers[row]),
+            'keywords': [word for word, _ in words[:top_n_words] if word],
+        }
+    return descriptions
+
+def group_posts_by_topic(posts_data, original_indices, topics):
+    """Groups posts by topic number (outliers dropped), each cluster sorted by post number, topics in ascending order."""
     # --- 3. Group Original Posts by Topic --- 
     clusters = {}
     # Iterate through the *results* from BERTopic (which correspond to filtered texts)
@@ -106,6 +486,128 @@ def cluster_posts_by_topic(posts_data,
     logging.info(f"Returning {len(final_clusters)} valid topic clusters.")
     return final_clusters
 
+def cluster_posts_by_topic(posts_data, 
+                           model_name=config.EMBEDDING_MODEL, 
+                           min_topic_size=6,
+                           min_post_length=8,
+                           use_embedding_cache=True,
+                           embedding_backend=config.EMBEDDING_BACKEND,
+                           dedupe=config.DEDUP_ENABLED,
+                           with_details=False,
+                           engine=None,
+                           time_window_minutes=None,
+                           seed=None,
+                           fit_state=None):
+    """
+    Clusters posts into topics using BERTopic.
+
+    Args:
+        posts_data (list): List of post dictionaries from fetch_conversations.
+        model_name (str): Name of the sentence-transformer model for BERTopic to use.
+        min_topic_size (int): The minimum size of a topic (passed to HDBSCAN internally).
+        min_post_length (int): Minimum character length for a post to be included in clustering.
+        use_embedding_cache (bool): Reuse embeddings stored on disk from previous runs and only
+                                    embed posts that are new.
+        embedding_backend (str): 'torch' (sentence-transformers) or 'onnx' (int8 ONNX Runtime, CPU).
+        dedupe (bool): Embed and cluster one representative per group of exact/near-duplicate posts
+                       (copypasta, AA); every duplicate joins its representative's topic.
+        with_details (bool): Also return a description of each cluster for titling (see below).
+        engine (str): 'bertopic' (UMAP + HDBSCAN) or 'fast' (PCA/TruncatedSVD + HDBSCAN/MiniBatchKMeans,
+                      fixed seeds; see fast_engine_models). Defaults to config.CLUSTER_ENGINE.
+        time_window_minutes (float): Cluster sliding windows of this many minutes separately and merge
+                                     topics across their overlaps (see fit_windowed_topics). Defaults to
+                                     config.TIME_WINDOW_MINUTES; None clusters the whole thread at once.
+        seed (int): Random state of the reduction and clusterer, so an unchanged thread gives the same
+                    clusters on every run (and its drafts are recognized by the publish journal).
+                    Defaults to config.CLUSTER_SEED.
+        fit_state (dict): If given, receives 'topic_model' (the fitted BERTopic model, or the merged
+                          topic words of a time-windowed fit, which has no transform()) and
+                          'post_topics' ({index into posts_data: topic} for every clustered post,
+                          -1 for outliers), for callers that keep assigning posts later.
+
+    Returns:
+        list: A list of clusters. Each cluster is a list of post dictionaries.
+              Returns an empty list if no posts or no topics found (excluding outliers).
+              With with_details=True, returns (clusters, details) where details[i] describes clusters[i]:
+              {'topic', 'central_post_number', 'central_thread', 'central_text', 'keywords'}, the post
+              nearest the topic's embedding centroid and its top c-TF-IDF words.
+    """
+    no_clusters = ([], []) if with_details else []
+    if not posts_data:
+        logging.warning("No posts provided for BERTopic clustering.")
+        return no_clusters
+
+    # --- 1. Prepare and Filter Text Data --- 
+    original_indices, texts = filter_posts_for_clustering(posts_data, min_post_length)
+
+    if not texts:
+        logging.warning("No posts remaining after filtering. Cannot perform clustering.")
+        return no_clusters
+
+    # --- 1b. Collapse Duplicates --- 
+    if dedupe:
+        unique_positions, group_of = dedupe_texts(texts)
+        model_texts = [texts[position] for position in unique_positions]
+    else:
+        model_texts = texts
+
+    # --- 2. Initialize and Run BERTopic --- 
+    try:
+        # Embed outside BERTopic so cached vectors can be reused between runs
+        embeddings = embed_texts(model_texts, model_name=model_name, use_cache=use_embedding_cache, backend=embedding_backend)
+        time_window_minutes = time_window_minutes or config.TIME_WINDOW_MINUTES
+        seed = config.CLUSTER_SEED if seed is None else seed
+        if time_window_minutes:
+            times = post_columns([posts_data[i] for i in original_indices])['posted_at']
+            if dedupe:
+                times = times[unique_positions] # Representatives are the earliest post of their group
+            topic_model, topics = fit_windowed_topics(model_texts, embeddings, times, model_name, min_topic_size,
+                                                      window_minutes=time_window_minutes, backend=embedding_backend,
+                                                      engine=engine, seed=seed)
+        else:
+            topic_model, topics = fit_topic_model(model_texts, embeddings, model_name, min_topic_size,
+                                                   backend=embedding_backend, seed=seed, engine=engine)
+    except Exception as e:
+        logging.error(f"Error during BERTopic processing: {e}", exc_info=True)
+        return no_clusters
+
+    if with_details:
+        # Describe topics from the representatives' embeddings (no re-encoding)
+        started = time.perf_counter()
+        descriptions = describe_topics(topic_model, topics, embeddings)
+        logging.info(f"Described {len(descriptions)} topics in {time.perf_counter() - started:.3f}s")
+
+    if dedupe:
+        # Map each representative's topic back to all posts of its group
+        topics = np.asarray(topics)[group_of].tolist()
+    if fit_state is not None:
+        fit_state['topic_model'] = topic_model
+        fit_state['post_topics'] = {original_indices[i]: int(topic_num) for i, topic_num in enumerate(topics)}
+
+    if all(topic_num == -1 for topic_num in topics):
+        logging.warning("BERTopic found no topics (excluding outliers). Returning empty list.")
+        return no_clusters
+
+    clusters = group_posts_by_topic(posts_data, original_indices, topics)
+    if not with_details:
+        return clusters
+
+    details = []
+    for topic_num in sorted(set(topics) - {-1}): # Same order as group_posts_by_topic
+        description = descriptions[topic_num]
+        text_index = description['central_index']
+        if dedupe:
+            text_index = int(unique_positions[text_index])
+        central_post = posts_data[original_indices[text_index]]
+        details.append({
+            'topic': int(topic_num),
+            'central_post_number': central_post.get('number'),
+            'central_thread': central_post.get('thread'),
+            'central_text': central_post.get('content_text', ''),
+            'keywords': description['keywords'],
+        })
+    return clusters, details
+
 # Example placeholder 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -0,0 +1,278 @@
+# topic_index.py
+# Persistent index of the embedding centroids of published clusters. New clusters are checked
+# against it so a topic that an earlier thread already covered is not published again, and
+# near-identical clusters of one run are merged before they are rendered.
+import json
+import logging
+import os
+import re
+import numpy as np
+import config
+from embedding_cache import EmbeddingStore
+
+def _store_name(model_name, backend):
+    # Same naming as topic_cluster.embed_texts, so centroids reuse the clustering run's embeddings
+    return model_name if backend == 'torch' else f"{model_name}@{backend}"
+
+def thread_identity(post):
+    """
+    Which thread a post belongs to, for telling a growing thread apart from a new one: the page
+    title when it was recorded (file names are reused, e.g. data/thread.html), else the thread tag.
+    """
+    return str(post.get('thread_title') or post.get('thread') or '')
+
+def unit_rows(matrix):
+    """Returns matrix with every row scaled to unit length (zero rows stay zero)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+def cluster_centroids(topic_clusters, model_name=None, backend=None, min_post_length=8):
+    """
+    Returns an (n_clusters, dim) float32 matrix of unit-length centroids, the mean of each cluster's
+    unit post embeddings. Posts shorter than min_post_length are left out unless a cluster has
+    nothing else. Embeddings come from the on-disk store, so clustered posts are not re-encoded
+    and the embedding model is only loaded for posts that are missing from it.
+    Model and backend default to config.EMBEDDING_MODEL / config.EMBEDDING_BACKEND.
+    """
+    model_name = model_name or config.EMBEDDING_MODEL
+    backend = backend or config.EMBEDDING_BACKEND
+
+    def encode(batch_texts):
+        from topic_cluster import encode_bucketed # torch / sentence-transformers
+        return encode_bucketed(batch_texts, model_name=model_name, backend=backend)
+
+    texts = []
+    owners = []
+    for cluster_index, cluster in enumerate(topic_clusters):
+        cluster_texts = [post.get('content_text', '') for post in cluster]
+        long_texts = [text for text in cluster_texts if len(text) >= min_post_length]
+        for text in long_texts or [text for text in cluster_texts if text]:
+            texts.append(text)
+            owners.append(cluster_index)
+    if not texts:
+        return np.zeros((len(topic_clusters), 0), dtype=np.float32)
+
+    embeddings = unit_rows(EmbeddingStore(_store_name(model_name, backend)).get_or_compute(texts, encode))
+    centroids = np.zeros((len(topic_clusters), embeddings.shape[1]), dtype=np.float32)
+    np.add.at(centroids, np.asarray(owners), embeddings)
+    return unit_rows(centroids)
+
+class TopicIndex:
+    """
+    Centroids of published clusters for one embedding model.
+
+    centroids.npy holds the unit-length float32 rows (memory-mapped on load) and entries.json the
+    matching metadata (fingerprint, title, thread, threads, entry_id) in the same row order; 'threads'
+    lists the thread_identity of the published posts. Lookups are an
+    exact matrix product; past config.TOPIC_INDEX_APPROX_THRESHOLD rows, candidates are first
+    narrowed with random-projection LSH tables and only those are scored.
+    """
+
+    def __init__(self, model_name=None, backend=None, index_dir=None):
+        store_name = _store_name(model_name or config.EMBEDDING_MODEL, backend or config.EMBEDDING_BACKEND)
+        self.directory = os.path.join(index_dir or config.TOPIC_INDEX_DIR, re.sub(r'[^A-Za-z0-9_.-]', '_', store_name))
+        self.centroids_path = os.path.join(self.directory, 'centroids.npy')
+        self.entries_path = os.path.join(self.directory, 'entries.json')
+        self.centroids = None
+        self.entries = []
+        self._buckets = None # Built on first approximate lookup
+        self._planes = None
+        if os.path.exists(self.entries_path) and os.path.exists(self.centroids_path):
+            with open(self.entries_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+            self.centroids = np.load(self.centroids_path, mmap_mode='r')
+            # Centroids are saved before entries, so extra rows can only come from an interrupted add
+            self.entries = self.entries[:len(self.centroids)]
+            self.centroids = self.centroids[:len(self.entries)]
+        self.fingerprints = {entry['fingerprint'] for entry in self.entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _lsh_codes(self, vectors):
+        """One integer bucket code per LSH table for each vector (signs of random projections)."""
+        tables, bits = config.TOPIC_INDEX_LSH_TABLES, config.TOPIC_INDEX_LSH_BITS
+        if self._planes is None or self._planes.shape[1] != vectors.shape[1]:
+            rng = np.random.RandomState(config.CLUSTER_SEED)
+            self._planes = rng.standard_normal((tables * bits, vectors.shape[1])).astype(np.float32)
+        signs = (vectors @ self._planes.T > 0).reshape(len(vectors), tables, bits)
+        return signs.astype(np.int64) @ (1 << np.arange(bits, dtype=np.int64))
+
+    def _candidates(self, vector):
+        if self._buckets is None:
+            codes = self._lsh_codes(np.asarray(self.centroids))
+            self._buckets = []
+            for table in range(codes.shape[1]):
+                buckets = {}
+                for row, code in enumerate(codes[:, table].tolist()):
+                    buckets.setdefault(code, []).append(row)
+                self._buckets.append(buckets)
+        codes = self._lsh_codes(vector[None, :])[0]
+        rows = set()
+        for table, code in enumerate(codes.tolist()):
+            rows.update(self._buckets[table].get(code, ()))
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def search(self, vectors, k=None):
+        """
+        Finds the k most similar indexed centroids for each row of vectors (unit length).
+
+        Returns:
+            tuple: (rows, scores), both (len(vectors), k); rows are indices into self.entries,
+                   padded with -1 (score -inf) when fewer than k centroids qualify.
+        """
+        k = k or config.TOPIC_INDEX_TOP_K
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rows = np.full((len(vectors), k), -1, dtype=np.int64)
+        scores = np.full((len(vectors), k), -np.inf, dtype=np.float32)
+        if not len(self) or not len(vectors) or vectors.shape[1] != self.centroids.shape[1]:
+            return rows, scores
+
+        if len(self) < config.TOPIC_INDEX_APPROX_THRESHOLD:
+            similarity = vectors @ np.asarray(self.centroids).T
+            top = min(k, len(self))
+            best = np.argpartition(-similarity, top - 1, axis=1)[:, :top]
+            best_scores = np.take_along_axis(similarity, best, axis=1)
+            order = np.argsort(-best_scores, axis=1)
+            rows[:, :top] = np.take_along_axis(best, order, axis=1)
+            scores[:, :top] = np.take_along_axis(best_scores, order, axis=1)
+            return rows, scores
+
+        for i, vector in enumerate(vectors):
+            candidates = self._candidates(vector)
+            if not len(candidates):
+                continue
+            similarity = np.asarray(self.centroids[candidates]) @ vector
+            order = np.argsort(-similarity)[:k]
+            rows[i, :len(order)] = candidates[order]
+            scores[i, :len(order)] = similarity[order]
+        return rows, scores
+
+    def add(self, vectors, entries):
+        """Appends centroids (unit length) with their metadata dicts (must include 'fingerprint') and saves."""
+        keep = [i for i, entry in enumerate(entries) if entry['fingerprint'] not in self.fingerprints]
+        if not keep:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)[keep]
+        entries = [entries[i] for i in keep]
+        if len(self) and vectors.shape[1] != self.centroids.shape[1]:
+            raise ValueError(f"Centroid dimension {vectors.shape[1]} does not match index dimension {self.centroids.shape[1]}")
+        combined = np.concatenate([np.asarray(self.centroids), vectors]) if len(self) else vectors
+        os.makedirs(self.directory, exist_ok=True)
+        self.centroids = None # Release the old mapping before replacing the file
+        tmp_path = self.centroids_path + '.tmp.npy'
+        np.save(tmp_path, combined)
+        os.replace(tmp_path, self.centroids_path)
+        self.entries.extend(entries)
+        tmp_path = self.entries_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.entries_path)
+        self.fingerprints.update(entry['fingerprint'] for entry in entries)
+        self.centroids = np.load(self.centroids_path, mmap_mode='r')
+        self._buckets = None
+        logging.info(f"Topic index: added {len(entries)} centroids ({len(self)} total) in {self.directory}")
+
+def cluster_threads(cluster):
+    """Sorted thread identities (see thread_identity) of a cluster's posts."""
+    return sorted({thread_identity(post) for post in cluster})
+
+def _entry_threads(entry):
+    # Entries indexed before 'threads' was recorded only have the joined thread tags
+    return entry.get('threads') or entry.get('thread', '').split(',')
+
+def _ordered_posts(posts):
+    if config.REPLY_GRAPH_EXPAND:
+        from reply_graph import order_conversation
+        return order_conversation(posts)
+    return sorted(posts, key=lambda post: (str(post.get('thread') or ''), post.get('number') or 0))
+
+def merge_similar_clusters(topic_clusters, cluster_details, centroids, threshold=None):
+    """
+    Merges clusters of one run whose centroids have cosine similarity >= threshold. The most similar
+    pair is merged first and the merged centroid (size-weighted) is compared again, so chains of
+    loosely related clusters do not collapse into one. A merged cluster holds the posts of all its
+    members once each, in the order the members were in (conversation order when the reply graph
+    completes clusters, else by post number), and the largest member's details.
+
+    Returns:
+        tuple: (clusters, details, centroids) after merging.
+    """
+    threshold = config.TOPIC_MERGE_THRESHOLD if threshold is None else threshold
+    groups = [[i] for i in range(len(topic_clusters))]
+    sums = centroids * np.array([len(cluster) for cluster in topic_clusters], dtype=np.float32)[:, None]
+    while len(groups) > 1:
+        unit = unit_rows(sums)
+        similarity = unit @ unit.T
+        np.fill_diagonal(similarity, -np.inf)
+        first, second = np.unravel_index(np.argmax(similarity), similarity.shape)
+        if similarity[first, second] < threshold:
+            break
+        first, second = min(first, second), max(first, second)
+        groups[first] += groups.pop(second)
+        sums[first] += sums[second]
+        sums = np.delete(sums, second, axis=0)
+    if len(groups) == len(topic_clusters):
+        return topic_clusters, cluster_details, centroids
+
+    merged_clusters, merged_details = [], []
+    for members in groups:
+        members.sort(key=lambda i: -len(topic_clusters[i]))
+        posts = []
+        seen = set()
+        for i in members:
+            for post in topic_clusters[i]:
+                key = (post.get('thread'), post.get('number'))
+                if key not in seen:
+                    seen.add(key)
+                    posts.append(post)
+        if len(members) > 1:
+            posts = _ordered_posts(posts)
+        merged_clusters.append(posts)
+        merged_details.append(cluster_details[members[0]])
+        if len(members) > 1:
+            logging.info(f"Merged {len(members)} similar clusters into one of {len(posts)} posts.")
+    logging.info(f"Topic merge: {len(topic_clusters)} clusters -> {len(merged_clusters)} (threshold {threshold}).")
+    return merged_clusters, merged_details, unit_rows(sums)
+
+def dedupe_topics(topic_clusters, cluster_details=None, index=None, model_name=None, backend=None):
+    """
+    Merges near-identical clusters of this run, then drops clusters whose centroid is at least
+    config.TOPIC_DUPLICATE_THRESHOLD similar to a cluster published from another thread.
+    Matches from the cluster's own thread (same thread_identity) are ignored: a growing thread
+    keeps publishing its topics. model_name/backend must be the ones the posts were clustered with
+    (default: config.EMBEDDING_MODEL / config.EMBEDDING_BACKEND).
+
+    Returns:
+        tuple: (clusters, details, centroids) for the clusters to publish; details may contain None.
+    """
+    cluster_details = list(cluster_details) if cluster_details else [None] * len(topic_clusters)
+    centroids = cluster_centroids(topic_clusters, model_name=model_name, backend=backend)
+    if not centroids.shape[1]:
+        return topic_clusters, cluster_details, centroids
+    topic_clusters, cluster_details, centroids = merge_similar_clusters(topic_clusters, cluster_details, centroids)
+
+    index = index or TopicIndex(model_name, backend)
+    if not len(index):
+        return topic_clusters, cluster_details, centroids
+    rows, scores = index.search(centroids)
+    keep = []
+    for i, cluster in enumerate(topic_clusters):
+        threads = set(cluster_threads(cluster))
+        duplicate = None
+        for row, score in zip(rows[i].tolist(), scores[i].tolist()):
+            if row < 0 or score < config.TOPIC_DUPLICATE_THRESHOLD:
+                break # Sorted by score
+            entry = index.entries[row]
+            if threads.isdisjoint(_entry_threads(entry)):
+                duplicate = (entry, score)
+                break
+        if duplicate:
+            entry, score = duplicate
+            logging.info(f"Skipping cluster of {len(cluster)} posts: similarity {score:.3f} to published "
+                         f"'{entry.get('title')}' from thread {entry.get('thread')}.")
+        else:
+            keep.append(i)
+    logging.info(f"Topic index: {len(topic_clusters) - len(keep)} of {len(topic_clusters)} clusters already "
+                 f"published from other threads.")
+    return ([topic_clusters[i] for i in keep], [cluster_details[i] for i in keep], centroids[keep])
@@ -0,0 +1,185 @@
+# watch.py
+# Watch mode: follows threads while they grow. A directory of saved snapshots is polled; for each new
+# or changed snapshot only the posts after the last one processed for that thread are parsed (from
+# the end of the file), assigned to the thread's topics incrementally, and published.
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+import config
+import instrumentation
+import main as pipeline
+from batch_ingest import thread_name
+from fetch_conversations import fetch_conversations, fetch_new_posts, thread_title
+
+SNAPSHOT_PATTERNS = ('*.htm', '*.html')
+
+def snapshot_key(path):
+    """Identity of the thread a snapshot belongs to: its page title (stable across re-saves), else the file name."""
+    return thread_title(path) or thread_name(path)
+
+def load_state(path=config.WATCH_STATE_FILE):
+    """Returns {'threads': {key: {'last_number', 'snapshot'}}, 'snapshots': {path: [mtime_ns, size]}}."""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable watch state {path}: {e}")
+    return {'threads': {}, 'snapshots': {}}
+
+def save_state(state, path=config.WATCH_STATE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _changed_snapshots(snapshot_dir, state, settle_seconds):
+    """Returns snapshots that are new or changed since they were last processed, oldest first."""
+    changed = []
+    now = time.time()
+    for pattern in SNAPSHOT_PATTERNS:
+        for path in glob.glob(os.path.join(snapshot_dir, pattern)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime < settle_seconds:
+                continue # Still being written; picked up on a later scan
+            if state['snapshots'].get(path) != [stat.st_mtime_ns, stat.st_size]:
+                changed.append((stat.st_mtime_ns, path, stat.st_size))
+    return [(path, mtime_ns, size) for mtime_ns, path, size in sorted(changed)]
+
+def _new_post_clusters(thread_posts, thread_key, last_number):
+    """
+    Assigns the thread's new posts to its topics and returns, for every topic with posts numbered
+    above last_number, just those posts (completed with the posts they reply to). Posts assigned by
+    an earlier run whose publish failed are included again.
+    """
+    from incremental_cluster import cluster_new_posts # Heavy imports (torch, BERTopic)
+    from reply_graph import complete_clusters
+    clusters = cluster_new_posts(thread_posts, thread_key, since_number=last_number)
+    # After a refit every topic counts as new; either way only posts after last_number are published
+    clusters = [[post for post in cluster if post['number'] > last_number] for cluster in clusters]
+    clusters = [cluster for cluster in clusters if cluster]
+    if clusters and config.REPLY_GRAPH_EXPAND:
+        clusters = complete_clusters(thread_posts, clusters)
+    return clusters
+
+def _published(results):
+    """True if publish_drafts sent or skipped every draft (it returns nothing when credentials are missing)."""
+    return bool(results) and all(result['status'] in ('published', 'skipped') for result in results)
+
+def process_snapshot(path, state, known_posts, publish=True):
+    """
+    Processes one snapshot: parses the posts numbered above the last post parsed for the thread,
+    clusters and publishes the posts after the thread's last published post, and advances the
+    thread's state once they are published. If publishing fails, those posts stay pending and are
+    published again with the thread's next snapshot.
+
+    Args:
+        path (str): Snapshot file.
+        state (dict): Watch state (see load_state), updated in place.
+        known_posts (dict): Thread key -> every post parsed so far in this process. The incremental
+                            clusterer needs the whole thread when it refits, so the first snapshot of
+                            a thread seen by this process is parsed fully (from the post cache if unchanged).
+        publish (bool): Publish the resulting clusters (False only logs them).
+
+    Returns:
+        dict: Summary (thread, new_posts, pending_posts, clusters, seconds).
+    """
+    started = time.perf_counter()
+    thread_key = snapshot_key(path)
+    thread_state = state['threads'].setdefault(thread_key, {'last_number': 0, 'snapshot': None})
+    last_number = thread_state['last_number']
+
+    report = instrumentation.start_run('watch')
+    clusters = []
+    pending_posts = []
+    try:
+        with instrumentation.stage('fetch_conversations', item_unit='posts') as counters:
+            if thread_key in known_posts:
+                parsed_number = max((post['number'] for post in known_posts[thread_key]), default=0)
+                new_posts = fetch_new_posts(path, parsed_number)
+            else:
+                posts_data = [post for post in fetch_conversations(path) if post.get('number') is not None]
+                for post in posts_data:
+                    post['thread'] = thread_key
+                known_posts[thread_key] = [post for post in posts_data if post['number'] <= last_number]
+                new_posts = [post for post in posts_data if post['number'] > last_number]
+            counters['items'] = len(new_posts)
+
+        for post in new_posts:
+            post['thread'] = thread_key # Snapshot file names change between saves; the title does not
+        known_posts[thread_key].extend(new_posts)
+        pending_posts = [post for post in known_posts[thread_key] if post['number'] > last_number]
+        logging.info(f"Snapshot {path}: {len(new_posts)} new posts in thread {thread_key}, "
+                     f"{len(pending_posts)} to publish after #{last_number}.")
+
+        if pending_posts:
+            with instrumentation.stage('cluster_posts_by_topic', item_unit='posts') as counters:
+                clusters = _new_post_clusters(known_posts[thread_key], thread_key, last_number)
+                counters['items'] = len(pending_posts)
+            published = True
+            if clusters and publish:
+                published = _published(pipeline.publish_drafts(pipeline.render_clusters(clusters)))
+            elif clusters:
+                logging.info(f"Not publishing {len(clusters)} clusters (publishing disabled).")
+            if published:
+                thread_state['last_number'] = max(post['number'] for post in pending_posts)
+            else:
+                logging.warning(f"Publishing failed for thread {thread_key}; posts after #{last_number} "
+                                f"stay pending until its next snapshot.")
+        thread_state['snapshot'] = path
+    finally:
+        report.write()
+
+    summary = {'thread': thread_key, 'new_posts': len(new_posts), 'pending_posts': len(pending_posts),
+               'clusters': len(clusters), 'seconds': round(time.perf_counter() - started, 2)}
+    logging.info(f"Watch: processed {path}: {summary}")
+    return summary
+
+def watch(snapshot_dir=config.WATCH_SNAPSHOT_DIR, state_path=config.WATCH_STATE_FILE,
+          poll_seconds=config.WATCH_POLL_SECONDS, publish=True, once=False):
+    """
+    Polls snapshot_dir for new or changed thread snapshots and processes each one (see
+    process_snapshot) until interrupted. With once=True, processes what is pending and returns.
+    """
+    from worker import warm_up
+    warm_up()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    state = load_state(state_path)
+    known_posts = {}
+    logging.info(f"Watching {snapshot_dir} for thread snapshots")
+    print(f"Watching {snapshot_dir} (state: {state_path})")
+    try:
+        while True:
+            for path, mtime_ns, size in _changed_snapshots(snapshot_dir, state, 0 if once else config.WATCH_SETTLE_SECONDS):
+                try:
+                    summary = process_snapshot(path, state, known_posts, publish=publish)
+                    print(f"  {os.path.basename(path)}: {summary['new_posts']} new posts, "
+                          f"{summary['clusters']} clusters, {summary['seconds']:.2f}s")
+                except Exception as e:
+                    logging.error(f"Watch: failed to process {path}: {e}", exc_info=True)
+                # Failed snapshots are not retried until they change again
+                state['snapshots'][path] = [mtime_ns, size]
+                save_state(state, state_path)
+            if once:
+                return state
+            time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        logging.info("Watch mode interrupted, shutting down.")
+    return state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow growing threads: process only the new posts of each saved snapshot.")
+    parser.add_argument('--dir', default=config.WATCH_SNAPSHOT_DIR, help="Directory the thread snapshots are saved into")
+    parser.add_argument('--state', default=config.WATCH_STATE_FILE, help="Last processed post per thread")
+    parser.add_argument('--poll', type=float, default=config.WATCH_POLL_SECONDS, help="Seconds between directory scans")
+    parser.add_argument('--no-publish', action='store_true', help="Cluster new posts but do not publish them")
+    parser.add_argument('--once', action='store_true', help="Process pending snapshots and exit")
+    args = parser.parse_args()
+    watch(args.dir, args.state, args.poll, publish=not args.no_publish, once=args.once)
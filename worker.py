@@ -0,0 +1,151 @@
+# worker.py
+import argparse
+import glob
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import socketserver
+import threading
+import time
+import config
+import main as pipeline
+
+SPOOL_SETTLE_SECONDS = 2.0 # A spooled file must be unchanged for this long before it is picked up
+
+class Job:
+    """A request to run the pipeline on one or more thread files."""
+
+    def __init__(self, sources, merge_threads=False):
+        self.sources = sources
+        self.merge_threads = merge_threads
+        self.done = threading.Event()
+        self.result = None
+
+def run_job(job):
+    """Runs parse -> cluster -> format -> publish for a job using the already-loaded models."""
+    started = time.perf_counter()
+    try:
+        clusters = pipeline.main(job.sources, merge_threads=job.merge_threads)
+        job.result = {'status': 'ok', 'clusters': len(clusters), 'seconds': round(time.perf_counter() - started, 2)}
+    except Exception as e:
+        logging.error(f"Worker job failed for {job.sources}: {e}", exc_info=True)
+        job.result = {'status': 'error', 'error': str(e)}
+    job.done.set()
+    logging.info(f"Worker job {job.sources} finished: {job.result}")
+    return job.result
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON job per line ({"path": ...} or {"paths": [...], "merge": bool}) and replies with the result."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                sources = request.get('paths') or [request['path']]
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply({'status': 'error', 'error': f"Bad job request: {e}"})
+                continue
+            job = Job(sources, merge_threads=bool(request.get('merge', False)))
+            self.server.jobs.put(job)
+            job.done.wait()
+            self._reply(job.result)
+
+    def _reply(self, payload):
+        self.wfile.write(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+class _JobServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, jobs):
+        super().__init__(address, _JobRequestHandler)
+        self.jobs = jobs
+
+def _scan_spool(spool_dir, seen_sizes):
+    """Returns spooled thread files that have stopped changing since the previous scan."""
+    ready = []
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(spool_dir, '*.htm*'))):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if seen_sizes.get(path) == stat.st_size and now - stat.st_mtime >= SPOOL_SETTLE_SECONDS:
+            ready.append(path)
+            seen_sizes.pop(path, None)
+        else:
+            seen_sizes[path] = stat.st_size
+    return ready
+
+def _finish_spooled_file(path, spool_dir, result):
+    target_dir = os.path.join(spool_dir, 'done' if result and result.get('status') == 'ok' else 'failed')
+    os.makedirs(target_dir, exist_ok=True)
+    shutil.move(path, os.path.join(target_dir, os.path.basename(path)))
+
+def warm_up(model_name=config.EMBEDDING_MODEL, backend=config.EMBEDDING_BACKEND):
+    """Imports the ML stack and loads the embedding model so jobs only pay for the actual work."""
+    started = time.perf_counter()
+    import topic_cluster
+    topic_cluster.load_embedding_model(model_name, backend)
+    logging.info(f"Worker warm-up finished in {time.perf_counter() - started:.1f}s")
+
+def serve(spool_dir=config.WORKER_SPOOL_DIR, host=config.WORKER_HOST, port=config.WORKER_PORT,
+          poll_seconds=config.WORKER_POLL_SECONDS):
+    """
+    Runs the resident worker: loads models once, then processes jobs from the spool directory
+    and (if port is set) from a localhost socket, one job at a time, until interrupted.
+    """
+    warm_up()
+    jobs = queue.Queue()
+
+    server = None
+    if port:
+        server = _JobServer((host, port), jobs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f"Worker listening for jobs on {host}:{port}")
+
+    os.makedirs(spool_dir, exist_ok=True)
+    logging.info(f"Worker watching spool directory {spool_dir}")
+    print(f"Worker ready (spool: {spool_dir}, socket: {f'{host}:{port}' if port else 'disabled'})")
+
+    seen_sizes = {}
+    try:
+        while True:
+            for path in _scan_spool(spool_dir, seen_sizes):
+                result = run_job(Job([path]))
+                _finish_spooled_file(path, spool_dir, result)
+            try:
+                run_job(jobs.get(timeout=poll_seconds))
+            except queue.Empty:
+                pass
+    except KeyboardInterrupt:
+        logging.info("Worker interrupted, shutting down.")
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+def submit(paths, merge_threads=False, host=config.WORKER_HOST, port=config.WORKER_PORT):
+    """Sends a job to a running worker over its socket and returns the worker's result."""
+    request = {'paths': [os.path.abspath(path) for path in paths], 'merge': merge_threads}
+    with socket.create_connection((host, port)) as conn:
+        conn.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with conn.makefile('rb') as reply:
+            return json.loads(reply.readline())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident worker that keeps the embedding model loaded between threads.")
+    parser.add_argument('--spool', default=config.WORKER_SPOOL_DIR, help="Directory watched for new thread HTML files")
+    parser.add_argument('--host', default=config.WORKER_HOST)
+    parser.add_argument('--port', type=int, default=config.WORKER_PORT, help="Localhost job port (0 disables the socket)")
+    parser.add_argument('--submit', nargs='+', metavar='PATH', help="Send these thread files to a running worker instead of starting one")
+    parser.add_argument('--merge', action='store_true', help="With --submit: cluster the files together")
+    args = parser.parse_args()
+    if args.submit:
+        print(json.dumps(submit(args.submit, args.merge, args.host, args.port), ensure_ascii=False))
+    else:
+        serve(args.spool, args.host, args.port)